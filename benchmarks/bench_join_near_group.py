@@ -0,0 +1,106 @@
+"""
+Benchmark of joining near groups of stops on dense stop clusters.
+Compares Aggregator's union-find with the former 5 rounds of merges,
+and finding near pairs in dense grid cells with the former self-merge on stop_name.
+
+usage: poetry run python benchmarks/bench_join_near_group.py [num_stops] [num_dense_stops]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from gtfs_parser.aggregate import Aggregator
+
+
+def join_near_group_by_merges(near_id_pair):
+    # former implementation, tracing root stops up to 5 times
+    for i in range(5):
+        leaf_pair = near_id_pair.query("stop_id != stop_id_r")\
+            .rename(columns={"stop_id": "stop_id_r", "stop_id_r": "stop_id_r2"})
+        sub_pair = pd.merge(near_id_pair, leaf_pair, on="stop_id_r").drop(columns=["stop_id_r"])
+        if len(sub_pair) == 0:
+            break
+        mod_id_trio = pd.merge(near_id_pair, sub_pair, on="stop_id", how="left")
+        mod_id_trio.loc[~mod_id_trio['stop_id_r2'].isna(), 'stop_id_r'] = mod_id_trio['stop_id_r2']
+        near_id_pair = mod_id_trio.drop(columns=["stop_id_r2"])
+    return near_id_pair
+
+
+def dense_cluster_pairs(num_stops, cluster_size=50, seed=0):
+    # each stop points to a random smaller stop in its cluster, like chains of near stops
+    rng = np.random.default_rng(seed)
+    positions = np.arange(num_stops)
+    cluster_starts = positions - positions % cluster_size
+    offsets = positions - cluster_starts
+    parents = cluster_starts + (rng.random(num_stops) * offsets).astype(int)
+    stop_ids = np.array([f"{i:08d}" for i in positions], dtype=object)
+    return pd.DataFrame({"stop_id": stop_ids, "stop_id_r": stop_ids[parents]})
+
+
+def near_pairs_by_merge(stops, max_distance_degree):
+    # former implementation, self-merge of stops on stop_name
+    stop_matrix = pd.merge(stops, stops, on="stop_name", suffixes=("", "_r"))
+    return stop_matrix[
+        (stop_matrix["stop_lon"] - stop_matrix["stop_lon_r"]) ** 2
+        + (stop_matrix["stop_lat"] - stop_matrix["stop_lat_r"]) ** 2
+        <= max_distance_degree ** 2
+    ]
+
+
+def near_pairs_by_grid(stops, max_distance_degree):
+    # candidate pairs of same name in neighbor cells, then filtered by distance like Aggregator
+    lons = stops["stop_lon"].to_numpy()
+    lats = stops["stop_lat"].to_numpy()
+    names = pd.factorize(stops["stop_name"])[0]
+    left, right = Aggregator._Aggregator__grid_neighbor_pairs(lons, lats, names, max_distance_degree)
+    is_near = (lons[left] - lons[right]) ** 2 + (lats[left] - lats[right]) ** 2 <= max_distance_degree ** 2
+    return left[is_near], right[is_near]
+
+
+def dense_cell_stops(num_stops, side=0.05, stops_per_name=4, seed=0):
+    # many stops of various names within a few grid cells, like a dense city center
+    rng = np.random.default_rng(seed)
+    names = rng.integers(0, max(num_stops // stops_per_name, 1), num_stops)
+    return pd.DataFrame({
+        "stop_id": [f"{i:08d}" for i in range(num_stops)],
+        "stop_name": [f"stop {name}" for name in names],
+        "stop_lon": 139.0 + rng.random(num_stops) * side,
+        "stop_lat": 35.0 + rng.random(num_stops) * side,
+    })
+
+
+def main():
+    num_stops = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    num_dense_stops = int(sys.argv[2]) if len(sys.argv) > 2 else 80_000
+    near_id_pair = dense_cluster_pairs(num_stops)
+
+    started = time.perf_counter()
+    Aggregator._Aggregator__join_near_group(near_id_pair)
+    union_find = time.perf_counter() - started
+
+    started = time.perf_counter()
+    join_near_group_by_merges(near_id_pair)
+    merges = time.perf_counter() - started
+
+    print(f"stops: {num_stops}")
+    print(f"union-find: {union_find:.3f}s")
+    print(f"5 rounds of merges: {merges:.3f}s ({merges / union_find:.1f}x)")
+
+    stops = dense_cell_stops(num_dense_stops)
+    started = time.perf_counter()
+    left, _ = near_pairs_by_grid(stops, 0.003)
+    grid = time.perf_counter() - started
+
+    started = time.perf_counter()
+    assert len(near_pairs_by_merge(stops, 0.003)) == len(left)
+    merge = time.perf_counter() - started
+
+    print(f"stops in dense cells: {num_dense_stops}")
+    print(f"near pairs by grid of names and cells: {grid:.3f}s")
+    print(f"near pairs by self-merge on stop_name: {merge:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of reading routes from large shapes.
+Compares read_routes_table assembling lines from ragged arrays with
+the former grouping of point tuples by shape_id, and times writing them.
+
+usage: poetry run python benchmarks/bench_route_shapes.py [num_points]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from gtfs_parser.gtfs import GTFS
+from gtfs_parser.geojson import write_features
+from gtfs_parser.parse import read_routes_table
+
+
+def shape_lines_by_groupby(shapes):
+    # former implementation
+    shapes_df = shapes.copy()
+    shapes_df["shape_pt"] = list(zip(shapes_df["shape_pt_lon"], shapes_df["shape_pt_lat"]))
+    shapes_df = shapes_df.sort_values(["shape_id", "shape_pt_sequence"])
+    return shapes_df.groupby("shape_id")["shape_pt"].apply(lambda x: x.tolist()).rename("line")
+
+
+def synthetic_gtfs(num_points, points_per_shape=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    num_shapes = max(num_points // points_per_shape, 1)
+    shape_ids = np.array([f"shape_{i:06d}" for i in range(num_shapes)], dtype=object)
+    shapes = pd.DataFrame({
+        "shape_id": np.repeat(shape_ids, points_per_shape),
+        "shape_pt_lat": 35 + rng.random(num_shapes * points_per_shape),
+        "shape_pt_lon": 139 + rng.random(num_shapes * points_per_shape),
+        "shape_pt_sequence": np.tile(np.arange(points_per_shape), num_shapes),
+    }).sample(frac=1, random_state=seed)
+    route_ids = np.array([f"route_{i:06d}" for i in range(num_shapes)], dtype=object)
+    return GTFS(
+        agency=pd.DataFrame({"agency_id": ["a"], "agency_name": ["a"]}),
+        routes=pd.DataFrame({
+            "route_id": route_ids,
+            "agency_id": "a",
+            "route_short_name": route_ids,
+            "route_long_name": None,
+        }),
+        stop_times=pd.DataFrame(columns=["trip_id", "departure_time", "stop_id", "stop_sequence"]),
+        stops=pd.DataFrame(columns=["stop_id", "stop_name", "stop_lat", "stop_lon", "parent_station"]),
+        trips=pd.DataFrame({
+            "route_id": route_ids,
+            "service_id": "s",
+            "trip_id": route_ids,
+            "shape_id": shape_ids,
+        }),
+        shapes=shapes,
+    )
+
+
+def main():
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    gtfs = synthetic_gtfs(num_points)
+
+    start = time.perf_counter()
+    shape_lines_by_groupby(gtfs.shapes)
+    groupby_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    routes = read_routes_table(gtfs)
+    ragged_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        write_features(routes, os.path.join(tmp_dir, "routes.geojson"))
+        write_seconds = time.perf_counter() - start
+
+    print(f"points: {len(gtfs.shapes)}, routes: {len(routes)}")
+    print(f"  grouping tuples, lines only: {groupby_seconds:.3f}s")
+    print(f"  ragged arrays, whole read_routes_table: {ragged_seconds:.3f}s")
+    print(f"  writing routes.geojson: {write_seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
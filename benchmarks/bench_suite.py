@@ -0,0 +1,136 @@
+"""
+Benchmark suite of public entry points on synthetic feeds of several scales.
+Each entry point is timed, then run again under tracemalloc for its peak of allocations.
+Results are JSON lines, a record by scale and entry point, to track trends.
+
+usage: poetry run python benchmarks/bench_suite.py [--scales 1e4 1e5 1e6] [--output results.jsonl]
+"""
+import argparse
+import datetime
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from gtfs_parser.aggregate import Aggregator
+from gtfs_parser.gtfs import GTFSFactory
+from gtfs_parser.parse import read_routes, read_stops
+from gtfs_parser.service_calendar import date_range
+from gtfs_parser.synthetic import generate_feed
+
+STOPS_PER_ROUTE = 30
+YYYYMMDD = "20210405"
+DATES = date_range(YYYYMMDD, "20210411")
+
+
+def feed_params(num_stop_times):
+    # routes grow by square root of stop_times, then trips of routes grow too
+    num_routes = max(2, int(math.sqrt(num_stop_times / STOPS_PER_ROUTE) / 2))
+    return {
+        "num_stops": max(num_routes * STOPS_PER_ROUTE, STOPS_PER_ROUTE**2),
+        "num_routes": num_routes,
+        "trips_per_route": max(num_stop_times // (num_routes * STOPS_PER_ROUTE), 1),
+        "stops_per_route": STOPS_PER_ROUTE,
+        "shape_points_per_route": 10 * STOPS_PER_ROUTE,
+        "num_services": 8,
+        "num_exceptions": 100,
+    }
+
+
+# entry points called with a GTFS loaded for each call, not to share tables built on first access
+ENTRY_POINTS = {
+    "GTFSFactory": lambda gtfs, path: GTFSFactory(path),
+    "GTFSFactory(encode_ids)": lambda gtfs, path: GTFSFactory(path, encode_ids=True),
+    "read_stops": lambda gtfs, path: read_stops(gtfs),
+    "read_routes": lambda gtfs, path: read_routes(gtfs),
+    "read_routes(ignore_shapes)": lambda gtfs, path: read_routes(gtfs, ignore_shapes=True),
+    "Aggregator": lambda gtfs, path: Aggregator(gtfs, yyyymmdd=YYYYMMDD),
+    "read_interpolated_stops": lambda gtfs, path: Aggregator(
+        gtfs, yyyymmdd=YYYYMMDD
+    ).read_interpolated_stops(),
+    "read_route_frequency": lambda gtfs, path: Aggregator(
+        gtfs, yyyymmdd=YYYYMMDD
+    ).read_route_frequency(),
+    "read_route_frequency_by_bins": lambda gtfs, path: Aggregator(gtfs).read_route_frequency_by_bins(),
+    "read_route_frequency_by_dates": lambda gtfs, path: Aggregator(
+        gtfs
+    ).read_route_frequency_by_dates(DATES),
+    "read_route_frequency(chunk_size)": lambda gtfs, path: Aggregator(
+        GTFSFactory(path, lazy=True), yyyymmdd=YYYYMMDD, chunk_size=1_000_000
+    ).read_route_frequency(),
+}
+
+
+def measure(func, path, profile_memory=True):
+    gtfs = GTFSFactory(path)
+    started = time.perf_counter()
+    func(gtfs, path)
+    seconds = time.perf_counter() - started
+
+    peak_bytes = None
+    if profile_memory:
+        # numpy and pandas report their buffers to tracemalloc
+        gtfs = GTFSFactory(path)
+        tracemalloc.start()
+        func(gtfs, path)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=float, nargs="+", default=[1e4, 1e5, 1e6])
+    parser.add_argument("--output", help="append results to this file instead of stdout")
+    parser.add_argument("--only", nargs="+", help="names of entry points to run")
+    parser.add_argument("--no_memory", action="store_true", help="skip tracemalloc runs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    environment = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+    }
+    output = open(args.output, mode="a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for scale in args.scales:
+            params = feed_params(int(scale))
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                started = time.perf_counter()
+                counts = generate_feed(tmp_dir, seed=args.seed, **params)
+                print(
+                    f"stop_times: {counts['stop_times']}, generated in {time.perf_counter() - started:.3f}s",
+                    file=sys.stderr,
+                )
+                for name, func in ENTRY_POINTS.items():
+                    if args.only and name not in args.only:
+                        continue
+                    seconds, peak_bytes = measure(func, tmp_dir, profile_memory=not args.no_memory)
+                    record = {
+                        **environment,
+                        "entry_point": name,
+                        "scale": int(scale),
+                        "rows": counts,
+                        "params": params,
+                        "seconds": seconds,
+                        "peak_bytes": peak_bytes,
+                    }
+                    output.write(json.dumps(record) + "\n")
+                    output.flush()
+                    print(f"  {name}: {seconds:.3f}s", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,2 @@
 from .gtfs import GTFSFactory, GTFS
-from . import aggregate, parse
+from . import aggregate, feed_filter, geojson, incremental, parse, profiling, service_calendar, tiles
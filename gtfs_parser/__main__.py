@@ -1,10 +1,31 @@
-import json
 import os
 import argparse
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
-from .gtfs import GTFSFactory
-from .parse import read_routes, read_stops
+from .gtfs import GTFSFactory, load_previous_version, make_cache_key
+from .geojson import read_features, write_features
+from .tiles import write_tiles
+from .parse import read_routes_table, read_stops_table
 from .aggregate import Aggregator
+from .feed_filter import FeedFilter
+from .incremental import (
+    affected_trip_ids,
+    diff_feeds,
+    patch_interpolated_stops,
+    patch_route_frequency,
+    patch_routes,
+    patch_stops,
+    subset_trips,
+)
+from .profiling import Profiler, stage
+from .service_calendar import date_range
+
+# options of outputs in dst and cache key of the feed they were made from, written by incremental runs
+INCREMENTAL_STATE_NAME = "incremental.json"
 
 
 def load_args():
@@ -15,15 +36,43 @@ def load_args():
     parser.add_argument("--parse_ignoreshapes", action="store_true")
     parser.add_argument("--parse_ignorenoroute", action="store_true")
     parser.add_argument("--aggregate_yyyymmdd")
+    parser.add_argument("--aggregate_enddate")
     parser.add_argument("--aggregate_nounifystops", action="store_true")
     parser.add_argument("--aggregate_delimiter")
     parser.add_argument("--aggregate_begintime")
     parser.add_argument("--aggregate_endtime")
+    parser.add_argument("--aggregate_chunksize", type=int)
+    parser.add_argument("--cache_dir")
+    parser.add_argument("--cache_maxbytes", type=int, default=4 * 1024**3)
+    parser.add_argument("--load_workers", type=int, default=1)
+    # keep trips by min_lon,min_lat,max_lon,max_lat, comma-separated ids and dates on loading
+    parser.add_argument("--filter_bbox")
+    parser.add_argument("--filter_agencyids")
+    parser.add_argument("--filter_routeids")
+    parser.add_argument("--filter_startdate")
+    parser.add_argument("--filter_enddate")
+    parser.add_argument(
+        "--output_format", choices=["geojson", "geojsonseq", "tiles"], default="geojson"
+    )
+    parser.add_argument("--output_tolerance", type=float)
+    parser.add_argument("--output_precision", type=int)
+    parser.add_argument("--tile_minzoom", type=int, default=10)
+    parser.add_argument("--tile_maxzoom", type=int, default=14)
+    parser.add_argument("--tile_workers", type=int, default=1)
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--batch_workers", type=int, default=1)
+    # patch outputs in dst by changes from the version of src cached before
+    parser.add_argument("--incremental", action="store_true")
+    # print stages of the run, or dump them into a JSON file if a path is given
+    parser.add_argument("--profile", nargs="?", const="")
     args = parser.parse_args()
     return args
 
 
 def validate_args(args):
+    if args.mode not in ("parse", "aggregate"):
+        raise RuntimeError("mode must be 'parse' or 'aggregate")
+
     if args.aggregate_yyyymmdd:
         if len(args.aggregate_yyyymmdd) != 8:
             raise RuntimeError(
@@ -31,6 +80,15 @@ def validate_args(args):
                     your is {args.aggregate_yyyymmdd} ({len(args.aggregate_yyyymmdd)} characters)"
             )
 
+    if args.aggregate_enddate:
+        if len(args.aggregate_enddate) != 8:
+            raise RuntimeError(
+                f"enddate must be 8 characters string, for example 20210407, \
+                    your is {args.aggregate_enddate} ({len(args.aggregate_enddate)} characters)"
+            )
+        if not args.aggregate_yyyymmdd:
+            raise RuntimeError("yyyymmdd is not set.")
+
     if args.aggregate_begintime:
         if len(args.aggregate_begintime) != 6:
             raise RuntimeError(
@@ -47,66 +105,450 @@ def validate_args(args):
         if not args.aggregate_begintime:
             raise RuntimeError("begintime is not set.")
 
+    if args.aggregate_chunksize and args.cache_dir:
+        raise RuntimeError("chunksize cannot be used with cache_dir.")
 
-def main():
-    args = load_args()
-    validate_args(args)
+    for name in ("filter_startdate", "filter_enddate"):
+        value = getattr(args, name)
+        if value and len(value) != 8:
+            raise RuntimeError(
+                f"{name} must be 8 characters string, for example 20210401, your is {value}"
+            )
+    if args.filter_enddate and not args.filter_startdate:
+        raise RuntimeError("filter_startdate is not set.")
+
+    if args.filter_bbox:
+        try:
+            make_feed_filter(args)
+        except ValueError:
+            raise RuntimeError(
+                f"bbox must be min_lon,min_lat,max_lon,max_lat, your is {args.filter_bbox}"
+            ) from None
+
+    if args.aggregate_chunksize and make_feed_filter(args) is not None:
+        raise RuntimeError("chunksize cannot be used with filters.")
+
+    if args.output_tolerance is not None and args.output_tolerance < 0:
+        raise RuntimeError(f"tolerance must not be negative, your is {args.output_tolerance}")
+
+    if args.output_precision is not None and args.output_precision < 0:
+        raise RuntimeError(f"precision must not be negative, your is {args.output_precision}")
+
+    if args.output_format == "tiles":
+        if args.tile_minzoom < 0 or args.tile_maxzoom < args.tile_minzoom:
+            raise RuntimeError(
+                f"zoom range must be 0 <= minzoom <= maxzoom, your is {args.tile_minzoom}-{args.tile_maxzoom}"
+            )
+
+    if args.incremental:
+        if not args.cache_dir:
+            raise RuntimeError("incremental needs cache_dir to keep the previous version.")
+        if args.output_format == "tiles":
+            raise RuntimeError("incremental cannot be used with tiles.")
+
+    if args.batch and args.batch_workers < 1:
+        raise RuntimeError(f"batch_workers must be positive, your is {args.batch_workers}")
+
+
+def reduce_geometry(features, args):
+    # simplify lines and round coordinates on output, properties are not changed
+    if args.output_tolerance:
+        features = features.simplify(args.output_tolerance)
+    if args.output_precision is not None:
+        features = features.round_coordinates(args.output_precision)
+    return features
+
+
+def write_layers(tables, dst, args):
+    # a file by layer name, or tiles of all layers as dst/name/z/x/y.geojson
+    tables = {name: reduce_geometry(features, args) for name, features in tables.items()}
+    if args.output_format == "tiles":
+        with stage("main.write.tiles") as s:
+            s.rows = write_tiles(
+                tables,
+                dst,
+                args.tile_minzoom,
+                args.tile_maxzoom,
+                max_workers=args.tile_workers,
+            )
+        return
+    seq = args.output_format == "geojsonseq"
+    extension = ".geojsonl" if seq else ".geojson"
+    for name, features in tables.items():
+        with stage(f"main.write.{name}") as s:
+            s.rows = write_features(features, os.path.join(dst, name + extension), seq=seq)
+
+
+def list_feeds(src):
+    """
+    feeds of a batch by name, as zip files and directories in src directory,
+    or paths listed by line in src manifest. Relative paths are from the manifest.
+    """
+    if os.path.isdir(src):
+        paths = [
+            os.path.join(src, name)
+            for name in sorted(os.listdir(src))
+            if name.endswith(".zip") or os.path.isdir(os.path.join(src, name))
+        ]
+    else:
+        with open(src, encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+        paths = [
+            os.path.join(os.path.dirname(src), line)
+            for line in lines
+            if line and not line.startswith("#")
+        ]
+
+    feeds = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+        if name in feeds:
+            raise RuntimeError(f"feed names must be unique, {name} is duplicated in {src}")
+        feeds[name] = path
+    return feeds
+
+
+def run_feed(args):
+    """run a feed of a batch, errors are returned as summary instead of raised"""
+    started = time.perf_counter()
+    summary = {"src": args.src, "dst": args.dst}
+    try:
+        if args.profile is None:
+            summary["load_timings"] = run(args)
+        else:
+            # stages are recorded in the process of the feed
+            with Profiler() as profiler:
+                summary["load_timings"] = run(args)
+            summary["profile"] = profiler.report()
+        summary["status"] = "succeeded"
+    except Exception:
+        summary["status"] = "failed"
+        summary["error"] = traceback.format_exc()
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+
+def run_batch(args):
+    """
+    run each feed of a batch into dst/feed name/ by a process pool, then write dst/batch_summary.json.
+    A failed feed does not stop others. Feeds in a pool broken by a crashed process are run again
+    by a process each, then only the feed crashing its process fails.
+    """
+    feeds = list_feeds(args.src)
+    if len(feeds) == 0:
+        raise RuntimeError(f"no feeds in {args.src}")
+    os.makedirs(args.dst, exist_ok=True)
+    feed_args = {
+        name: argparse.Namespace(
+            **{**vars(args), "src": path, "dst": os.path.join(args.dst, name), "batch": False}
+        )
+        for name, path in feeds.items()
+    }
+
+    started = time.perf_counter()
+    summaries = {}
+    broken = []
+    with ProcessPoolExecutor(max_workers=args.batch_workers) as executor:
+        futures = {executor.submit(run_feed, feed_args[name]): name for name in feeds}
+        for future in as_completed(futures):
+            try:
+                summaries[futures[future]] = future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+    for name in broken:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                summaries[name] = executor.submit(run_feed, feed_args[name]).result()
+            except BrokenProcessPool:
+                summaries[name] = {
+                    "src": feeds[name],
+                    "dst": feed_args[name].dst,
+                    "status": "failed",
+                    "error": "process running the feed terminated abruptly.",
+                }
 
-    gtfs = GTFSFactory(args.src)
+    failed = [name for name in feeds if summaries[name]["status"] == "failed"]
+    batch_summary = {
+        "seconds": time.perf_counter() - started,
+        "succeeded": len(feeds) - len(failed),
+        "failed": len(failed),
+        "feeds": {name: summaries[name] for name in feeds},
+    }
+    summary_path = os.path.join(args.dst, "batch_summary.json")
+    with open(summary_path, mode="w", encoding="utf-8") as f:
+        json.dump(batch_summary, f, ensure_ascii=False, indent=2)
+
+    print(f"batch finished in {batch_summary['seconds']:.3f}s.")
+    for name in feeds:
+        seconds = summaries[name].get("seconds")
+        print(f"  {name}: {summaries[name]['status']}" + (f" {seconds:.3f}s" if seconds else ""))
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(feeds)} feeds failed, see {summary_path}")
+
+
+def make_aggregator(gtfs, args):
+    # dates from yyyymmdd to enddate are aggregated by dates, not filtered by yyyymmdd
+    return Aggregator(
+        gtfs,
+        no_unify_stops=args.aggregate_nounifystops,
+        delimiter=args.aggregate_delimiter,
+        yyyymmdd="" if args.aggregate_enddate else args.aggregate_yyyymmdd,
+        begin_time=args.aggregate_begintime,
+        end_time=args.aggregate_endtime,
+        chunk_size=args.aggregate_chunksize,
+        cache_dir=args.cache_dir,
+        max_cache_bytes=args.cache_maxbytes,
+    )
+
+
+def get_output_options(args):
+    # options changing outputs, previous outputs are patched only if they are same
+    return {
+        name: value
+        for name, value in sorted(vars(args).items())
+        if name == "mode" or name.startswith(("parse_", "aggregate_", "output_", "filter_"))
+    }
+
+
+def make_feed_filter(args):
+    # FeedFilter by filter_ options, None if no filters are set
+    def split(value):
+        return value.split(",") if value else None
+
+    bbox = split(args.filter_bbox)
+    feed_filter = FeedFilter(
+        bbox=tuple(map(float, bbox)) if bbox else None,
+        agency_ids=split(args.filter_agencyids),
+        route_ids=split(args.filter_routeids),
+        start_date=args.filter_startdate or None,
+        end_date=args.filter_enddate or None,
+    )
+    return None if feed_filter.is_empty() else feed_filter
+
+
+def get_output_paths(args):
+    """paths of outputs in args.dst by (directory, layer name)"""
+    extension = ".geojsonl" if args.output_format == "geojsonseq" else ".geojson"
+    if args.mode == "parse":
+        names = ["routes", "stops"]
+        dst_dirs = [args.dst]
+    else:
+        names = ["aggregated_routes", "aggregated_stops"]
+        if args.aggregate_enddate:
+            dates = date_range(args.aggregate_yyyymmdd, args.aggregate_enddate)
+            dst_dirs = [os.path.join(args.dst, yyyymmdd) for yyyymmdd in dates]
+        else:
+            dst_dirs = [args.dst]
+    return {
+        (dst_dir, name): os.path.join(dst_dir, name + extension)
+        for dst_dir in dst_dirs
+        for name in names
+    }
+
+
+def read_incremental_state(args):
+    """state of outputs in args.dst, None if it is not written or outputs are missing"""
+    state_path = os.path.join(args.dst, INCREMENTAL_STATE_NAME)
+    if not os.path.isfile(state_path):
+        return None
+    if not all(os.path.isfile(path) for path in get_output_paths(args).values()):
+        return None
+    with open(state_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_incremental_state(args, cache_key):
+    with open(os.path.join(args.dst, INCREMENTAL_STATE_NAME), mode="w", encoding="utf-8") as f:
+        json.dump(
+            {"options": get_output_options(args), "cache_key": cache_key}, f, ensure_ascii=False
+        )
+
+
+def patch_outputs(previous_gtfs, gtfs, args):
+    """
+    patch outputs of the previous version in args.dst by changes of the feed,
+    returns False if they cannot be patched, then outputs are made from scratch.
+    """
+    paths = get_output_paths(args)
+    state = read_incremental_state(args)
+    if state is None:
+        print("incremental: previous outputs not found, made from scratch.")
+        return False
+    if state.get("options") != get_output_options(args):
+        print("incremental: previous outputs made by other options, made from scratch.")
+        return False
+
+    diff = diff_feeds(previous_gtfs, gtfs)
+    print(f"incremental: changed {diff.summary()}")
+    if diff.is_empty():
+        return True
+    if args.mode == "parse":
+        write_layers(
+            {
+                "routes": patch_routes(
+                    read_features(paths[(args.dst, "routes")]),
+                    previous_gtfs,
+                    gtfs,
+                    diff,
+                    ignore_shapes=args.parse_ignoreshapes,
+                ),
+                "stops": patch_stops(
+                    read_features(paths[(args.dst, "stops")]),
+                    previous_gtfs,
+                    gtfs,
+                    diff,
+                    ignore_no_route=args.parse_ignorenoroute,
+                ),
+            },
+            args.dst,
+            args,
+        )
+        return True
+
+    if diff.agency_ids or diff.stop_ids:
+        # agencies and unified stops are joined to all features
+        print("incremental: agency or stops changed, made from scratch.")
+        return False
+    # counts are sums over trips, then counts of affected trips are replaced
+    trip_ids = affected_trip_ids(previous_gtfs, gtfs, diff)
+    old_aggregator = make_aggregator(subset_trips(previous_gtfs, trip_ids), args)
+    new_aggregator = make_aggregator(subset_trips(gtfs, trip_ids), args)
+    if args.aggregate_enddate:
+        dates = date_range(args.aggregate_yyyymmdd, args.aggregate_enddate)
+        dst_dirs = [os.path.join(args.dst, yyyymmdd) for yyyymmdd in dates]
+        route_parts = zip(
+            dst_dirs,
+            (features for _, features in old_aggregator.iter_route_frequency_by_dates(dates)),
+            (features for _, features in new_aggregator.iter_route_frequency_by_dates(dates)),
+        )
+        stop_parts = zip(
+            dst_dirs,
+            (features for _, features in old_aggregator.iter_interpolated_stops_by_dates(dates)),
+            (features for _, features in new_aggregator.iter_interpolated_stops_by_dates(dates)),
+        )
+    else:
+        route_parts = [(
+            args.dst,
+            old_aggregator.read_route_frequency_table(),
+            new_aggregator.read_route_frequency_table(),
+        )]
+        stop_parts = [(
+            args.dst,
+            old_aggregator.read_interpolated_stops_table(),
+            new_aggregator.read_interpolated_stops_table(),
+        )]
+    for (dst_dir, old_routes, new_routes), (_, old_stops, new_stops) in zip(route_parts, stop_parts):
+        write_layers(
+            {
+                "aggregated_routes": patch_route_frequency(
+                    read_features(paths[(dst_dir, "aggregated_routes")]), old_routes, new_routes
+                ),
+                "aggregated_stops": patch_interpolated_stops(
+                    read_features(paths[(dst_dir, "aggregated_stops")]), old_stops, new_stops
+                ),
+            },
+            dst_dir,
+            args,
+        )
+    return True
+
+
+def run(args):
+    """parse or aggregate a feed of args.src into args.dst, returns seconds to load tables"""
+    cache_key = None
+    previous_gtfs = None
+    if args.incremental:
+        cache_key = make_cache_key(args.src, encode_ids=True, feed_filter=make_feed_filter(args))
+        state = read_incremental_state(args)
+        if state == {"options": get_output_options(args), "cache_key": cache_key}:
+            # outputs were made from same src by same options
+            print("incremental: not changed, outputs are kept.")
+            return {}
+        # before loading src, which removes the previous version from cache
+        previous_gtfs = load_previous_version(
+            args.src, args.cache_dir, encode_ids=True, feed_filter=make_feed_filter(args)
+        )
+    with stage("main.load_gtfs"):
+        if args.mode == "aggregate" and args.aggregate_chunksize:
+            # stop_times are streamed from src, other tables are read on demand
+            gtfs = GTFSFactory(args.src, lazy=True)
+        else:
+            gtfs = GTFSFactory(
+                args.src,
+                encode_ids=True,
+                cache_dir=args.cache_dir,
+                max_cache_bytes=args.cache_maxbytes,
+                max_workers=args.load_workers,
+                feed_filter=make_feed_filter(args),
+            )
     print("GTFS loaded.")
+    for table_name, seconds in gtfs.load_timings.items():
+        print(f"  {table_name}: {seconds:.3f}s")
 
     os.makedirs(args.dst, exist_ok=True)
 
-    if args.mode == "aggregate":
-        aggregator = Aggregator(
-            gtfs,
-            no_unify_stops=args.aggregate_nounifystops,
-            delimiter=args.aggregate_delimiter,
-            yyyymmdd=args.aggregate_yyyymmdd,
-            begin_time=args.aggregate_begintime,
-            end_time=args.aggregate_endtime,
+    if previous_gtfs is not None and patch_outputs(previous_gtfs, gtfs, args):
+        write_incremental_state(args, cache_key)
+        return gtfs.load_timings
+    if args.incremental:
+        # outputs are replaced from here, then options of them are written after them
+        state_path = os.path.join(args.dst, INCREMENTAL_STATE_NAME)
+        if os.path.isfile(state_path):
+            os.remove(state_path)
+
+    if args.mode == "aggregate" and args.aggregate_enddate:
+        # aggregate each date from yyyymmdd to enddate into dst/yyyymmdd/
+        aggregator = make_aggregator(gtfs, args)
+        dates = date_range(args.aggregate_yyyymmdd, args.aggregate_enddate)
+        for yyyymmdd in dates:
+            os.makedirs(os.path.join(args.dst, yyyymmdd), exist_ok=True)
+        for (yyyymmdd, routes), (_, stops) in zip(
+            aggregator.iter_route_frequency_by_dates(dates),
+            aggregator.iter_interpolated_stops_by_dates(dates),
+        ):
+            write_layers(
+                {"aggregated_routes": routes, "aggregated_stops": stops},
+                os.path.join(args.dst, yyyymmdd),
+                args,
+            )
+    elif args.mode == "aggregate":
+        aggregator = make_aggregator(gtfs, args)
+        write_layers(
+            {
+                "aggregated_routes": aggregator.read_route_frequency_table(),
+                "aggregated_stops": aggregator.read_interpolated_stops_table(),
+            },
+            args.dst,
+            args,
         )
-        aggregated_routes_geojson = {
-            "type": "FeatureCollection",
-            "features": aggregator.read_route_frequency(),
-        }
-        aggregated_stops_geojson = {
-            "type": "FeatureCollection",
-            "features": aggregator.read_interpolated_stops(),
-        }
-
-        with open(
-            os.path.join(args.dst, "aggregated_routes.geojson"),
-            mode="w",
-            encoding="utf-8",
-        ) as f:
-            json.dump(aggregated_routes_geojson, f, ensure_ascii=False)
-        with open(
-            os.path.join(args.dst, "aggregated_stops.geojson"),
-            mode="w",
-            encoding="utf-8",
-        ) as f:
-            json.dump(aggregated_stops_geojson, f, ensure_ascii=False)
     elif args.mode == "parse":
-        routes_geojson = {
-            "type": "FeatureCollection",
-            "features": read_routes(gtfs, ignore_shapes=args.parse_ignoreshapes),
-        }
-        stops_geojson = {
-            "type": "FeatureCollection",
-            "features": read_stops(gtfs, ignore_no_route=args.parse_ignorenoroute),
-        }
-
-        with open(
-            os.path.join(args.dst, "routes.geojson"), mode="w", encoding="utf-8"
-        ) as f:
-            json.dump(routes_geojson, f, ensure_ascii=False)
-        with open(
-            os.path.join(args.dst, "stops.geojson"), mode="w", encoding="utf-8"
-        ) as f:
-            json.dump(stops_geojson, f, ensure_ascii=False)
+        write_layers(
+            {
+                "routes": read_routes_table(gtfs, ignore_shapes=args.parse_ignoreshapes),
+                "stops": read_stops_table(gtfs, ignore_no_route=args.parse_ignorenoroute),
+            },
+            args.dst,
+            args,
+        )
+    if args.incremental:
+        write_incremental_state(args, cache_key)
+    return gtfs.load_timings
+
+
+def main():
+    args = load_args()
+    validate_args(args)
+    if args.batch:
+        run_batch(args)
+    elif args.profile is None:
+        run(args)
     else:
-        raise RuntimeError("mode must be 'parse' or 'aggregate")
+        with Profiler() as profiler:
+            run(args)
+        if args.profile:
+            profiler.dump(args.profile)
+        else:
+            profiler.print_report()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,31 @@
-import datetime
+import hashlib
+import json
+from collections import OrderedDict
+from functools import cached_property
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
-from .gtfs import GTFS
+from .cache import GTFSCache
+from .geojson import FeatureTable
+from .gtfs import GTFS, decode_ids
+from .patterns import NULL_SECONDS, seconds_to_float, stop_times_seconds
+from .profiling import stage, staged
+
+# columns of stops read by unifying, fingerprinted as key of unified stops
+UNIFY_COLUMNS = ["stop_id", "stop_name", "stop_lon", "stop_lat", "location_type", "parent_station"]
+# number of unified stops kept in memory across Aggregators, least recently used are evicted
+UNIFIED_STOPS_CACHE_SIZE = 8
+UNIFY_CACHE_VERSION = 2
+# cells of a side of the grid finding near stops, keys of (stop_name, x, y) fit in int64 by it
+MAX_GRID_CELLS = 2**20
+_unified_stops_cache: "OrderedDict[str, Tuple[pd.DataFrame, pd.DataFrame]]" = OrderedDict()
+
+
+def clear_unified_stops_cache():
+    """drop unified stops cached in memory, entries in cache_dir are kept"""
+    _unified_stops_cache.clear()
 
 
 class Aggregator:
@@ -15,10 +38,19 @@ class Aggregator:
     Args:
         delimiter (str, optional): stop_id delimiter, sample_A, sample_B, then delimiter is '_'. Defaults to ''.
         max_distance_degree (float, optional): distance limit in grouping by stop_name. Defaults to 0.003.(approx. 300m)
+        chunk_size (int, optional): stream stop_times in chunks of about this number of rows,
+            instead of holding filtered stop_times. stop_times not grouped by trip_id
+            take one more pass per chunk of trips.
+            Use with GTFSFactory(lazy=True) to bound memory. Defaults to None.
+        cache_dir (str, optional): directory to cache unified stops on disk, keyed by
+            fingerprint of stops, delimiter and max_distance_degree. Unified stops are
+            cached in memory regardless of it. Defaults to None.
+        max_cache_bytes (int, optional): size limit of cache_dir. Defaults to 4GiB.
 
     Returns:
         [type]: [description]
     """
+    @staged("aggregate.init")
     def __init__(
         self,
         gtfs: GTFS,
@@ -28,41 +60,358 @@ class Aggregator:
         yyyymmdd="",
         begin_time="",
         end_time="",
+        chunk_size=None,
+        cache_dir: Optional[str] = None,
+        max_cache_bytes: int = 4 * 1024**3,
     ):
         self.gtfs = gtfs
-
-        self.stop_times = Aggregator.__filter_stop_times(self.gtfs, yyyymmdd, begin_time, end_time)
+        self.chunk_size = chunk_size
+        self.begin_time = begin_time
+        self.end_time = end_time
+        self.trip_ids_on_date = Aggregator.__get_trips_on_a_date(gtfs, yyyymmdd) if yyyymmdd else None
+        self.__chunk_counts = None
+        self.__is_trips_grouped = True
+        self.__pattern_counts = None
+        self.__service_counts = None
+        self.__bin_counts = {}
+
+        # stops are unified by str ids, because delimiter makes new ids.
+        stops = self.gtfs.stops
+        if self.gtfs.ids is not None:
+            stops = stops.assign(
+                stop_id=self.gtfs.decode_ids("stop_id", stops["stop_id"]),
+                parent_station=self.gtfs.decode_ids("stop_id", stops["parent_station"]),
+            )
 
         if no_unify_stops:
-            similar_results = Aggregator.__get_similar_stop_without_unifying(self.gtfs.stops)
+            similar_results = Aggregator.__get_similar_stop_without_unifying(stops)
         else:
-            similar_results = Aggregator.__unify_similar_stops(self.gtfs.stops, delimiter, max_distance_degree)
+            similar_results = Aggregator.__unify_similar_stops_cached(
+                stops, delimiter, max_distance_degree, cache_dir, max_cache_bytes
+            )
         self.similar_stops, self.stop_relations = similar_results
 
-    @staticmethod
-    def __filter_stop_times(gtfs, yyyymmdd, begin_time, end_time):
+        # code similar_stop_id too, then stop_times are joined by int codes.
+        self.similar_stop_ids = None
+        if self.gtfs.ids is not None:
+            self.stop_relations = self.stop_relations.assign(
+                stop_id=self.gtfs.ids["stop_id"].get_indexer(self.stop_relations["stop_id"]).astype(np.int32)
+            )
+            self.similar_stop_ids = pd.Index(np.unique(self.similar_stops["similar_stop_id"]))
+            for df in (self.similar_stops, self.stop_relations):
+                df["similar_stop_id"] = self.similar_stop_ids.get_indexer(df["similar_stop_id"]).astype(np.int32)
+
+    @cached_property
+    def stop_times(self):
+        """
+        stop_times filtered by date and time, sorted by trip_id and stop_sequence.
+        None when stop_times are streamed in chunks.
+        """
+        if self.chunk_size is not None:
+            return None
+        return self.__sorted_stop_times()
+
+    def __decode_similar_stop_ids(self, codes):
+        if self.similar_stop_ids is None:
+            return codes
+        return decode_ids(self.similar_stop_ids, codes)
+
+    @staged("aggregate.filter_stop_times", rows=len)
+    def __filter_stop_times(self, stop_times):
         # filter stop_times by whether serviced or not
-        if yyyymmdd:
-            trip_ids_filtered_by_day = Aggregator.__get_trips_on_a_date(gtfs, yyyymmdd)
-            filtered_stop_times = gtfs.stop_times[
-                gtfs.stop_times["trip_id"].isin(trip_ids_filtered_by_day)
-            ]
+        if self.trip_ids_on_date is not None:
+            stop_times = stop_times[stop_times["trip_id"].isin(self.trip_ids_on_date)]
+        return self.__filter_by_time(stop_times)
+
+    @staged("aggregate.sorted_stop_times", rows=len)
+    def __sorted_stop_times(self, by_date=True):
+        """
+        stop_times of the feed filtered like __filter_stop_times, taken in order of
+        trip_id and stop_sequence sorted once by the feed. Rows without trip_id are excluded.
+        """
+        stop_times = self.gtfs.stop_times
+        _, order, _ = self.gtfs.stop_times_layout
+        is_kept = np.ones(len(stop_times), dtype=bool)
+        if by_date and self.trip_ids_on_date is not None:
+            is_kept &= stop_times["trip_id"].isin(self.trip_ids_on_date).to_numpy()
+        if self.begin_time and self.end_time:
+            is_kept &= self.__is_in_time(stop_times)
+        return stop_times.take(order[is_kept[order]])
+
+    def __filter_by_time(self, stop_times):
+        if self.begin_time and self.end_time:
+            stop_times = stop_times[self.__is_in_time(stop_times)]
+        return stop_times
+
+    def __is_in_time(self, stop_times):
+        # departure_time is compared in seconds decoded on loading,
+        # null times are NULL_SECONDS and less than any begin_time.
+        seconds = stop_times_seconds(stop_times)
+        begin_seconds = Aggregator.__hhmmss_to_seconds(self.begin_time)
+        end_seconds = Aggregator.__hhmmss_to_seconds(self.end_time)
+        return (seconds != NULL_SECONDS) & (seconds >= begin_seconds) & (seconds < end_seconds)
+
+    @staticmethod
+    def __hhmmss_to_seconds(hhmmss):
+        # 'hhmmss' like 030000 or 280000 into seconds
+        hours, rest = divmod(int(hhmmss), 10000)
+        minutes, seconds = divmod(rest, 100)
+        return hours * 3600 + minutes * 60 + seconds
+
+    def __aggregate_trip_chunks(self, transform, keys=()):
+        """
+        Count stop passes and path frequency over chunks of stop_times containing all rows
+        of their trips, transformed by a function.
+        In one pass if stop_times are grouped by trip_id, otherwise by buckets of trips.
+        """
+        if self.__is_trips_grouped:
+            counts = self.__aggregate((transform(chunk) for chunk in self.__iter_trip_chunks()), keys=keys)
+            if self.__is_trips_grouped:
+                return counts
+        return self.__aggregate((transform(chunk) for chunk in self.__iter_trip_buckets()), keys=keys)
+
+    def __iter_trip_chunks(self):
+        """
+        Iterate stop_times grouped by trip_id in chunks containing all rows of their trips.
+        Rows of the last trip in a chunk are carried to the next chunk.
+        Stops when a trip is found in separated chunks, then __is_trips_grouped is False.
+        """
+        seen_trip_ids = set()
+        carried = None
+        for chunk in self.gtfs.iter_chunks("stop_times", self.chunk_size):
+            if carried is not None:
+                chunk = pd.concat([carried, chunk], ignore_index=True)
+            is_last_trip = chunk["trip_id"] == chunk["trip_id"].iloc[-1]
+            carried = chunk[is_last_trip]
+            chunk = chunk[~is_last_trip]
+            if len(chunk) > 0:
+                if not Aggregator.__check_trips_unseen(chunk, seen_trip_ids):
+                    self.__is_trips_grouped = False
+                    return
+                yield chunk
+        if carried is not None:
+            if not Aggregator.__check_trips_unseen(carried, seen_trip_ids):
+                self.__is_trips_grouped = False
+                return
+            yield carried
+
+    @staticmethod
+    def __check_trips_unseen(chunk, seen_trip_ids):
+        trip_ids = chunk["trip_id"].unique()
+        if not seen_trip_ids.isdisjoint(trip_ids):
+            return False
+        seen_trip_ids.update(trip_ids)
+        return True
+
+    def __iter_trip_buckets(self):
+        """
+        Iterate stop_times not grouped by trip_id in chunks containing all rows of their trips.
+        Trips are split into buckets of about chunk_size rows by a pass counting rows by trip_id,
+        then rows of each bucket are collected by a pass over stop_times.
+        """
+        trip_rows = None
+        for chunk in self.gtfs.iter_chunks("stop_times", self.chunk_size):
+            trip_rows = Aggregator.__add_counts(trip_rows, chunk["trip_id"].value_counts())
+        if trip_rows is None:
+            return
+        # a trip over chunk_size rows is a bucket by itself
+        trip_buckets = pd.Series(
+            (trip_rows.cumsum().to_numpy() - 1) // self.chunk_size, index=trip_rows.index
+        )
+        for bucket in trip_buckets.unique():
+            bucket_trip_ids = trip_buckets.index[trip_buckets.to_numpy() == bucket]
+            yield pd.concat(
+                [
+                    chunk[chunk["trip_id"].isin(bucket_trip_ids)]
+                    for chunk in self.gtfs.iter_chunks("stop_times", self.chunk_size)
+                ],
+                ignore_index=True,
+            )
+
+    def __aggregate_chunks(self):
+        """
+        Count stop passes and path frequency over chunks of stop_times.
+        """
+        if self.__chunk_counts is None:
+            self.__chunk_counts = self.__aggregate_trip_chunks(self.__filter_stop_times)
+        return self.__chunk_counts
+
+    def __aggregate_by_service(self):
+        """
+        Count stop passes and path frequency by service_id in one pass over stop_times,
+        then counts on any date are sums of counts of services active on the date.
+        """
+        if self.__service_counts is None:
+            if self.__is_pattern_countable():
+                self.__service_counts = self.__count_by_patterns(keys=("service_id",))
+            elif self.chunk_size is None:
+                self.__service_counts = self.__aggregate(
+                    [self.__sorted_stop_times(by_date=False)], keys=("service_id",), is_sorted=True
+                )
+            else:
+                self.__service_counts = self.__aggregate_trip_chunks(
+                    self.__filter_by_time, keys=("service_id",)
+                )
+        return self.__service_counts
+
+    def __is_pattern_countable(self):
+        # trips of same stop pattern pass same stops and paths, unless stop_times are cut by time.
+        return self.chunk_size is None and not (self.begin_time and self.end_time)
+
+    def __aggregate_patterns(self):
+        """
+        Count stop passes and path frequency of trips on the date by trip patterns.
+        """
+        if self.__pattern_counts is None:
+            self.__pattern_counts = self.__count_by_patterns()
+        return self.__pattern_counts
+
+    @staged("aggregate.count_by_patterns")
+    def __count_by_patterns(self, keys=()):
+        """
+        Count stop passes and path frequency by trip patterns of the feed,
+        as number of trips of each pattern multiplied by its stops and paths.
+        Trips are filtered by the date unless counted by service_id.
+        """
+        patterns = self.gtfs.trip_patterns
+        is_counted = np.ones(len(patterns), dtype=bool)
+        if self.trip_ids_on_date is not None and "service_id" not in keys:
+            is_counted = patterns.trip_ids.isin(self.trip_ids_on_date)
+
+        # stops of patterns
+        pattern_of_stops = np.repeat(
+            np.arange(patterns.num_patterns), np.diff(patterns.pattern_offsets)
+        )
+        is_valid = patterns.pattern_stops >= 0
+        pattern_stops = pd.DataFrame({
+            "pattern": pattern_of_stops[is_valid],
+            "stop_id": patterns.stop_ids.to_numpy()[patterns.pattern_stops[is_valid]],
+        })
+        if "service_id" in keys:
+            trips = self.gtfs.trips[["trip_id", "service_id"]]
         else:
-            filtered_stop_times = gtfs.stop_times.copy()
-        # time filter
-        if begin_time and end_time:
-            # departure_time is nullable and expressed in "hh:mm:ss" or "h:mm:ss" format.
-            # Hour can be mor than 24.
-            # Therefore, drop null records and convert times to integers.
-            filtered_stop_times = filtered_stop_times[~filtered_stop_times["departure_time"].isnull()]
-            int_dep_times = filtered_stop_times.departure_time.str.replace(
-                ":", ""
-            ).astype(int)
-            filtered_stop_times = filtered_stop_times[(int_dep_times >= int(begin_time))
-                                                      & (int_dep_times < int(end_time))]
-        return filtered_stop_times
+            trips = pd.DataFrame({"trip_id": patterns.trip_ids})
+        pattern_trips = self.__count_pattern_trips(trips, is_counted, keys)
+        stop_pass_count = (
+            pd.merge(pattern_stops, pattern_trips, on="pattern")
+            .groupby([*keys, "stop_id"])["trips"]
+            .sum()
+            .rename("count")
+        )
+
+        # paths between similar stops of patterns, stops not unified are skipped.
+        stop_relations = self.stop_relations.drop_duplicates(subset="stop_id")
+        relation_rows = pd.Index(stop_relations["stop_id"]).get_indexer(patterns.stop_ids)
+        segment_patterns, prev_codes, next_codes = patterns.get_segments(relation_rows >= 0)
+        similar_stop_ids = stop_relations["similar_stop_id"].to_numpy()
+        pattern_paths = pd.DataFrame({
+            "pattern": segment_patterns,
+            "prev_stop_id": similar_stop_ids[relation_rows[prev_codes]],
+            "next_stop_id": similar_stop_ids[relation_rows[next_codes]],
+        })
+        trip_agency_df = self.__get_trip_agency(with_service="service_id" in keys)
+        pattern_trips = self.__count_pattern_trips(
+            trip_agency_df, is_counted, [*keys, "agency_id"]
+        )
+        path_freq_sr = (
+            pd.merge(pattern_paths, pattern_trips, on="pattern")
+            .groupby([*keys, "agency_id", "prev_stop_id", "next_stop_id"])["trips"]
+            .sum()
+            .rename(None)
+        )
+        return stop_pass_count, path_freq_sr
+
+    def __count_pattern_trips(self, trips, is_counted, keys):
+        """number of counted trips by keys and pattern"""
+        patterns = self.gtfs.trip_patterns
+        trip_indices = patterns.trip_ids.get_indexer(trips["trip_id"])
+        is_known = trip_indices >= 0
+        is_known[is_known] = is_counted[trip_indices[is_known]]
+        trip_indices = trip_indices[is_known]
+        pattern_trips = trips[is_known].assign(pattern=patterns.trip_patterns[trip_indices])
+        return pattern_trips.groupby([*keys, "pattern"]).size().rename("trips").reset_index()
+
+    def __aggregate_by_bins(self, bin_minutes):
+        """
+        Count stop passes and path frequency by time bins of departure_time in one pass,
+        departure_time is converted into seconds once.
+        Stop times without departure_time take departure_time of the previous stop in their trip.
+
+        Returns:
+            stop pass counts, path frequency and number of bins.
+            Counts are indexed by bin and stop_id, or by bin and path.
+        """
+        if bin_minutes not in self.__bin_counts:
+            bin_seconds = bin_minutes * 60
+            if self.chunk_size is None:
+                stop_pass_count, path_freq_sr = self.__aggregate(
+                    [Aggregator.__assign_bins(self.stop_times, bin_seconds, is_sorted=True)],
+                    keys=("bin",),
+                    is_sorted=True,
+                )
+            else:
+                stop_pass_count, path_freq_sr = self.__aggregate_trip_chunks(
+                    lambda chunk: Aggregator.__assign_bins(self.__filter_stop_times(chunk), bin_seconds),
+                    keys=("bin",),
+                )
+
+            # cover a day at least, and times over 24:00:00
+            num_bins = -(-24 * 60 // bin_minutes)
+            if len(stop_pass_count) > 0:
+                num_bins = max(num_bins, stop_pass_count.index.get_level_values("bin").max() + 1)
+            self.__bin_counts[bin_minutes] = stop_pass_count, path_freq_sr, num_bins
+        return self.__bin_counts[bin_minutes]
+
+    @staticmethod
+    def __assign_bins(stop_times, bin_seconds, is_sorted=False):
+        if not is_sorted:
+            stop_times = stop_times.sort_values(["trip_id", "stop_sequence"])
+        seconds = pd.Series(seconds_to_float(stop_times_seconds(stop_times)), index=stop_times.index)
+        # untimed stops between timed stops
+        seconds = seconds.groupby(stop_times["trip_id"].to_numpy()).ffill()
+        is_timed = seconds.notna().to_numpy()
+        return stop_times[is_timed].assign(bin=(seconds[is_timed] // bin_seconds).astype(int))
 
     @staticmethod
+    def __bins_to_lists(counts, num_bins, name):
+        """counts indexed by bin and keys into lists of counts by bin indexed by keys"""
+        matrix = counts.unstack("bin", fill_value=0).reindex(columns=range(num_bins), fill_value=0)
+        return pd.Series(matrix.to_numpy().tolist(), index=matrix.index, name=name, dtype=object)
+
+    @staged("aggregate.count_stop_times")
+    def __aggregate(self, chunks, keys=(), is_sorted=False):
+        trip_agency_df = self.__get_trip_agency(with_service="service_id" in keys)
+        stop_pass_count = None
+        path_freq_sr = None
+        for chunk in chunks:
+            stop_pass_count = Aggregator.__add_counts(
+                stop_pass_count, self.__count_stop_pass(chunk, keys)
+            )
+            path_freq_sr = Aggregator.__add_counts(
+                path_freq_sr, self.__count_path_frequency(chunk, trip_agency_df, keys, is_sorted)
+            )
+        if stop_pass_count is None:
+            # no stop_times
+            empty = pd.DataFrame(columns=["trip_id", "departure_time", "stop_id", "stop_sequence", *keys])
+            stop_pass_count = self.__count_stop_pass(empty, keys)
+            path_freq_sr = self.__count_path_frequency(empty, trip_agency_df, keys)
+        return stop_pass_count, path_freq_sr.sort_index()
+
+    def __counts_on_date(self, counts, yyyymmdd):
+        # sum counts of services active on the date
+        service_ids = self.gtfs.service_calendar.get_service_ids_on(yyyymmdd)
+        counts = counts[counts.index.get_level_values("service_id").isin(service_ids)]
+        counts = counts.droplevel("service_id")
+        return counts.groupby(level=list(counts.index.names)).sum()
+
+    @staticmethod
+    def __add_counts(total, counts):
+        if total is None:
+            return counts
+        return total.add(counts, fill_value=0).astype(int)
+
+    @staticmethod
+    @staged("aggregate.unify_similar_stops", rows=lambda result: len(result[0]))
     def __get_similar_stop_without_unifying(stops):
         if "location_type" in stops:
             stops = stops[stops["location_type"] == 0]
@@ -80,6 +429,7 @@ class Aggregator:
         return similar_stops, similar_relations
 
     @staticmethod
+    @staged("aggregate.unify_similar_stops", rows=lambda result: len(result[0]))
     def __unify_similar_stops(stops, delimiter, max_distance_degree):
         child_similar_stop = None
         child_id_pair = None
@@ -101,6 +451,74 @@ class Aggregator:
         # concat similar stops
         return pd.concat([child_similar_stop, solo_similar_stops]), pd.concat([child_id_pair, solo_id_pair])
 
+    @staticmethod
+    def __unify_similar_stops_cached(stops, delimiter, max_distance_degree, cache_dir, max_cache_bytes):
+        """
+        unified stops memoized by fingerprint of stops and parameters,
+        in memory across instances and in cache_dir if given.
+        """
+        key = Aggregator.__make_unify_key(stops, delimiter, max_distance_degree)
+        results = _unified_stops_cache.get(key)
+        cache = GTFSCache(cache_dir, max_cache_bytes) if cache_dir is not None else None
+        if results is None and cache is not None:
+            with stage("aggregate.unify_cache_load"):
+                results = Aggregator.__load_unified_stops(cache, key)
+        if results is None:
+            results = Aggregator.__unify_similar_stops(stops, delimiter, max_distance_degree)
+            if cache is not None:
+                cache.save(
+                    key,
+                    None,
+                    {"delimiter": delimiter, "max_distance_degree": max_distance_degree},
+                    Aggregator.__dump_unified_stops(*results),
+                )
+
+        _unified_stops_cache[key] = results
+        _unified_stops_cache.move_to_end(key)
+        while len(_unified_stops_cache) > UNIFIED_STOPS_CACHE_SIZE:
+            _unified_stops_cache.popitem(last=False)
+        # copies, because instances code similar_stop_id in them
+        similar_stops, stop_relations = results
+        return similar_stops.copy(), stop_relations.copy()
+
+    @staticmethod
+    def __make_unify_key(stops, delimiter, max_distance_degree):
+        columns = [column for column in UNIFY_COLUMNS if column in stops.columns]
+        sha = hashlib.sha256()
+        sha.update(json.dumps([columns, delimiter, max_distance_degree, UNIFY_CACHE_VERSION]).encode())
+        # hashes by row, then order of stops is a part of the key, as it is of the results
+        hashes = pd.util.hash_pandas_object(stops[columns], index=False)
+        sha.update(hashes.to_numpy().tobytes())
+        return "unified_stops." + sha.hexdigest()
+
+    @staticmethod
+    def __dump_unified_stops(similar_stops, stop_relations):
+        # centroids are lists, stored as columns of coordinates
+        centroids = np.array(similar_stops["similar_stops_centroid"].tolist(), dtype=float).reshape(-1, 2)
+        return {
+            "similar_stops": pd.DataFrame({
+                "similar_stop_id": similar_stops["similar_stop_id"].to_numpy(),
+                "similar_stop_name": similar_stops["similar_stop_name"].to_numpy(),
+                "similar_stop_lon": centroids[:, 0],
+                "similar_stop_lat": centroids[:, 1],
+            }),
+            "stop_relations": stop_relations[["stop_id", "similar_stop_id"]],
+        }
+
+    @staticmethod
+    def __load_unified_stops(cache, key):
+        cached = cache.load(key)
+        if cached is None:
+            return None
+        tables, _ = cached
+        similar_stops = tables["similar_stops"]
+        similar_stops = pd.DataFrame({
+            "similar_stop_id": similar_stops["similar_stop_id"],
+            "similar_stop_name": similar_stops["similar_stop_name"],
+            "similar_stops_centroid": similar_stops[["similar_stop_lon", "similar_stop_lat"]].to_numpy().tolist(),
+        })
+        return similar_stops, tables["stop_relations"].copy()
+
     @staticmethod
     def __unify_child_stops(stops):
         child_id_pair = stops[
@@ -169,45 +587,191 @@ class Aggregator:
 
     @staticmethod
     def __calc_near_id_pair(solo_stops, max_distance_degree):
-        stop_matrix = pd.merge(
-            solo_stops,
-            solo_stops,
-            on="stop_name",
-            suffixes=("", "_r")
-        )
-        near_matrix = stop_matrix[
-            (stop_matrix["stop_lon"] - stop_matrix["stop_lon_r"]) ** 2
-            + (stop_matrix["stop_lat"] - stop_matrix["stop_lat_r"]) ** 2
+        # stops without coordinates are near to no stops
+        solo_stops = solo_stops[solo_stops["stop_lon"].notna() & solo_stops["stop_lat"].notna()]
+        lons = solo_stops["stop_lon"].to_numpy()
+        lats = solo_stops["stop_lat"].to_numpy()
+
+        # find pairs of same stop_name near each other with a grid keyed by names
+        names = pd.factorize(solo_stops["stop_name"])[0]
+        left, right = Aggregator.__grid_neighbor_pairs(lons, lats, names, max_distance_degree or 1.0)
+        is_near = (
+            (lons[left] - lons[right]) ** 2
+            + (lats[left] - lats[right]) ** 2
             <= max_distance_degree ** 2
-        ]
-
-        near_matrix = near_matrix[["stop_id", "stop_id_r"]]
-        # The smallest stop id among the nearest stops is considered as the root id.
-        near_id_pair = near_matrix.groupby("stop_id").min().reset_index()
+        )
 
-        near_id_pair = Aggregator.__join_near_group(near_id_pair)
+        stop_ids = solo_stops["stop_id"].to_numpy()
+        near_matrix = pd.DataFrame({
+            "stop_id": stop_ids[left[is_near]],
+            "stop_id_r": stop_ids[right[is_near]],
+        })
+        # The smallest stop id among the stops connected by near pairs is considered as the root id.
+        near_id_pair = Aggregator.__join_near_group(near_matrix)
         return near_id_pair.rename(columns={"stop_id_r": "similar_stop_id"})
 
-    """
-    Join near groups of stops.
-    Trace root stops up to 5 times and modify root id.
-    """
+    @staticmethod
+    def __grid_neighbor_pairs(lons, lats, groups, cell_size):
+        """
+        Candidate pairs of points of same group, indices of left and right,
+        including pairs of a point itself.
+        Points are bucketed into cells of (group, x, y) in a uniform grid of cell_size,
+        then paired with points in same or adjacent cells of same group.
+        The grid has at most MAX_GRID_CELLS cells a side, wider cells than cell_size over it.
+        Any pair of points of same group within cell_size is included.
+        """
+        if len(lons) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+        # cells are widened to keep keys of (group, x, y) within int64, pairs are still included
+        span = max(np.ptp(lons), np.ptp(lats))
+        cell_size = max(cell_size, span / MAX_GRID_CELLS)
+        cell_x = np.floor((lons - lons.min()) / cell_size).astype(np.int64) + 1
+        cell_y = np.floor((lats - lats.min()) / cell_size).astype(np.int64) + 1
+        # 1 <= cell_x, cell_y <= size - 2, so that adjacent cells don't overflow into next ones.
+        width = cell_x.max() + 2
+        height = cell_y.max() + 2
+        cell_keys = (np.asarray(groups, dtype=np.int64) * width + cell_x) * height + cell_y
+
+        order = np.argsort(cell_keys, kind="stable")
+        sorted_keys = cell_keys[order]
+        lefts = []
+        rights = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbor_keys = cell_keys + dx * height + dy
+                starts = np.searchsorted(sorted_keys, neighbor_keys, side="left")
+                counts = np.searchsorted(sorted_keys, neighbor_keys, side="right") - starts
+                # expand ranges starts[i]:starts[i] + counts[i] into positions
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                lefts.append(np.repeat(np.arange(len(cell_keys)), counts))
+                rights.append(order[np.repeat(starts, counts) + offsets])
+        return np.concatenate(lefts), np.concatenate(rights)
+
     @staticmethod
     def __join_near_group(near_id_pair):
-        for i in range(5):
-            leaf_pair = near_id_pair.query("stop_id != stop_id_r")\
-                .rename(columns={"stop_id": "stop_id_r", "stop_id_r": "stop_id_r2"})
-            sub_pair = pd.merge(near_id_pair, leaf_pair, on="stop_id_r").drop(columns=["stop_id_r"])
-            if len(sub_pair) == 0:
+        """
+        Join near groups of stops.
+        Groups are connected components of stops by near pairs (stop_id, stop_id_r),
+        resolved by union-find for all pairs at once: roots of each pair are hooked to the smaller,
+        then every stop is compressed to its root, until no pairs join roots.
+        Returns a row by stop, with the smallest stop_id of its group as stop_id_r.
+        """
+        num_pairs = len(near_id_pair)
+        codes, stop_ids = pd.factorize(
+            np.concatenate([near_id_pair["stop_id"].to_numpy(), near_id_pair["stop_id_r"].to_numpy()]),
+            sort=True,
+        )
+        # codes are in order of stop_id, then the smallest code of a group is its smallest stop
+        left, right = codes[:num_pairs], codes[num_pairs:]
+        roots = np.arange(len(stop_ids))
+        while True:
+            left_roots, right_roots = roots[left], roots[right]
+            min_roots = np.minimum(left_roots, right_roots)
+            hooked = roots.copy()
+            np.minimum.at(hooked, left_roots, min_roots)
+            np.minimum.at(hooked, right_roots, min_roots)
+            while True:
+                compressed = hooked[hooked]
+                if np.array_equal(compressed, hooked):
+                    break
+                hooked = compressed
+            if np.array_equal(hooked, roots):
                 break
-            mod_id_trio = pd.merge(near_id_pair, sub_pair, on="stop_id", how="left")
-            mod_id_trio.loc[~mod_id_trio['stop_id_r2'].isna(), 'stop_id_r'] = mod_id_trio['stop_id_r2']
-            near_id_pair = mod_id_trio.drop(columns=["stop_id_r2"])
-
-        return near_id_pair
+            roots = hooked
+
+        return pd.DataFrame({"stop_id": stop_ids, "stop_id_r": stop_ids[roots]})
+
+    @staged("aggregate.count_stop_pass", rows=len)
+    def __count_stop_pass(self, stop_times, keys=()):
+        """count stop_times by stop_id, and by keys of trips or stop_times preceding it"""
+        if "service_id" in keys:
+            stop_times = pd.merge(
+                stop_times[["trip_id", "stop_id"]],
+                self.gtfs.trips[["trip_id", "service_id"]],
+                on="trip_id",
+            )
+        return stop_times.groupby([*keys, "stop_id"]).size().rename("count")
 
     def read_interpolated_stops(self):
-        stop_pass_count = self.stop_times.groupby("stop_id").size().rename("count")
+        return list(self.read_interpolated_stops_table())
+
+    def iter_interpolated_stops(self) -> Iterator[dict]:
+        """
+        generator variant of read_interpolated_stops, features are made one by one.
+        """
+        yield from self.read_interpolated_stops_table()
+
+    @staged("aggregate.read_interpolated_stops", rows=len)
+    def read_interpolated_stops_table(self) -> FeatureTable:
+        """
+        columnar variant of read_interpolated_stops, features are not made until iterated.
+        """
+        if self.__is_pattern_countable():
+            stop_pass_count = self.__aggregate_patterns()[0]
+        elif self.chunk_size is None:
+            stop_pass_count = self.__count_stop_pass(self.stop_times)
+        else:
+            stop_pass_count = self.__aggregate_chunks()[0]
+        return self.__stop_pass_count_to_features(stop_pass_count)
+
+    def read_interpolated_stops_by_bins(self, bin_minutes=60) -> list:
+        """
+        read_interpolated_stops with counts by time bins of departure_time,
+        "count" of features is a list of counts in [0, bin_minutes), [bin_minutes, 2 * bin_minutes)...
+        Bins cover a day at least, and extend over 24:00:00 when departures exist there.
+
+        Args:
+            bin_minutes (int, optional): width of a bin in minutes. Defaults to 60.
+        """
+        stop_pass_count, _, num_bins = self.__aggregate_by_bins(bin_minutes)
+        # sum counts by bin as columns, then into lists
+        bin_counts = stop_pass_count.unstack("bin", fill_value=0).reindex(
+            columns=range(num_bins), fill_value=0
+        )
+        bin_counts = pd.merge(
+            self.stop_relations, bin_counts, left_on="stop_id", right_index=True, how="left"
+        ).fillna(0)
+        similar_bin_counts = bin_counts.groupby("similar_stop_id")[list(range(num_bins))].sum()
+        similar_pass_count = pd.Series(
+            similar_bin_counts.to_numpy().astype(int).tolist(),
+            index=similar_bin_counts.index,
+            name="count",
+            dtype=object,
+        )
+        return list(self.__similar_pass_count_to_features(similar_pass_count))
+
+    def read_interpolated_stops_by_dates(self, dates: Iterable[str]) -> Dict[str, list]:
+        """
+        read_interpolated_stops on each date, stops are unified once and
+        stop_times are counted in one pass for all dates. yyyymmdd of Aggregator is ignored.
+
+        Args:
+            dates (Iterable[str]): dates like 20210401, see also service_calendar.date_range.
+
+        Returns:
+            Dict[str, list]: features by date.
+        """
+        return {
+            yyyymmdd: list(features)
+            for yyyymmdd, features in self.iter_interpolated_stops_by_dates(dates)
+        }
+
+    def iter_interpolated_stops_by_dates(
+        self, dates: Iterable[str]
+    ) -> Iterator[Tuple[str, FeatureTable]]:
+        """
+        generator variant of read_interpolated_stops_by_dates, yields date and its features,
+        features of a date are made when the date is yielded.
+        """
+        stop_pass_count = self.__aggregate_by_service()[0]
+        for yyyymmdd in dates:
+            yield yyyymmdd, self.__stop_pass_count_to_features(
+                self.__counts_on_date(stop_pass_count, yyyymmdd)
+            )
+
+    @staged("aggregate.stop_pass_count_to_features", rows=len)
+    def __stop_pass_count_to_features(self, stop_pass_count):
         stop_pass_count = pd.merge(
             self.stop_relations,
             stop_pass_count,
@@ -215,26 +779,78 @@ class Aggregator:
             how="left"
         )
         similar_pass_count = stop_pass_count.groupby("similar_stop_id").sum("count").astype(int)
+        return self.__similar_pass_count_to_features(similar_pass_count)
+
+    def __similar_pass_count_to_features(self, similar_pass_count):
         similar_stop_summary = self.similar_stops.merge(similar_pass_count,
                                                         on="similar_stop_id")
+        similar_stop_summary["similar_stop_id"] = self.__decode_similar_stop_ids(
+            similar_stop_summary["similar_stop_id"]
+        )
+
+        return FeatureTable.from_dataframe(
+            "Point",
+            similar_stop_summary["similar_stops_centroid"].tolist(),
+            similar_stop_summary,
+            ["similar_stop_name", "similar_stop_id", "count"],
+        )
 
-        stop_dicts = similar_stop_summary.to_dict(orient="records")
-
-        return [
-            {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": stop["similar_stops_centroid"],
-                },
-                "properties": {
-                    "similar_stop_name": stop["similar_stop_name"],
-                    "similar_stop_id": stop["similar_stop_id"],
-                    "count": stop["count"],
-                },
-            }
-            for stop in stop_dicts
-        ]
+    def __get_trip_agency(self, with_service=False):
+        trip_columns = ["trip_id", "route_id", "service_id"] if with_service else ["trip_id", "route_id"]
+        return self.gtfs.trip_routes[[*trip_columns, "agency_id"]]
+
+    @staged("aggregate.count_path_frequency", rows=len)
+    def __count_path_frequency(self, stop_times, trip_agency_df, keys=(), is_sorted=False):
+        """
+        count paths between similar stops by agency_id, and by keys of trips or stop_times of prev stops.
+        stop_times sorted by trip_id and stop_sequence are joined without sorting again.
+        """
+        stop_times_keys = [key for key in keys if key in stop_times.columns]
+        if is_sorted and self.stop_relations["stop_id"].is_unique and trip_agency_df["trip_id"].is_unique:
+            stop_times_df = self.__join_sorted_stop_times(stop_times, trip_agency_df, stop_times_keys)
+        else:
+            stop_times_df = pd.merge(
+                stop_times[["trip_id", "stop_sequence", "stop_id", *stop_times_keys]],
+                self.stop_relations,
+                on="stop_id"
+            )
+            # append agency_id
+            stop_times_df = pd.merge(
+                stop_times_df,
+                trip_agency_df,
+                on="trip_id"
+            )
+            stop_times_df = stop_times_df.sort_values(["trip_id", "stop_sequence"])
+
+        # generate path by joining next stop_times
+        # compare arrays shifted by one instead of Series.shift not to cast int codes into float.
+        trip_ids = stop_times_df["trip_id"].to_numpy()
+        similar_stop_ids = stop_times_df["similar_stop_id"].to_numpy()
+        is_same_trip = trip_ids[:-1] == trip_ids[1:]
+        path_df = pd.DataFrame({
+            "agency_id": stop_times_df["agency_id"].to_numpy()[:-1][is_same_trip],
+            "prev_stop_id": similar_stop_ids[:-1][is_same_trip],
+            "next_stop_id": similar_stop_ids[1:][is_same_trip],
+        })
+        for key in keys:
+            path_df[key] = stop_times_df[key].to_numpy()[:-1][is_same_trip]
+
+        # count frequency
+        return path_df.groupby([*keys, "agency_id", "prev_stop_id", "next_stop_id"]).size()
+
+    def __join_sorted_stop_times(self, stop_times, trip_agency_df, stop_times_keys):
+        """inner joins of stop_times with stop_relations and trips by unique keys, keeping order of rows"""
+        relation_rows = pd.Index(self.stop_relations["stop_id"]).get_indexer(stop_times["stop_id"])
+        trip_rows = pd.Index(trip_agency_df["trip_id"]).get_indexer(stop_times["trip_id"])
+        is_joined = (relation_rows >= 0) & (trip_rows >= 0)
+        relation_rows = relation_rows[is_joined]
+        trip_rows = trip_rows[is_joined]
+
+        columns = {column: stop_times[column].to_numpy()[is_joined] for column in ["trip_id", *stop_times_keys]}
+        columns["similar_stop_id"] = self.stop_relations["similar_stop_id"].to_numpy()[relation_rows]
+        for column in trip_agency_df.columns.drop("trip_id"):
+            columns[column] = trip_agency_df[column].to_numpy()[trip_rows]
+        return pd.DataFrame(columns)
 
     def read_route_frequency(self):
         """
@@ -249,35 +865,75 @@ class Aggregator:
         Returns:
             [type]: [description]
         """
-        #
-        stop_times_df = pd.merge(
-            self.stop_times[["trip_id", "stop_sequence", "stop_id"]],
-            self.stop_relations,
-            on="stop_id"
-        )
-        # append agency_id
-        trip_agency_df = pd.merge(
-            self.gtfs.trips[["trip_id", "route_id"]],
-            self.gtfs.routes[["route_id", "agency_id"]],
-            on="route_id"
-        )
-        stop_times_df = pd.merge(
-            stop_times_df,
-            trip_agency_df,
-            on="trip_id"
-        )
-        stop_times_df = stop_times_df.sort_values(["trip_id", "stop_sequence"])
+        return list(self.read_route_frequency_table())
 
-        # generate path by joining next stop_times
-        stop_times_df["next_stop_id"] = stop_times_df["similar_stop_id"].shift(-1)
-        stop_times_df["next_trip_id"] = stop_times_df["trip_id"].shift(-1)
-        stop_times_df = stop_times_df[stop_times_df["trip_id"] == stop_times_df["next_trip_id"]]
-        path_df = stop_times_df.rename(columns={"similar_stop_id": "prev_stop_id"})
+    def iter_route_frequency(self) -> Iterator[dict]:
+        """
+        generator variant of read_route_frequency, features are made one by one.
+        """
+        yield from self.read_route_frequency_table()
 
-        # count frequency
-        path_freq_sr = path_df.groupby(["agency_id", "prev_stop_id", "next_stop_id"]).size()
-        path_freq_sr.name = "frequency"
-        path_freq_df = path_freq_sr.reset_index()
+    @staged("aggregate.read_route_frequency", rows=len)
+    def read_route_frequency_table(self) -> FeatureTable:
+        """
+        columnar variant of read_route_frequency, features are not made until iterated.
+        """
+        if self.__is_pattern_countable():
+            path_freq_sr = self.__aggregate_patterns()[1]
+        elif self.chunk_size is None:
+            path_freq_sr = self.__count_path_frequency(
+                self.stop_times, self.__get_trip_agency(), is_sorted=True
+            )
+        else:
+            path_freq_sr = self.__aggregate_chunks()[1]
+        return self.__path_frequency_to_features(path_freq_sr)
+
+    def read_route_frequency_by_bins(self, bin_minutes=60) -> list:
+        """
+        read_route_frequency with frequency by time bins of departure_time at prev stops,
+        "frequency" of features is a list of frequency in [0, bin_minutes), [bin_minutes, 2 * bin_minutes)...
+        Bins cover a day at least, and extend over 24:00:00 when departures exist there.
+
+        Args:
+            bin_minutes (int, optional): width of a bin in minutes. Defaults to 60.
+        """
+        _, path_freq_sr, num_bins = self.__aggregate_by_bins(bin_minutes)
+        return list(self.__path_frequency_to_features(
+            Aggregator.__bins_to_lists(path_freq_sr, num_bins, "frequency")
+        ))
+
+    def read_route_frequency_by_dates(self, dates: Iterable[str]) -> Dict[str, list]:
+        """
+        read_route_frequency on each date, stops are unified once and
+        stop_times are counted in one pass for all dates. yyyymmdd of Aggregator is ignored.
+
+        Args:
+            dates (Iterable[str]): dates like 20210401, see also service_calendar.date_range.
+
+        Returns:
+            Dict[str, list]: features by date.
+        """
+        return {
+            yyyymmdd: list(features)
+            for yyyymmdd, features in self.iter_route_frequency_by_dates(dates)
+        }
+
+    def iter_route_frequency_by_dates(
+        self, dates: Iterable[str]
+    ) -> Iterator[Tuple[str, FeatureTable]]:
+        """
+        generator variant of read_route_frequency_by_dates, yields date and its features,
+        features of a date are made when the date is yielded.
+        """
+        path_freq_sr = self.__aggregate_by_service()[1]
+        for yyyymmdd in dates:
+            yield yyyymmdd, self.__path_frequency_to_features(
+                self.__counts_on_date(path_freq_sr, yyyymmdd)
+            )
+
+    @staged("aggregate.path_frequency_to_features", rows=len)
+    def __path_frequency_to_features(self, path_freq_sr):
+        path_freq_df = path_freq_sr.rename("frequency").reset_index()
 
         # append path attributes
         for order in ["prev", "next"]:
@@ -298,32 +954,31 @@ class Aggregator:
             self.gtfs.agency[["agency_id", "agency_name"]],
             on="agency_id"
         )
+        for column in ["prev_stop_id", "next_stop_id"]:
+            path_freq_df[column] = self.__decode_similar_stop_ids(path_freq_df[column])
+        path_freq_df["agency_id"] = self.gtfs.decode_ids("agency_id", path_freq_df["agency_id"])
+
         # convert to features
-        path_freq_dict = path_freq_df.to_dict(orient="records")
-        return [
-            {
-                "type": "Feature",
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": (
-                        path["prev_similar_stops_centroid"],
-                        path["next_similar_stops_centroid"],
-                    ),
-                },
-                "properties": {
-                    "frequency": path["frequency"],
-                    "prev_stop_id": path["prev_stop_id"],
-                    "prev_stop_name": path["prev_stop_name"],
-                    "next_stop_id": path["next_stop_id"],
-                    "next_stop_name": path["next_stop_name"],
-                    "agency_id": path["agency_id"],
-                    "agency_name": path["agency_name"],
-                },
-            }
-            for path in path_freq_dict
-        ]
+        return FeatureTable.from_dataframe(
+            "LineString",
+            list(zip(
+                path_freq_df["prev_similar_stops_centroid"].tolist(),
+                path_freq_df["next_similar_stops_centroid"].tolist(),
+            )),
+            path_freq_df,
+            [
+                "frequency",
+                "prev_stop_id",
+                "prev_stop_name",
+                "next_stop_id",
+                "next_stop_name",
+                "agency_id",
+                "agency_name",
+            ],
+        )
     
     @staticmethod
+    @staged("aggregate.date_filter", rows=len)
     def __get_trips_on_a_date(gtfs, yyyymmdd: str):
         """
         get trips are on service on a date.
@@ -334,53 +989,9 @@ class Aggregator:
         Returns:
             [type]: [description]
         """
-        # sunday, monday, tuesday...
-        day_of_week = (
-            datetime.date(int(yyyymmdd[0:4]), int(yyyymmdd[4:6]), int(yyyymmdd[6:8]))
-            .strftime("%A")
-            .lower()
-        )
-
-        # filter services by calendar
-        if gtfs.calendar is None:
-            # generate an empty series if calendar.txt is missing because it is not required.
-            service_ids_on = pd.Series(name="service_id", dtype=str)
-        else:
-            calendar = gtfs.calendar.astype(
-                {"start_date": int, "end_date": int}
-            )
-            calendar = calendar[
-                calendar[day_of_week] == "1"
-            ]
-            calendar = calendar.query(
-                f"start_date <= {int(yyyymmdd)} and {int(yyyymmdd)} <= end_date",
-                engine="python",
-            )
-            service_ids_on = calendar["service_id"]
-
-        # filter services by dates
-        if gtfs.calendar_dates is not None:
-            filtered = gtfs.calendar_dates[
-                gtfs.calendar_dates["date"] == yyyymmdd
-            ][["service_id", "exception_type"]]
-            to_be_removed_service_ids = filtered[filtered["exception_type"] == "2"][
-                "service_id"
-            ]
-            to_be_appended_services_ids = filtered[filtered["exception_type"] == "1"][
-                "service_id"
-            ]
-
-            service_ids_on = service_ids_on[
-                ~service_ids_on.isin(to_be_removed_service_ids)
-            ]
-            service_ids_on = pd.concat([service_ids_on, to_be_appended_services_ids])
-
-        # filter trips
-        trips_in_services = gtfs.trips[
-            gtfs.trips["service_id"].isin(service_ids_on)
-        ]
-
-        return trips_in_services["trip_id"]
+        # services active on the date by bitmap of the feed, calendar_dates applied.
+        is_active = gtfs.service_calendar.is_active(gtfs.trips["service_id"], yyyymmdd)
+        return gtfs.trips["trip_id"][is_active]
 
     def read_stop_relations(self) -> list:
         stop_relation_df = pd.merge(
@@ -395,4 +1006,6 @@ class Aggregator:
         )
         stop_relation_df = stop_relation_df.reindex(columns=["stop_id", "stop_name",
                                                              "similar_stop_id", "similar_stop_name"])
+        stop_relation_df["stop_id"] = self.gtfs.decode_ids("stop_id", stop_relation_df["stop_id"])
+        stop_relation_df["similar_stop_id"] = self.__decode_similar_stop_ids(stop_relation_df["similar_stop_id"])
         return stop_relation_df.to_dict(orient="records")
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_NAME = "manifest.json"
+CACHE_VERSION = 2
+
+
+class GTFSCache:
+    """
+    On-disk columnar cache of parsed GTFS tables.
+    An entry is a directory named by key, having a .npy file per column and manifest.json.
+    Numeric columns are memory-mapped on loading, str columns are stored as
+    codes and their unique values, then decoded on loading.
+
+    Args:
+        cache_dir (str): directory to store entries.
+        max_bytes (int, optional): total size limit of entries,
+            least recently used entries are evicted over it. Defaults to 4GiB.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 4 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(path: str) -> str:
+        """
+        fingerprint of GTFS source.
+        Content hash for zip file, names, sizes and mtimes of txt files for directory.
+        """
+        sha = hashlib.sha256()
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".txt"):
+                    stat = os.stat(os.path.join(path, name))
+                    sha.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        else:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(chunk)
+        return sha.hexdigest()
+
+    @staticmethod
+    def make_key(path: str, options: dict) -> str:
+        """key of entry by fingerprint of source and options changing loaded tables"""
+        sha = hashlib.sha256()
+        sha.update(GTFSCache.fingerprint(path).encode())
+        sha.update(GTFSCache.__dump_options(options).encode())
+        sha.update(str(CACHE_VERSION).encode())
+        return sha.hexdigest()
+
+    def load(
+        self, key: str
+    ) -> Optional[Tuple[Dict[str, pd.DataFrame], Optional[Dict[str, pd.Index]]]]:
+        """
+        load tables and id dictionaries of an entry.
+
+        Returns:
+            tuple of tables and ids, None if the entry does not exist.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        tables = {
+            table_name: pd.DataFrame(
+                {
+                    column: GTFSCache.__load_column(entry_dir, meta)
+                    for column, meta in columns.items()
+                },
+                copy=False,
+            )
+            for table_name, columns in manifest["tables"].items()
+        }
+        ids = None
+        if manifest["ids"] is not None:
+            ids = {
+                key_type: pd.Index(
+                    np.load(os.path.join(entry_dir, file_name)).astype(object),
+                    name=key_type,
+                )
+                for key_type, file_name in manifest["ids"].items()
+            }
+
+        # touch manifest to record last access, for LRU eviction
+        os.utime(manifest_path)
+        return tables, ids
+
+    def save(
+        self,
+        key: str,
+        source: Optional[str],
+        options: dict,
+        tables: Dict[str, pd.DataFrame],
+        ids: Optional[Dict[str, pd.Index]] = None,
+    ):
+        """
+        save tables and id dictionaries as an entry.
+        Entries of same source and options with other keys are stale, then they are removed.
+        Entries without source, like results derived from tables, are never stale.
+        """
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp_")
+        manifest = {
+            "source": os.path.abspath(source) if source is not None else None,
+            "options": GTFSCache.__dump_options(options),
+            "tables": {},
+            "ids": None,
+        }
+        for table_name, df in tables.items():
+            manifest["tables"][table_name] = {
+                column: GTFSCache.__save_column(
+                    tmp_dir, f"{table_name}.{i}", df[column]
+                )
+                for i, column in enumerate(df.columns)
+            }
+        if ids is not None:
+            manifest["ids"] = {}
+            for key_type, index in ids.items():
+                file_name = f"ids.{key_type}.npy"
+                np.save(os.path.join(tmp_dir, file_name), index.to_numpy().astype(str))
+                manifest["ids"][key_type] = file_name
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), mode="w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        entry_dir = os.path.join(self.cache_dir, key)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+        if source is not None:
+            self.__remove_stale(key, manifest["source"], manifest["options"])
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None):
+        """remove least recently used entries until total size is within max_bytes"""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            manifest_path = os.path.join(self.cache_dir, key, MANIFEST_NAME)
+            if not os.path.isfile(manifest_path):
+                continue
+            size = sum(
+                entry.stat().st_size for entry in os.scandir(os.path.join(self.cache_dir, key))
+            )
+            entries.append((os.stat(manifest_path).st_mtime, key, size))
+
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total -= size
+
+    def find_previous(self, key: str, source: str, options: dict) -> Optional[str]:
+        """
+        key of the latest entry of same source and options with another key,
+        which is the version before the source was modified. None if there is not.
+        """
+        stale_keys = self.__list_stale(
+            key, os.path.abspath(source), GTFSCache.__dump_options(options)
+        )
+        if len(stale_keys) == 0:
+            return None
+        return max(
+            stale_keys,
+            key=lambda stale_key: os.stat(
+                os.path.join(self.cache_dir, stale_key, MANIFEST_NAME)
+            ).st_mtime,
+        )
+
+    def __remove_stale(self, key: str, source: str, options: str):
+        for other_key in self.__list_stale(key, source, options):
+            shutil.rmtree(os.path.join(self.cache_dir, other_key), ignore_errors=True)
+
+    def __list_stale(self, key: str, source: str, options: str) -> List[str]:
+        stale_keys = []
+        for other_key in os.listdir(self.cache_dir):
+            manifest_path = os.path.join(self.cache_dir, other_key, MANIFEST_NAME)
+            if other_key == key or not os.path.isfile(manifest_path):
+                continue
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["source"] == source and manifest["options"] == options:
+                stale_keys.append(other_key)
+        return stale_keys
+
+    @staticmethod
+    def __dump_options(options: dict) -> str:
+        return json.dumps(options, sort_keys=True, default=sorted)
+
+    @staticmethod
+    def __save_column(entry_dir: str, name: str, sr: pd.Series) -> dict:
+        if sr.dtype.kind in "biuf":
+            file_name = f"{name}.npy"
+            np.save(os.path.join(entry_dir, file_name), sr.to_numpy())
+            return {"kind": "numeric", "file": file_name}
+
+        # str column: codes and unique values, null is coded as -1
+        codes, uniques = pd.factorize(sr)
+        file_name = f"{name}.codes.npy"
+        uniques_name = f"{name}.uniques.npy"
+        np.save(os.path.join(entry_dir, file_name), codes.astype(np.int32))
+        np.save(os.path.join(entry_dir, uniques_name), np.asarray(uniques, dtype=str))
+        return {"kind": "str", "file": file_name, "uniques": uniques_name}
+
+    @staticmethod
+    def __load_column(entry_dir: str, meta: dict) -> np.ndarray:
+        # plain ndarray viewing the mapped buffer, not to leak np.memmap into pandas
+        values = np.load(os.path.join(entry_dir, meta["file"]), mmap_mode="r").view(np.ndarray)
+        if meta["kind"] == "numeric":
+            return values
+
+        uniques = np.load(os.path.join(entry_dir, meta["uniques"])).astype(object)
+        decoded = np.full(len(values), np.nan, dtype=object)
+        is_valid = values >= 0
+        decoded[is_valid] = uniques[values[is_valid]]
+        return decoded
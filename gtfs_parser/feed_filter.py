@@ -0,0 +1,223 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .profiling import stage
+from .service_calendar import ServiceCalendar, date_range
+
+# tables streamed in chunks and pruned while they are read, others are read whole
+STREAMED_TABLES = ("stop_times", "shapes")
+# number of rows of a chunk of streamed tables
+FILTER_CHUNK_SIZE = 1_000_000
+
+
+@dataclass
+class FeedFilter:
+    """
+    Filter of a feed applied while tables are read, see GTFSFactory(feed_filter=...).
+    Trips are kept when their routes are of agency_ids and in route_ids, their services are
+    active on any date from start_date to end_date, and they stop within bbox.
+    Other tables are pruned into rows referenced by kept trips: all stop_times of the trips,
+    their stops with parent stations, shapes, routes, agency and services.
+    Stops within bbox are kept even if no trips stop there.
+    Conditions of None are not applied.
+
+    Args:
+        bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat) in degree.
+        agency_ids (Iterable[str], optional): agency_id of routes to keep.
+        route_ids (Iterable[str], optional): route_id of routes to keep.
+        start_date (str, optional): first date like 20210401.
+        end_date (str, optional): last date, both inclusive. Defaults to start_date.
+    """
+
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    agency_ids: Optional[Iterable[str]] = None
+    route_ids: Optional[Iterable[str]] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+    def __post_init__(self):
+        if self.bbox is not None:
+            self.bbox = tuple(float(value) for value in self.bbox)
+            if len(self.bbox) != 4 or self.bbox[0] > self.bbox[2] or self.bbox[1] > self.bbox[3]:
+                raise ValueError(f"bbox must be (min_lon, min_lat, max_lon, max_lat), not {self.bbox}.")
+        # sorted lists, to be compared and dumped into cache options
+        if self.agency_ids is not None:
+            self.agency_ids = sorted(self.agency_ids)
+        if self.route_ids is not None:
+            self.route_ids = sorted(self.route_ids)
+        if self.end_date is not None and self.start_date is None:
+            raise ValueError("start_date is not set.")
+
+    def is_empty(self) -> bool:
+        return (
+            self.bbox is None
+            and self.agency_ids is None
+            and self.route_ids is None
+            and self.start_date is None
+        )
+
+    def get_dates(self) -> List[str]:
+        """dates from start_date to end_date, as yyyymmdd"""
+        return date_range(self.start_date, self.end_date or self.start_date)
+
+
+def filter_tables(
+    feed_filter: FeedFilter,
+    tables: Dict[str, pd.DataFrame],
+    read_chunks: Callable[[str, Optional[List[str]]], Iterator[pd.DataFrame]],
+    schemas: Dict[str, Dict[str, type]],
+) -> Dict[str, pd.DataFrame]:
+    """
+    prune tables by feed_filter, keeping referential integrity.
+
+    Args:
+        feed_filter: conditions of trips to keep.
+        tables: tables read whole by name, except STREAMED_TABLES.
+            agency_id of routes must be set already.
+        read_chunks: function returning iterator of chunks of a streamed table by
+            (table name, columns to read or None for all), nothing if the table does not exist.
+            Only id columns of chunks are read here, then times may be decoded after filtering.
+        schemas: columns and dtypes by table name, of empty stop_times if it is not in the feed.
+    Returns:
+        Dict[str, pd.DataFrame]: pruned tables including streamed ones.
+    """
+    tables = dict(tables)
+    routes = tables["routes"]
+    is_kept_route = np.ones(len(routes), dtype=bool)
+    if feed_filter.agency_ids is not None:
+        if "agency_id" in routes:
+            is_kept_route &= routes["agency_id"].isin(feed_filter.agency_ids).to_numpy()
+        else:
+            # routes without agency_id are of no agency_ids
+            is_kept_route[:] = False
+    if feed_filter.route_ids is not None:
+        is_kept_route &= routes["route_id"].isin(feed_filter.route_ids).to_numpy()
+
+    trips = tables["trips"]
+    is_kept_trip = trips["route_id"].isin(routes["route_id"][is_kept_route]).to_numpy()
+    if feed_filter.start_date is not None:
+        service_calendar = ServiceCalendar(tables.get("calendar"), tables.get("calendar_dates"))
+        is_kept_trip &= service_calendar.is_active(trips["service_id"], feed_filter.get_dates())
+    trips = trips[is_kept_trip]
+    # stop_times are not filtered by trip_id when all trips are kept
+    trip_ids = None if is_kept_trip.all() else trips["trip_id"]
+
+    stops = tables["stops"]
+    stop_ids_in_bbox = None
+    if feed_filter.bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = feed_filter.bbox
+        is_in_bbox = (
+            stops["stop_lon"].between(min_lon, max_lon) & stops["stop_lat"].between(min_lat, max_lat)
+        )
+        stop_ids_in_bbox = stops["stop_id"][is_in_bbox]
+
+    with stage("gtfs.filter.stop_times") as s:
+        stop_times = None
+        if stop_ids_in_bbox is not None:
+            stop_times = __read_trips_in_bbox(read_chunks("stop_times", None), trip_ids, stop_ids_in_bbox)
+            if stop_times is None:
+                # stop_times are not grouped by trip_id, then first pass reads only ids
+                trip_ids_in_bbox = set()
+                for chunk in read_chunks("stop_times", ["trip_id", "stop_id"]):
+                    trip_ids_in_bbox.update(chunk["trip_id"][chunk["stop_id"].isin(stop_ids_in_bbox)].unique())
+                trips = trips[trips["trip_id"].isin(trip_ids_in_bbox)]
+                trip_ids = trips["trip_id"]
+            else:
+                trips = trips[trips["trip_id"].isin(stop_times["trip_id"].unique())]
+        if stop_times is None:
+            stop_times = __read_rows_of(read_chunks("stop_times", None), "trip_id", trip_ids)
+        if stop_times is None:
+            # no chunks of stop_times, then no trips stop within bbox
+            stop_times = pd.DataFrame(
+                {column: pd.Series(dtype=dtype) for column, dtype in schemas["stop_times"].items()}
+            )
+            if stop_ids_in_bbox is not None:
+                trips = trips.iloc[:0]
+        s.rows = len(stop_times)
+    tables["trips"] = trips.reset_index(drop=True)
+    tables["stop_times"] = stop_times
+
+    if "shape_id" in trips:
+        with stage("gtfs.filter.shapes"):
+            shapes = __read_rows_of(read_chunks("shapes", None), "shape_id", trips["shape_id"].dropna())
+        if shapes is not None:
+            tables["shapes"] = shapes
+
+    # stops of kept stop_times or within bbox, and their parents up to stations
+    is_kept_stop = stops["stop_id"].isin(stop_times["stop_id"])
+    if stop_ids_in_bbox is not None:
+        is_kept_stop |= stops["stop_id"].isin(stop_ids_in_bbox)
+    while True:
+        parent_ids = stops["parent_station"][is_kept_stop].dropna()
+        is_parent = stops["stop_id"].isin(parent_ids) & ~is_kept_stop
+        if not is_parent.any():
+            break
+        is_kept_stop |= is_parent
+    tables["stops"] = stops[is_kept_stop].reset_index(drop=True)
+
+    routes = routes[routes["route_id"].isin(trips["route_id"])]
+    tables["routes"] = routes.reset_index(drop=True)
+    agency = tables["agency"]
+    if "agency_id" in agency.columns and "agency_id" in routes.columns:
+        tables["agency"] = agency[agency["agency_id"].isin(routes["agency_id"])].reset_index(drop=True)
+    for table_name in ("calendar", "calendar_dates"):
+        df = tables.get(table_name)
+        if df is not None:
+            tables[table_name] = df[df["service_id"].isin(trips["service_id"])].reset_index(drop=True)
+    return tables
+
+
+def __read_rows_of(
+    chunks: Iterator[pd.DataFrame], column: str, values: Optional[pd.Series]
+) -> Optional[pd.DataFrame]:
+    # rows whose column is in values or all rows if values is None,
+    # a chunk is kept even if it is empty to keep columns
+    kept_chunks = []
+    for chunk in chunks:
+        kept = chunk if values is None else chunk[chunk[column].isin(values)]
+        if len(kept) > 0 or len(kept_chunks) == 0:
+            kept_chunks.append(kept)
+    if len(kept_chunks) == 0:
+        return None
+    return pd.concat(kept_chunks, ignore_index=True)
+
+
+def __read_trips_in_bbox(
+    chunks: Iterator[pd.DataFrame], trip_ids: Optional[pd.Series], stop_ids_in_bbox: pd.Series
+) -> Optional[pd.DataFrame]:
+    """
+    rows of trips in trip_ids, or of any trips if None, stopping within bbox,
+    in one pass over stop_times grouped by trip_id.
+    Rows of the last trip in a chunk are carried to the next chunk.
+    None if a trip is found in separated chunks, that is stop_times are not grouped.
+    """
+    kept_chunks = []
+    seen_trip_ids = set()
+    carried = None
+    for chunk in chunks:
+        if trip_ids is not None:
+            chunk = chunk[chunk["trip_id"].isin(trip_ids)]
+        if carried is not None:
+            chunk = pd.concat([carried, chunk])
+        if len(chunk) == 0:
+            kept_chunks.append(chunk)
+            continue
+        is_last_trip = (chunk["trip_id"] == chunk["trip_id"].iloc[-1]).to_numpy()
+        carried = chunk[is_last_trip]
+        chunk = chunk[~is_last_trip]
+        trips_in_chunk = chunk["trip_id"].unique()
+        if not seen_trip_ids.isdisjoint(trips_in_chunk):
+            return None
+        seen_trip_ids.update(trips_in_chunk)
+        kept_chunks.append(chunk[chunk["trip_id"].isin(chunk["trip_id"][chunk["stop_id"].isin(stop_ids_in_bbox)])])
+    if carried is not None:
+        if carried["trip_id"].iloc[0] in seen_trip_ids:
+            return None
+        if carried["stop_id"].isin(stop_ids_in_bbox).any():
+            kept_chunks.append(carried)
+    if len(kept_chunks) == 0:
+        return None
+    return pd.concat(kept_chunks, ignore_index=True)
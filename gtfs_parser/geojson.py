@@ -0,0 +1,346 @@
+import json
+import math
+from json.encoder import encode_basestring
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .patterns import ragged_slices
+
+# number of features serialized at once
+JSON_CHUNK_SIZE = 10000
+
+
+def _to_python(coordinates):
+    """coordinates holding ndarrays, like slices of ragged arrays, into lists"""
+    if isinstance(coordinates, np.ndarray):
+        return coordinates.tolist()
+    if isinstance(coordinates, list) and any(isinstance(c, np.ndarray) for c in coordinates):
+        return [_to_python(c) for c in coordinates]
+    return coordinates
+
+
+# same as json.dumps(obj, ensure_ascii=False), without making an encoder by each call.
+# ndarrays are encoded as lists.
+_encode = json.JSONEncoder(ensure_ascii=False, default=_to_python).encode
+
+
+def _encode_column(values: Sequence) -> list:
+    """
+    encode values of a column into JSON texts, same as _encode by each value.
+    Columns of str, int, finite float or pairs of finite floats skip the generic encoder.
+    """
+    types = set(map(type, values))
+    if types == {str}:
+        return list(map(encode_basestring, values))
+    if types == {int}:
+        return list(map(int.__repr__, values))
+    if types == {float} and all(map(math.isfinite, values)):
+        return list(map(float.__repr__, values))
+    if types == {list} or types == {tuple}:
+        if all(
+            len(v) == 2 and type(v[0]) is float and type(v[1]) is float
+            and math.isfinite(v[0]) and math.isfinite(v[1])
+            for v in values
+        ):
+            return [f"[{x!r}, {y!r}]" for x, y in values]
+    return list(map(_encode, values))
+
+
+def _simplify_mask(points: np.ndarray, offsets: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    points kept by Douglas-Peucker simplification of lines in a ragged array,
+    points of i-th line are points[offsets[i]:offsets[i + 1]].
+    Segments of all lines are split at once by each step, and first and last points of lines are kept.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    is_nonempty = ends >= starts
+    keep[starts[is_nonempty]] = True
+    keep[ends[is_nonempty]] = True
+
+    has_inner = ends - starts >= 2
+    seg_starts, seg_ends = starts[has_inner], ends[has_inner]
+    while len(seg_starts) > 0:
+        # inner points of each segment, contiguous by segment
+        counts = seg_ends - seg_starts - 1
+        seg_offsets = np.concatenate([[0], np.cumsum(counts)])
+        seg_of = np.repeat(np.arange(len(seg_starts)), counts)
+        positions = seg_starts[seg_of] + 1 + np.arange(seg_offsets[-1]) - seg_offsets[seg_of]
+
+        # distance from line through ends of segment, or from start if ends are same
+        a = points[seg_starts][seg_of]
+        d = points[seg_ends][seg_of] - a
+        v = points[positions] - a
+        norm = np.hypot(d[:, 0], d[:, 1])
+        cross = np.abs(d[:, 0] * v[:, 1] - d[:, 1] * v[:, 0])
+        dist = np.where(
+            norm > 0, cross / np.where(norm > 0, norm, 1), np.hypot(v[:, 0], v[:, 1])
+        )
+        dist = np.nan_to_num(dist, nan=0.0)
+
+        # split segments at their farthest point, first one if tied
+        max_dist = np.maximum.reduceat(dist, seg_offsets[:-1])
+        candidates = np.flatnonzero(dist == max_dist[seg_of])
+        is_first = np.concatenate([[True], seg_of[candidates][1:] != seg_of[candidates][:-1]])
+        farthest = positions[candidates[is_first]]
+
+        is_split = max_dist > tolerance
+        splits = farthest[is_split]
+        keep[splits] = True
+        seg_starts = np.concatenate([seg_starts[is_split], splits])
+        seg_ends = np.concatenate([splits, seg_ends[is_split]])
+        has_inner = seg_ends - seg_starts >= 2
+        seg_starts, seg_ends = seg_starts[has_inner], seg_ends[has_inner]
+    return keep
+
+
+def _dedupe_mask(points: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """points not same as previous point in lines, first and last points of lines are kept"""
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    is_nonempty = ends >= starts
+    keep[starts[is_nonempty]] = True
+    keep[ends[is_nonempty]] = True
+    return keep
+
+
+class FeatureTable:
+    """
+    Columnar GeoJSON-Features, with a column of coordinates and columns of properties.
+    Features are serialized into JSON column by column, without dicts by features.
+    Iterating it yields GeoJSON-Feature-dicts, for users who need them.
+
+    Args:
+        geometry_type (str): type of geometries, like "Point".
+        coordinates (Sequence): coordinates of each feature.
+        properties (Dict[str, Sequence]): columns of properties by name, in order of output.
+    """
+
+    def __init__(
+        self,
+        geometry_type: str,
+        coordinates: Sequence,
+        properties: Dict[str, Sequence],
+    ):
+        self.geometry_type = geometry_type
+        # coordinates may hold ndarrays, they are lists in dicts and JSON.
+        self.coordinates = coordinates
+        self.properties = properties
+
+    @staticmethod
+    def from_dataframe(
+        geometry_type: str, coordinates: Sequence, df: pd.DataFrame, columns: Iterable[str]
+    ) -> "FeatureTable":
+        """make a table with columns of df as properties, values are converted into python objects"""
+        return FeatureTable(
+            geometry_type,
+            coordinates,
+            {column: df[column].tolist() for column in columns},
+        )
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def __iter__(self) -> Iterator[dict]:
+        names = list(self.properties)
+        for coordinates, *values in zip(self.coordinates, *self.properties.values()):
+            yield {
+                "type": "Feature",
+                "geometry": {
+                    "type": self.geometry_type,
+                    "coordinates": _to_python(coordinates),
+                },
+                "properties": dict(zip(names, values)),
+            }
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """properties as columns, and coordinates as "coordinates" column"""
+        return pd.DataFrame({**self.properties, "coordinates": list(self.coordinates)})
+
+    def simplify(self, tolerance: float) -> "FeatureTable":
+        """
+        lines simplified by Douglas-Peucker, all lines in one vectorized pass.
+        First and last points of each line are kept, then lines keep their connections.
+        Points are not changed.
+
+        Args:
+            tolerance (float): max distance of dropped points from simplified lines,
+                in units of coordinates, degree for GTFS.
+        """
+        if self.geometry_type == "Point":
+            return self
+        return self.__map_points(
+            lambda points, offsets: _simplify_mask(points, offsets, tolerance)
+        )
+
+    def round_coordinates(self, ndigits: int) -> "FeatureTable":
+        """
+        coordinates rounded to ndigits decimal places, as quantized by grid of 10 ** -ndigits.
+        Points of lines made same as previous by rounding are dropped,
+        but first and last points of each line are kept.
+        """
+        return self.__map_points(_dedupe_mask, lambda points: np.round(points, ndigits))
+
+    def __map_points(self, get_mask, transform=None) -> "FeatureTable":
+        """
+        table of coordinates with points selected by get_mask(points, offsets) of lines,
+        after transform(points). Coordinates of all features are processed as one ragged array.
+        """
+        if len(self) == 0:
+            return self
+        points, offsets, line_features = self.to_ragged()
+        if transform is not None:
+            points = transform(points)
+        keep = get_mask(points, offsets)
+        kept_offsets = np.concatenate([[0], np.cumsum(keep)])[offsets]
+        lines = ragged_slices(points[keep], kept_offsets)
+
+        if self.geometry_type == "MultiLineString":
+            lines_by_feature = np.bincount(line_features, minlength=len(self))
+            line_offsets = np.concatenate([[0], np.cumsum(lines_by_feature)])
+            coordinates = [
+                list(lines[start:end]) for start, end in zip(line_offsets[:-1], line_offsets[1:])
+            ]
+        elif self.geometry_type == "LineString":
+            coordinates = list(lines)
+        else:
+            coordinates = [line[0].tolist() for line in lines]
+        return FeatureTable(self.geometry_type, coordinates, self.properties)
+
+    def to_ragged(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        points of all lines in a ragged array, points of i-th line are points[offsets[i]:offsets[i + 1]].
+        A point of Point features is a line of the point.
+
+        Returns:
+            points, offsets and index of feature of each line.
+        """
+        if self.geometry_type == "MultiLineString":
+            lines_by_feature = [len(multiline) for multiline in self.coordinates]
+            lines = [line for multiline in self.coordinates for line in multiline]
+        elif self.geometry_type == "LineString":
+            lines_by_feature = np.ones(len(self), dtype=int)
+            lines = self.coordinates
+        else:
+            lines_by_feature = np.ones(len(self), dtype=int)
+            lines = [[point] for point in self.coordinates]
+        line_features = np.repeat(np.arange(len(self)), lines_by_feature)
+
+        lengths = np.array([len(line) for line in lines], dtype=int)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        if len(lines) == 0:
+            return np.empty((0, 2)), offsets, line_features
+        points = np.concatenate(
+            [np.asarray(line, dtype=float).reshape(-1, 2) for line in lines]
+        )
+        return points, offsets, line_features
+
+    def take(self, indices: Sequence[int], coordinates: Optional[Sequence] = None) -> "FeatureTable":
+        """
+        table of features at indices, with their properties.
+        Coordinates of them can be replaced by coordinates, like clipped lines.
+        """
+        if coordinates is None:
+            coordinates = [self.coordinates[i] for i in indices]
+        return FeatureTable(
+            self.geometry_type,
+            coordinates,
+            {name: [values[i] for i in indices] for name, values in self.properties.items()},
+        )
+
+    def iter_json(self) -> Iterator[str]:
+        """
+        JSON texts of features, same as json.dumps(feature, ensure_ascii=False).
+        """
+        prefix = (
+            '{"type": "Feature", "geometry": {"type": '
+            + _encode(self.geometry_type)
+            + ', "coordinates": '
+        )
+        keys = [_encode(name) + ": " for name in self.properties]
+        for start in range(0, len(self), JSON_CHUNK_SIZE):
+            end = start + JSON_CHUNK_SIZE
+            coordinates = _encode_column(self.coordinates[start:end])
+            columns = [_encode_column(values[start:end]) for values in self.properties.values()]
+            for encoded_coordinates, *encoded_values in zip(coordinates, *columns):
+                yield (
+                    prefix
+                    + encoded_coordinates
+                    + '}, "properties": {'
+                    + ", ".join(key + value for key, value in zip(keys, encoded_values))
+                    + "}}"
+                )
+
+
+def write_features(features: Union[FeatureTable, Iterable[dict]], path: str, seq=False) -> int:
+    """
+    write features into a file one by one, not to hold whole FeatureCollection in memory.
+
+    Args:
+        features (FeatureTable or Iterable[dict]): GeoJSON-Features, like read_stops_table(gtfs).
+        path (str): path of output file.
+        seq (bool, optional): write newline-delimited GeoJSONSeq instead of FeatureCollection.
+            Defaults to False.
+
+    Returns:
+        int: number of written features.
+    """
+    if isinstance(features, FeatureTable):
+        texts = features.iter_json()
+    else:
+        texts = map(_encode, features)
+
+    count = 0
+    with open(path, mode="w", encoding="utf-8") as f:
+        if seq:
+            for text in texts:
+                f.write(text)
+                f.write("\n")
+                count += 1
+            return count
+
+        # same as json.dump({"type": "FeatureCollection", "features": [...]}, f)
+        f.write('{"type": "FeatureCollection", "features": [')
+        for text in texts:
+            if count > 0:
+                f.write(", ")
+            f.write(text)
+            count += 1
+        f.write("]}")
+    return count
+
+
+def read_features(path: str) -> FeatureTable:
+    """
+    read features written by write_features, FeatureCollection or GeoJSONSeq, into a table.
+    Properties are columns by names of the first feature.
+
+    Args:
+        path (str): path of GeoJSON or GeoJSONSeq file.
+
+    Returns:
+        FeatureTable: features, geometry_type is None if there are no features.
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    try:
+        collection = json.loads(text)
+    except json.JSONDecodeError:
+        # features by line
+        collection = None
+    if isinstance(collection, dict) and collection.get("type") == "FeatureCollection":
+        features = collection["features"]
+    else:
+        features = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    if len(features) == 0:
+        return FeatureTable(None, [], {})
+    names = list(features[0]["properties"])
+    return FeatureTable(
+        features[0]["geometry"]["type"],
+        [feature["geometry"]["coordinates"] for feature in features],
+        {name: [feature["properties"].get(name) for feature in features] for name in names},
+    )
@@ -2,27 +2,142 @@ import glob
 import os
 import zipfile
 import io
-from dataclasses import dataclass, fields
-from typing import Optional
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from functools import cached_property
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from .cache import GTFSCache
+from .feed_filter import FILTER_CHUNK_SIZE, STREAMED_TABLES, FeedFilter, filter_tables
+from .patterns import TripPatterns, parse_times, ragged_offsets
+from .profiling import stage
+from .service_calendar import ServiceCalendar
 
-def load_df(f: io.BufferedIOBase, table_name: str) -> pd.DataFrame:
-    df = pd.read_csv(f, dtype=str, keep_default_na=False, na_values={""})
-    if table_name == "shapes":
-        df["shape_pt_lon"] = df["shape_pt_lon"].astype(float)
-        df["shape_pt_lat"] = df["shape_pt_lat"].astype(float)
-        df["shape_pt_sequence"] = df["shape_pt_sequence"].astype(int)
-    elif table_name == "stops":
-        df["stop_lon"] = df["stop_lon"].astype(float)
-        df["stop_lat"] = df["stop_lat"].astype(float)
+
+# columns used by parse and aggregate, and dtypes they are decoded into.
+# Tables not listed here are read with all columns as str.
+TABLE_SCHEMAS = {
+    "agency": {"agency_id": str, "agency_name": str},
+    "routes": {
+        "route_id": str,
+        "agency_id": str,
+        "route_short_name": str,
+        "route_long_name": str,
+    },
+    "trips": {"route_id": str, "service_id": str, "trip_id": str, "shape_id": str},
+    "stops": {
+        "stop_id": str,
+        "stop_name": str,
+        "stop_lat": float,
+        "stop_lon": float,
+        "location_type": str,
+        "parent_station": str,
+    },
+    "stop_times": {
+        "trip_id": str,
+        "departure_time": str,
+        "stop_id": str,
+        "stop_sequence": int,
+    },
+    "shapes": {
+        "shape_id": str,
+        "shape_pt_lat": float,
+        "shape_pt_lon": float,
+        "shape_pt_sequence": int,
+    },
+    "calendar": {
+        "service_id": str,
+        "monday": str,
+        "tuesday": str,
+        "wednesday": str,
+        "thursday": str,
+        "friday": str,
+        "saturday": str,
+        "sunday": str,
+        "start_date": str,
+        "end_date": str,
+    },
+    "calendar_dates": {"service_id": str, "date": str, "exception_type": str},
+}
+
+# fields of GTFS which are not tables
+NON_TABLE_FIELDS = {"ids", "load_timings"}
+
+# columns holding identifiers, and the key type of the dictionary coding them.
+ID_COLUMNS = {
+    "agency_id": "agency_id",
+    "route_id": "route_id",
+    "trip_id": "trip_id",
+    "stop_id": "stop_id",
+    "parent_station": "stop_id",
+    "shape_id": "shape_id",
+    "service_id": "service_id",
+}
+
+
+def load_df(
+    f: io.BufferedIOBase,
+    table_name: str,
+    extra_columns: Iterable[str] = (),
+    chunk_size: Optional[int] = None,
+    columns: Optional[Iterable[str]] = None,
+    fix: bool = True,
+):
+    """
+    read a table with only columns in TABLE_SCHEMAS and extra_columns.
+
+    Args:
+        f: file object of the table.
+        table_name: name of the table, like "stops".
+        extra_columns: columns to be read as str in addition to the schema.
+        chunk_size: number of rows in a chunk, read the whole table when None.
+        columns: read only these columns of the schema, when the table has a schema.
+        fix: decode times and fill missing columns, False to do it after filtering rows.
+    Returns:
+        pd.DataFrame: table decoded into the schema dtypes,
+            or iterator of them in chunk_size rows when chunk_size is set.
+    """
+    schema = TABLE_SCHEMAS.get(table_name)
+    if schema is None:
+        reader = pd.read_csv(
+            f, dtype=str, keep_default_na=False, na_values={""}, chunksize=chunk_size
+        )
+    else:
+        dtypes = {column: str for column in extra_columns}
+        dtypes.update(schema)
+        if columns is not None:
+            dtypes = {column: dtypes[column] for column in columns}
+        reader = pd.read_csv(
+            f,
+            usecols=lambda column: column in dtypes,
+            dtype=dtypes,
+            keep_default_na=False,
+            na_values={""},
+            chunksize=chunk_size,
+        )
+
+    if not fix:
+        return reader
+    if chunk_size is None:
+        return __fix_table(reader, table_name)
+    return (__fix_table(df, table_name) for df in reader)
+
+
+def __fix_table(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    if table_name == "stop_times":
+        # times are decoded once into int32 seconds, like departure_seconds
+        for column in ("arrival_time", "departure_time"):
+            if column in df:
+                df[column.replace("_time", "_seconds")] = parse_times(df[column])
+    if table_name == "stops":
         if "parent_station" not in df:
             df["parent_station"] = None
         if "location_type" in df:
             df["location_type"] = df["location_type"].fillna("0").astype(int)
-    elif table_name == "stop_times":
-        df["stop_sequence"] = df["stop_sequence"].astype(int)
 
     return df
 
@@ -42,27 +157,414 @@ class GTFS:
     calendar_dates: Optional[pd.DataFrame] = None
     feed_info: Optional[pd.DataFrame] = None
     shapes: Optional[pd.DataFrame] = None
+    # sorted str ids by key type, when identifiers are coded into int32
+    ids: Optional[Dict[str, pd.Index]] = None
+    # seconds taken to load each table
+    load_timings: Dict[str, float] = field(default_factory=dict)
+
+    def decode_ids(self, key: str, codes):
+        """
+        decode int32 codes of identifiers into str ids.
+
+        Args:
+            key: key type of codes, like "stop_id".
+            codes: array-like of codes.
+        Returns:
+            str ids, codes are returned as they are when ids are not coded.
+        """
+        if self.ids is None:
+            return codes
+        return decode_ids(self.ids[key], codes)
+
+    @cached_property
+    def service_calendar(self) -> ServiceCalendar:
+        """
+        bitmap of active services by days, built once on first access.
+        """
+        with stage("gtfs.service_calendar"):
+            return ServiceCalendar(self.calendar, self.calendar_dates)
+
+    @cached_property
+    def trip_patterns(self) -> TripPatterns:
+        """
+        index of unique stop patterns of trips, built once on first access.
+        """
+        with stage("gtfs.trip_patterns", rows=len(self.stop_times)):
+            return TripPatterns(
+                self.stop_times["trip_id"],
+                self.stop_times["stop_sequence"],
+                self.stop_times["stop_id"],
+                layout=self.stop_times_layout,
+            )
+
+    @cached_property
+    def stop_times_layout(self) -> Tuple[np.ndarray, np.ndarray, pd.Index]:
+        """
+        stop_times sorted by trip_id and stop_sequence, as offsets, order and trip_ids
+        of patterns.ragged_offsets, sorted once on first access.
+        """
+        with stage("gtfs.stop_times_layout", rows=len(self.stop_times)):
+            return ragged_offsets(self.stop_times["trip_id"], self.stop_times["stop_sequence"])
+
+    @cached_property
+    def trip_routes(self) -> pd.DataFrame:
+        """
+        trip_id, route_id and service_id of trips joined with agency_id of their routes,
+        trips of unknown routes are excluded. Joined once on first access.
+        """
+        with stage("gtfs.trip_routes") as s:
+            trip_routes = pd.merge(
+                self.trips[["trip_id", "route_id", "service_id"]],
+                self.routes[["route_id", "agency_id"]],
+                on="route_id",
+            )
+            s.rows = len(trip_routes)
+            return trip_routes
+
+    @cached_property
+    def stop_routes(self) -> pd.DataFrame:
+        """
+        unique pairs of stop_id and route_id of trips stopping there,
+        in order of their first stop_times. Joined once on first access.
+        """
+        with stage("gtfs.stop_routes", rows=len(self.stop_times)):
+            stop_routes = pd.merge(
+                self.stop_times[["trip_id", "stop_id"]],
+                self.trips[["trip_id", "route_id"]],
+                on="trip_id",
+            )
+            return stop_routes[["stop_id", "route_id"]].drop_duplicates(ignore_index=True)
+
+    def iter_chunks(self, table_name: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        iterate a table in chunks of chunk_size rows, keeping order of rows.
 
+        Args:
+            table_name: name of the table, like "stop_times".
+            chunk_size: number of rows in a chunk.
+        Returns:
+            Iterator[pd.DataFrame]: chunks, nothing when the table does not exist.
+        """
+        df = getattr(self, table_name)
+        if df is None:
+            return
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
 
-def GTFSFactory(gtfs_path: str) -> GTFS:
+
+TABLE_NAMES = {field.name for field in fields(GTFS)} - NON_TABLE_FIELDS
+
+
+class LazyGTFS(GTFS):
+    """
+    GTFS whose tables are read on first access of attributes.
+    Chunks of tables unread yet are streamed from the source, without holding whole tables.
+
+    Args:
+        load_table: function returning a table and seconds taken by (gtfs, table name),
+            None for the table if it does not exist.
+        read_table_chunks: function returning iterator of chunks by (gtfs, table name, chunk_size).
+    """
+
+    def __init__(
+        self,
+        load_table: Callable[["LazyGTFS", str], Tuple[Optional[pd.DataFrame], float]],
+        read_table_chunks: Callable[["LazyGTFS", str, int], Iterator[pd.DataFrame]],
+    ):
+        # tables are not set here, they are set to instance on first access.
+        self.ids = None
+        self.load_timings = {}
+        self.__load_table = load_table
+        self.__read_table_chunks = read_table_chunks
+
+    def __getattribute__(self, name: str):
+        # __getattr__ is not enough because optional tables have class attribute None.
+        if name in TABLE_NAMES and name not in object.__getattribute__(self, "__dict__"):
+            self.__load(name)
+        return object.__getattribute__(self, name)
+
+    def __load(self, name: str):
+        df, seconds = self.__load_table(self, name)
+        if df is not None:
+            self.load_timings[name] = seconds
+        setattr(self, name, df)
+
+    def iter_chunks(self, table_name: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        if table_name in self.__dict__:
+            return super().iter_chunks(table_name, chunk_size)
+        return self.__read_table_chunks(self, table_name, chunk_size)
+
+    def __repr__(self):
+        loaded = ", ".join(sorted(name for name in TABLE_NAMES if name in self.__dict__))
+        return f"LazyGTFS(loaded=[{loaded}])"
+
+
+def decode_ids(ids: pd.Index, codes):
+    """
+    decode codes into values of ids, -1 into None.
+    A Series is returned when codes is a Series, otherwise ndarray.
+    """
+    code_array = np.asarray(codes)
+    values = np.where(code_array >= 0, ids.to_numpy()[code_array], None)
+    if isinstance(codes, pd.Series):
+        return pd.Series(values, index=codes.index, name=codes.name)
+    return values
+
+
+def __encode_ids(tables: Dict[str, pd.DataFrame]) -> Dict[str, pd.Index]:
+    # collect ids by key type over tables, then code them in sorted order
+    # so that ordering of codes is same as ordering of str ids.
+    values = {}
+    for df in tables.values():
+        for column, key in ID_COLUMNS.items():
+            if column in df:
+                values.setdefault(key, []).append(df[column].dropna().unique())
+    ids = {
+        key: pd.Index(np.unique(np.concatenate(arrays)), name=key)
+        for key, arrays in values.items()
+    }
+
+    for df in tables.values():
+        for column, key in ID_COLUMNS.items():
+            if column in df:
+                df[column] = ids[key].get_indexer(df[column]).astype(np.int32)
+    return ids
+
+
+def GTFSFactory(
+    gtfs_path: str,
+    extra_columns: Optional[Dict[str, Iterable[str]]] = None,
+    encode_ids: bool = False,
+    cache_dir: Optional[str] = None,
+    max_cache_bytes: int = 4 * 1024**3,
+    max_workers: int = 1,
+    use_processes: bool = False,
+    lazy: bool = False,
+    feed_filter: Optional[FeedFilter] = None,
+) -> GTFS:
     """
     read GTFS file to memory.
+    Only columns used by parse and aggregate are read, see TABLE_SCHEMAS.
 
     Args:
         path of zip file or directory containing txt files.
+        extra_columns: additional columns to read by table name,
+            like {"routes": ["route_color"]}. Defaults to None.
+        encode_ids: code identifiers in all tables into dense int32,
+            dictionaries to decode them are held in GTFS.ids. Defaults to False.
+        cache_dir: directory to cache parsed tables, keyed by content of the source.
+            Cached tables are memory-mapped instead of parsing txt files. Defaults to None.
+        max_cache_bytes: size limit of cache_dir. Defaults to 4GiB.
+        max_workers: number of tables read concurrently. Defaults to 1.
+        use_processes: read tables by processes instead of threads. Defaults to False.
+        lazy: return LazyGTFS reading each table on first access, instead of reading all tables.
+            This cannot be used with encode_ids, cache_dir and feed_filter. Defaults to False.
+        feed_filter: keep only trips by bbox, agency, route and dates, and rows referenced by them.
+            stop_times and shapes are pruned in chunks while they are read. Defaults to None.
     Returns:
         GTFS: dataclass of GTFS tables.
     """
+    if feed_filter is not None and feed_filter.is_empty():
+        feed_filter = None
+    if lazy and (encode_ids or cache_dir is not None or feed_filter is not None):
+        raise ValueError("lazy cannot be used with encode_ids, cache_dir or feed_filter.")
+
     tables = {}
+    load_timings = {}
+    extra_columns = extra_columns or {}
+    path = os.path.join(gtfs_path)
+
+    cache = None
+    if cache_dir is not None and os.path.exists(path):
+        cache = GTFSCache(cache_dir, max_cache_bytes)
+        cache_options = __make_cache_options(extra_columns, encode_ids, feed_filter)
+        cache_key = GTFSCache.make_key(path, cache_options)
+        started = time.perf_counter()
+        with stage("gtfs.cache_load"):
+            cached = cache.load(cache_key)
+        if cached is not None:
+            load_timings["cache"] = time.perf_counter() - started
+            return __tables_to_gtfs(*cached, load_timings)
+
+    table_files = __list_table_files(path)
+    if len(table_files) == 0:
+        raise FileNotFoundError(
+            "txt files must be in the root level directory, not in a sub folder."
+        )
+
+    if lazy:
+
+        def load_table(gtfs: LazyGTFS, table_name: str):
+            if table_name not in table_files:
+                return None, 0.0
+            df, seconds = __read_table(
+                path,
+                table_files[table_name],
+                table_name,
+                extra_columns.get(table_name, ()),
+            )
+            if table_name == "agency":
+                __set_agency_id(df)
+            elif table_name == "routes":
+                __set_agency_id(gtfs.agency, df)
+            return df, seconds
+
+        def read_table_chunks(gtfs: LazyGTFS, table_name: str, chunk_size: int):
+            if table_name not in table_files:
+                return
+            if table_name in ("agency", "routes"):
+                # agency_id fix-up needs whole tables
+                yield from GTFS.iter_chunks(gtfs, table_name, chunk_size)
+                return
+            yield from __iter_table_chunks(
+                path,
+                table_files[table_name],
+                table_name,
+                extra_columns.get(table_name, ()),
+                chunk_size,
+            )
+
+        return LazyGTFS(load_table, read_table_chunks)
+
+    read_args = [
+        (path, file_name, table_name, extra_columns.get(table_name, ()))
+        for table_name, file_name in table_files.items()
+        # tables streamed by feed_filter are read below
+        if feed_filter is None or table_name not in STREAMED_TABLES
+    ]
+    if max_workers > 1:
+        # each worker opens its own handle of the source
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=max_workers) as executor:
+            results = list(executor.map(__read_table, *zip(*read_args)))
+    else:
+        results = [__read_table(*args) for args in read_args]
+    for (_, _, table_name, _), (df, seconds) in zip(read_args, results):
+        tables[table_name] = df
+        load_timings[table_name] = seconds
+
+    __set_agency_id(tables["agency"], tables["routes"])
+
+    if feed_filter is not None:
+
+        def read_chunks(table_name: str, columns: Optional[List[str]]):
+            if table_name not in table_files:
+                return iter(())
+            return __iter_table_chunks(
+                path,
+                table_files[table_name],
+                table_name,
+                extra_columns.get(table_name, ()),
+                FILTER_CHUNK_SIZE,
+                columns,
+                fix=False,
+            )
+
+        started = time.perf_counter()
+        with stage("gtfs.filter"):
+            tables = filter_tables(feed_filter, tables, read_chunks, TABLE_SCHEMAS)
+            # times are decoded only for kept rows
+            for table_name in STREAMED_TABLES:
+                if table_name in tables:
+                    tables[table_name] = __fix_table(tables[table_name], table_name)
+        load_timings["filter"] = time.perf_counter() - started
+
+    ids = None
+    if encode_ids:
+        with stage("gtfs.encode_ids"):
+            ids = __encode_ids(tables)
+
+    if cache is not None:
+        with stage("gtfs.cache_save"):
+            cache.save(cache_key, path, cache_options, tables, ids)
+
+    return __tables_to_gtfs(tables, ids, load_timings)
+
+
+def load_previous_version(
+    gtfs_path: str,
+    cache_dir: str,
+    extra_columns: Optional[Dict[str, Iterable[str]]] = None,
+    encode_ids: bool = False,
+    feed_filter: Optional[FeedFilter] = None,
+) -> Optional[GTFS]:
+    """
+    load the version of a feed cached before the source was modified, for incremental runs.
+    Call it before GTFSFactory with cache_dir, which removes the previous version as stale,
+    and tables are copied into memory not to map removed files.
+
+    Args:
+        gtfs_path: path of zip file or directory, same as GTFSFactory.
+        cache_dir: directory of cache, same as GTFSFactory.
+        extra_columns: same as GTFSFactory. Defaults to None.
+        encode_ids: same as GTFSFactory. Defaults to False.
+        feed_filter: same as GTFSFactory. Defaults to None.
+    Returns:
+        GTFS: previous version, None if it is not cached or the source is not modified.
+    """
     path = os.path.join(gtfs_path)
-    used_tables = {field.name for field in fields(GTFS)}
+    if not os.path.exists(path) or not os.path.isdir(cache_dir):
+        return None
+    cache = GTFSCache(cache_dir)
+    if feed_filter is not None and feed_filter.is_empty():
+        feed_filter = None
+    cache_options = __make_cache_options(extra_columns or {}, encode_ids, feed_filter)
+    previous_key = cache.find_previous(GTFSCache.make_key(path, cache_options), path, cache_options)
+    if previous_key is None:
+        return None
+    started = time.perf_counter()
+    with stage("gtfs.cache_load_previous"):
+        tables, ids = cache.load(previous_key)
+        tables = {table_name: df.copy() for table_name, df in tables.items()}
+    return __tables_to_gtfs(tables, ids, {"cache": time.perf_counter() - started})
+
+
+def make_cache_key(
+    gtfs_path: str,
+    extra_columns: Optional[Dict[str, Iterable[str]]] = None,
+    encode_ids: bool = False,
+    feed_filter: Optional[FeedFilter] = None,
+) -> str:
+    """
+    key of the cache entry of a feed loaded by GTFSFactory with same arguments,
+    which changes when the source is modified.
+    """
+    if feed_filter is not None and feed_filter.is_empty():
+        feed_filter = None
+    cache_options = __make_cache_options(extra_columns or {}, encode_ids, feed_filter)
+    return GTFSCache.make_key(os.path.join(gtfs_path), cache_options)
+
+
+def __make_cache_options(
+    extra_columns: Dict[str, Iterable[str]], encode_ids: bool, feed_filter: Optional[FeedFilter]
+) -> dict:
+    # options changing loaded tables, feed_filter is added only if given to keep keys of others
+    options = {"extra_columns": extra_columns, "encode_ids": encode_ids}
+    if feed_filter is not None:
+        options["feed_filter"] = asdict(feed_filter)
+    return options
+
+
+def __set_agency_id(agency: pd.DataFrame, routes: Optional[pd.DataFrame] = None):
+    # set agency_id when there is a single agency
+    if len(agency) == 1:
+        if "agency_id" not in agency.columns or pd.isnull(agency["agency_id"].iloc[0]):
+            # fill agency_id with empty str when it is missing or null
+            agency["agency_id"] = ""
+        # set agency_id to routes
+        if routes is not None:
+            routes["agency_id"] = agency["agency_id"].iloc[0]
+
+
+def __list_table_files(path: str) -> Dict[str, str]:
+    # table name -> file name in zip or directory
+    table_files = {}
     if os.path.isdir(path):
-        table_files = glob.glob(os.path.join(gtfs_path, "*.txt"))
-        for table_file in table_files:
-            table_name = os.path.splitext(os.path.basename(table_file))[0]
-            if table_name in used_tables:
-                with open(table_file, encoding="utf-8_sig") as f:
-                    tables[table_name] = load_df(f, table_name)
+        for table_file in glob.glob(os.path.join(path, "*.txt")):
+            file_name = os.path.basename(table_file)
+            table_name = os.path.splitext(file_name)[0]
+            if table_name in TABLE_NAMES:
+                table_files[table_name] = file_name
 
     elif os.path.isfile(path):
         with zipfile.ZipFile(path) as z:
@@ -72,27 +574,52 @@ def GTFSFactory(gtfs_path: str) -> GTFS:
                     and os.path.basename(file_name) == file_name
                 ):
                     table_name = os.path.splitext(os.path.basename(file_name))[0]
-                    if table_name in used_tables:
-                        with z.open(file_name) as f:
-                            tables[table_name] = load_df(f, table_name)
+                    if table_name in TABLE_NAMES:
+                        table_files[table_name] = file_name
     else:
         raise FileNotFoundError(f"zip file not found. ({path})")
+    return table_files
 
-    if len(tables) == 0:
-        raise FileNotFoundError(
-            "txt files must be in the root level directory, not in a sub folder."
-        )
 
-    # set agency_id when there is a single agency
-    if len(tables["agency"]) == 1:
-        if "agency_id" not in tables["agency"].columns or pd.isnull(
-            tables["agency"]["agency_id"].iloc[0]
-        ):
-            # fill agency_id with empty str when it is missing or null
-            tables["agency"]["agency_id"] = ""
-        # set agency_id to routes
-        tables["routes"]["agency_id"] = tables["agency"]["agency_id"].iloc[0]
+def __read_table(
+    path: str, file_name: str, table_name: str, extra_columns: Iterable[str]
+) -> Tuple[pd.DataFrame, float]:
+    # read a table with its own file handle, and return it with seconds taken
+    started = time.perf_counter()
+    with stage(f"gtfs.read_table.{table_name}") as s:
+        if os.path.isdir(path):
+            with open(os.path.join(path, file_name), encoding="utf-8_sig") as f:
+                df = load_df(f, table_name, extra_columns)
+        else:
+            with zipfile.ZipFile(path) as z, z.open(file_name) as f:
+                df = load_df(f, table_name, extra_columns)
+        s.rows = len(df)
+    return df, time.perf_counter() - started
+
+
+def __iter_table_chunks(
+    path: str,
+    file_name: str,
+    table_name: str,
+    extra_columns: Iterable[str],
+    chunk_size: int,
+    columns: Optional[Iterable[str]] = None,
+    fix: bool = True,
+) -> Iterator[pd.DataFrame]:
+    # stream a table in chunks, holding file handle while iterating
+    if os.path.isdir(path):
+        with open(os.path.join(path, file_name), encoding="utf-8_sig") as f:
+            yield from load_df(f, table_name, extra_columns, chunk_size, columns, fix)
+    else:
+        with zipfile.ZipFile(path) as z, z.open(file_name) as f:
+            yield from load_df(f, table_name, extra_columns, chunk_size, columns, fix)
+
 
+def __tables_to_gtfs(
+    tables: Dict[str, pd.DataFrame],
+    ids: Optional[Dict[str, pd.Index]],
+    load_timings: Dict[str, float],
+) -> GTFS:
     # if there are missing tables, exception is raised.
     gtfs = GTFS(
         agency=tables.get("agency"),
@@ -104,6 +631,8 @@ def GTFSFactory(gtfs_path: str) -> GTFS:
         calendar_dates=tables.get("calendar_dates"),
         feed_info=tables.get("feed_info"),
         shapes=tables.get("shapes"),
+        ids=ids,
+        load_timings=load_timings,
     )
 
     return gtfs
@@ -0,0 +1,362 @@
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from .geojson import FeatureTable
+from .gtfs import GTFS, ID_COLUMNS
+from .parse import read_routes_table, read_stops_table
+from .profiling import staged
+
+# key column of tables compared key by key, other tables are compared as a whole.
+# Rows of a key are compared as a set, stop_times of a trip are rows of its trip_id.
+TABLE_KEYS = {
+    "agency": "agency_id",
+    "routes": "route_id",
+    "trips": "trip_id",
+    "stop_times": "trip_id",
+    "stops": "stop_id",
+    "shapes": "shape_id",
+    "calendar": "service_id",
+    "calendar_dates": "service_id",
+}
+
+# multiplier combining hashes of columns into a hash of row
+HASH_MULTIPLIER = np.uint64(1_000_003)
+
+
+@dataclass
+class FeedDiff:
+    """
+    ids changed between two versions of a feed by key type, added, removed or modified.
+    A trip is changed by its row of trips or any of its stop_times,
+    a service by its row of calendar or any of its calendar_dates.
+
+    Attributes:
+        changed_tables (Set[str]): names of tables having any changes.
+    """
+
+    agency_ids: Set[str] = field(default_factory=set)
+    route_ids: Set[str] = field(default_factory=set)
+    trip_ids: Set[str] = field(default_factory=set)
+    stop_ids: Set[str] = field(default_factory=set)
+    shape_ids: Set[str] = field(default_factory=set)
+    service_ids: Set[str] = field(default_factory=set)
+    changed_tables: Set[str] = field(default_factory=set)
+
+    def is_empty(self) -> bool:
+        return len(self.changed_tables) == 0
+
+    def summary(self) -> dict:
+        """number of changed ids by key type"""
+        return {
+            name: len(getattr(self, name))
+            for name in ("agency_ids", "route_ids", "trip_ids", "stop_ids", "shape_ids", "service_ids")
+        }
+
+
+@staged("incremental.diff_feeds")
+def diff_feeds(old: GTFS, new: GTFS) -> FeedDiff:
+    """
+    Compare two versions of a feed table by table and key by key, by hashes of rows.
+    Feeds can be loaded with different options of encode_ids, ids are compared as str.
+
+    Args:
+        old (GTFS): previous version, like load_previous_version(path, cache_dir).
+        new (GTFS): current version.
+
+    Returns:
+        FeedDiff: changed ids by key type.
+    """
+    diff = FeedDiff()
+    table_names = [f.name for f in dataclasses.fields(GTFS) if f.name not in ("ids", "load_timings")]
+    for table_name in table_names:
+        old_df, new_df = getattr(old, table_name), getattr(new, table_name)
+        if old_df is None and new_df is None:
+            continue
+        key = TABLE_KEYS.get(table_name)
+        is_replaced = (
+            old_df is None or new_df is None or set(old_df.columns) != set(new_df.columns)
+        )
+        # times decoded into seconds are compared by seconds, faster than str
+        columns = [] if is_replaced else sorted(
+            column
+            for column in old_df.columns
+            if not (column.endswith("_time") and column.replace("_time", "_seconds") in old_df)
+        )
+        old_hashes = __hash_rows_by_key(old, old_df, key, columns)
+        new_hashes = __hash_rows_by_key(new, new_df, key, columns)
+        if is_replaced:
+            # all keys of both versions are changed
+            changed = old_hashes.index.union(new_hashes.index)
+        else:
+            common = old_hashes.index.intersection(new_hashes.index)
+            is_modified = old_hashes[common].to_numpy() != new_hashes[common].to_numpy()
+            changed = old_hashes.index.symmetric_difference(new_hashes.index).union(
+                common[is_modified]
+            )
+        if is_replaced or len(changed) > 0:
+            diff.changed_tables.add(table_name)
+        if key is not None:
+            getattr(diff, f"{key}s").update(changed)
+    return diff
+
+
+def __hash_rows_by_key(
+    gtfs: GTFS, df: Optional[pd.DataFrame], key: Optional[str], columns: List[str]
+) -> pd.Series:
+    # sum of hashes of rows by str key, with wraparound. A table without key has a key "".
+    if df is None:
+        return pd.Series([], index=pd.Index([], dtype=object), dtype=np.uint64)
+    row_hashes = np.zeros(len(df), dtype=np.uint64)
+    for column in columns:
+        row_hashes = row_hashes * HASH_MULTIPLIER ^ __hash_column(gtfs, df[column])
+    if key is None:
+        return pd.Series([row_hashes.sum(dtype=np.uint64)], index=pd.Index([""], dtype=object))
+
+    codes, keys = pd.factorize(df[key])
+    key_hashes = np.zeros(len(keys), dtype=np.uint64)
+    is_valid = codes >= 0
+    np.add.at(key_hashes, codes[is_valid], row_hashes[is_valid])
+    keys = gtfs.decode_ids(ID_COLUMNS[key], np.asarray(keys))
+    return pd.Series(key_hashes, index=pd.Index(keys, dtype=object))
+
+
+def __hash_column(gtfs: GTFS, sr: pd.Series) -> np.ndarray:
+    key_type = ID_COLUMNS.get(sr.name)
+    if gtfs.ids is None or key_type is None:
+        return pd.util.hash_array(sr.to_numpy())
+    # each id is hashed once as str, codes take hashes of their ids and -1 takes null
+    ids = np.append(gtfs.ids[key_type].to_numpy(dtype=object), None)
+    return pd.util.hash_array(ids)[sr.to_numpy()]
+
+
+def affected_trip_ids(old: GTFS, new: GTFS, diff: FeedDiff) -> Set[str]:
+    """
+    trip_ids whose counts of aggregation may change, changed trips and trips of
+    changed services or routes in either version.
+    """
+    trip_ids = set(diff.trip_ids)
+    for gtfs in (old, new):
+        trip_ids.update(__select_trips(gtfs, "service_id", diff.service_ids))
+        trip_ids.update(__select_trips(gtfs, "route_id", diff.route_ids))
+    return trip_ids
+
+
+def subset_trips(gtfs: GTFS, trip_ids: Iterable[str]) -> GTFS:
+    """GTFS of trips in trip_ids and their stop_times, other tables are shared"""
+    codes = __encode(gtfs, "trip_id", trip_ids)
+    return dataclasses.replace(
+        gtfs,
+        trips=gtfs.trips[gtfs.trips["trip_id"].isin(codes)],
+        stop_times=gtfs.stop_times[gtfs.stop_times["trip_id"].isin(codes)],
+    )
+
+
+@staged("incremental.patch_routes", rows=len)
+def patch_routes(
+    previous: FeatureTable, old: GTFS, new: GTFS, diff: FeedDiff, ignore_shapes=False
+) -> FeatureTable:
+    """
+    Patch features of read_routes_table on the old version into features on the new version,
+    features of routes affected by diff are made again and others are kept.
+
+    Args:
+        previous (FeatureTable): features of old, like read_features("routes.geojson").
+        old (GTFS): previous version of feed.
+        new (GTFS): current version of feed.
+        diff (FeedDiff): diff_feeds(old, new).
+        ignore_shapes (bool, optional): same as read_routes_table. Defaults to False.
+    """
+    if (old.shapes is None) != (new.shapes is None):
+        # all routes change between shapes and stops
+        return read_routes_table(new, ignore_shapes=ignore_shapes)
+    use_shapes = new.shapes is not None and not ignore_shapes
+
+    # routes of changed trips, and of trips on changed shapes or stops
+    route_ids = set(diff.route_ids)
+    shape_ids = set(diff.shape_ids)
+    for gtfs in (old, new):
+        route_ids.update(__select_trips(gtfs, "trip_id", diff.trip_ids, "route_id"))
+        if use_shapes:
+            route_ids.update(__select_trips(gtfs, "shape_id", diff.shape_ids, "route_id"))
+            shape_ids.update(__select_trips(gtfs, "trip_id", diff.trip_ids, "shape_id"))
+        else:
+            stop_codes = __encode(gtfs, "stop_id", diff.stop_ids)
+            stop_routes = gtfs.stop_routes
+            is_visiting = stop_routes["stop_id"].isin(stop_codes)
+            route_ids.update(gtfs.decode_ids("route_id", stop_routes["route_id"][is_visiting]))
+
+    trips = new.trips[new.trips["route_id"].isin(__encode(new, "route_id", route_ids))]
+    shapes = new.shapes
+    if use_shapes:
+        # shapes of the routes, and changed shapes not used by any trips
+        used_shapes = set(new.decode_ids("shape_id", new.trips["shape_id"].dropna()))
+        unused_shape_ids = shape_ids - used_shapes
+        shape_codes = np.concatenate([
+            trips["shape_id"].dropna().to_numpy(), __encode(new, "shape_id", unused_shape_ids)
+        ])
+        shapes = new.shapes[new.shapes["shape_id"].isin(shape_codes)]
+    stop_times = new.stop_times[new.stop_times["trip_id"].isin(trips["trip_id"])]
+    added = read_routes_table(
+        dataclasses.replace(new, trips=trips, shapes=shapes, stop_times=stop_times),
+        ignore_shapes=ignore_shapes,
+    )
+
+    kept = [
+        i
+        for i, (route_id, route_name) in enumerate(
+            zip(previous.properties.get("route_id", []), previous.properties.get("route_name", []))
+        )
+        # features of shapes not used by trips have route_id None and route_name of shape_id
+        if not (route_id in route_ids or (route_id is None and route_name in shape_ids))
+    ]
+    routes = __concat_tables([previous.take(kept), added])
+    # routes in order of route_id, then shapes not used by trips in order of shape_id
+    order = sorted(
+        range(len(routes)),
+        key=lambda i: (
+            routes.properties["route_id"][i] is None,
+            routes.properties["route_id"][i] or routes.properties["route_name"][i],
+        ),
+    )
+    return routes.take(order)
+
+
+@staged("incremental.patch_stops", rows=len)
+def patch_stops(
+    previous: FeatureTable, old: GTFS, new: GTFS, diff: FeedDiff, ignore_no_route=False
+) -> FeatureTable:
+    """
+    Patch features of read_stops_table on the old version into features on the new version,
+    changed stops and stops of changed trips are made again and others are kept.
+
+    Args:
+        previous (FeatureTable): features of old, like read_features("stops.geojson").
+        old (GTFS): previous version of feed.
+        new (GTFS): current version of feed.
+        diff (FeedDiff): diff_feeds(old, new).
+        ignore_no_route (bool, optional): same as read_stops_table. Defaults to False.
+    """
+    stop_ids = set(diff.stop_ids)
+    for gtfs in (old, new):
+        is_changed = gtfs.stop_times["trip_id"].isin(__encode(gtfs, "trip_id", diff.trip_ids))
+        stop_ids.update(gtfs.decode_ids("stop_id", gtfs.stop_times["stop_id"][is_changed]))
+
+    stop_codes = __encode(new, "stop_id", stop_ids)
+    added = read_stops_table(
+        dataclasses.replace(
+            new,
+            stops=new.stops[new.stops["stop_id"].isin(stop_codes)],
+            stop_times=new.stop_times[new.stop_times["stop_id"].isin(stop_codes)],
+        ),
+        ignore_no_route=ignore_no_route,
+    )
+    kept = [
+        i for i, stop_id in enumerate(previous.properties.get("stop_id", [])) if stop_id not in stop_ids
+    ]
+    stops = __concat_tables([previous.take(kept), added])
+
+    # stops in order of stops table
+    stop_positions = pd.Index(new.decode_ids("stop_id", new.stops["stop_id"]))
+    stop_positions = pd.Series(np.arange(len(stop_positions)), index=stop_positions)
+    stop_positions = stop_positions[~stop_positions.index.duplicated()]
+    positions = stop_positions.reindex(stops.properties["stop_id"]).fillna(len(stop_positions))
+    return stops.take(np.argsort(positions.to_numpy(), kind="stable").tolist())
+
+
+@staged("incremental.patch_route_frequency", rows=len)
+def patch_route_frequency(
+    previous: FeatureTable, old_part: FeatureTable, new_part: FeatureTable
+) -> FeatureTable:
+    """
+    Patch features of read_route_frequency_table on the old version into features on the new version.
+    Frequency is additive over trips, then frequency of changed trips in the old version is
+    subtracted and that in the new version is added. Stops and agencies must not be changed.
+
+    Args:
+        previous (FeatureTable): features of old, like read_features("aggregated_routes.geojson").
+        old_part (FeatureTable): read_route_frequency_table of affected trips in the old version,
+            like Aggregator(subset_trips(old, affected_trip_ids(old, new, diff))).
+        new_part (FeatureTable): read_route_frequency_table of affected trips in the new version.
+    """
+    return __patch_counts(
+        previous,
+        old_part,
+        new_part,
+        ["agency_id", "prev_stop_id", "next_stop_id"],
+        "frequency",
+        is_sorted=True,
+    )
+
+
+@staged("incremental.patch_interpolated_stops", rows=len)
+def patch_interpolated_stops(
+    previous: FeatureTable, old_part: FeatureTable, new_part: FeatureTable
+) -> FeatureTable:
+    """
+    Patch features of read_interpolated_stops_table on the old version into features
+    on the new version, same as patch_route_frequency for count of stops.
+    """
+    return __patch_counts(previous, old_part, new_part, ["similar_stop_id"], "count")
+
+
+def __patch_counts(previous, old_part, new_part, keys, value, is_sorted=False):
+    """
+    previous + new_part - old_part by keys, attributes are taken from new_part if it has the keys.
+    Keys of zero counts are dropped if is_sorted, then features are sorted by keys.
+    Otherwise features are in order of new_part, like similar stops of zero counts.
+    """
+    tables = [new_part, previous, old_part]
+    names = next((list(t.properties) for t in tables if t.properties), [*keys, value])
+    df = pd.concat(
+        [
+            t.to_dataframe().reindex(columns=[*names, "coordinates"]).assign(sign=sign)
+            for t, sign in zip(tables, (1, 1, -1))
+        ],
+        ignore_index=True,
+    )
+    df[value] = df[value].fillna(0).astype(int) * df["sign"]
+    counts = df.groupby(keys, sort=False, dropna=False)[value].sum()
+    df = df.drop_duplicates(subset=keys, keep="first").set_index(keys)
+    df[value] = counts
+    df = df.reset_index()
+    if is_sorted:
+        df = df[df[value] > 0].sort_values(keys, kind="stable")
+
+    geometry_type = next((t.geometry_type for t in tables if t.geometry_type is not None), None)
+    return FeatureTable.from_dataframe(geometry_type, df["coordinates"].tolist(), df, names)
+
+
+def __concat_tables(tables: List[FeatureTable]) -> FeatureTable:
+    # tables of same properties, a table read from an empty file has no properties.
+    tables = [t for t in tables if t.geometry_type is not None]
+    if len(tables) == 0:
+        return FeatureTable(None, [], {})
+    names = list(tables[-1].properties)
+    return FeatureTable(
+        tables[-1].geometry_type,
+        [c for t in tables for c in t.coordinates],
+        {name: [v for t in tables for v in t.properties[name]] for name in names},
+    )
+
+
+def __select_trips(
+    gtfs: GTFS, column: str, ids: Iterable[str], result_column: str = "trip_id"
+) -> Set[str]:
+    # values of result_column of trips whose column is in ids, as str
+    if column not in gtfs.trips or result_column not in gtfs.trips:
+        return set()
+    trips = gtfs.trips[gtfs.trips[column].isin(__encode(gtfs, ID_COLUMNS[column], ids))]
+    return set(gtfs.decode_ids(ID_COLUMNS[result_column], trips[result_column].dropna()))
+
+
+def __encode(gtfs: GTFS, key_type: str, ids: Iterable[str]) -> np.ndarray:
+    # str ids into values in tables of gtfs, unknown ids are dropped when coded
+    ids = np.array(list(ids), dtype=object)
+    if gtfs.ids is None:
+        return ids
+    codes = gtfs.ids[key_type].get_indexer(ids)
+    return codes[codes >= 0].astype(np.int32)
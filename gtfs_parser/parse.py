@@ -1,6 +1,12 @@
+from typing import Iterator
+
+import numpy as np
 import pandas as pd
 
+from .geojson import FeatureTable
 from .gtfs import GTFS
+from .patterns import ragged_offsets, ragged_slices
+from .profiling import staged
 
 
 def read_stops(gtfs: GTFS, ignore_no_route=False) -> list:
@@ -13,13 +19,25 @@ def read_stops(gtfs: GTFS, ignore_no_route=False) -> list:
     Returns:
         list: [description]
     """
+    return list(read_stops_table(gtfs, ignore_no_route=ignore_no_route))
+
+
+def iter_stops(gtfs: GTFS, ignore_no_route=False) -> Iterator[dict]:
+    """
+    generator variant of read_stops, features are made one by one.
+    """
+    yield from read_stops_table(gtfs, ignore_no_route=ignore_no_route)
+
+
+@staged("parse.read_stops", rows=len)
+def read_stops_table(gtfs: GTFS, ignore_no_route=False) -> FeatureTable:
+    """
+    columnar variant of read_stops, features are not made until iterated.
+    """
     # get unique list of route_id related to each stop
-    stop_trip_route_df = pd.merge(
-        gtfs.stop_times[["trip_id", "stop_id"]],
-        gtfs.trips[["trip_id", "route_id"]],
-        on="trip_id",
+    stop_route_df = gtfs.stop_routes.assign(
+        route_id=gtfs.decode_ids("route_id", gtfs.stop_routes["route_id"])
     )
-    stop_route_df = stop_trip_route_df[["stop_id", "route_id"]].drop_duplicates()
     route_ids_on_stops = (
         stop_route_df.groupby("stop_id")["route_id"].apply(list).rename("route_ids")
     )
@@ -32,26 +50,15 @@ def read_stops(gtfs: GTFS, ignore_no_route=False) -> list:
     else:
         # fill na with empty list
         route_stop["route_ids"] = route_stop["route_ids"].fillna("").apply(list)
+    route_stop["stop_id"] = gtfs.decode_ids("stop_id", route_stop["stop_id"])
 
     # parse stops to GeoJSON-Features
-    stop_dics = route_stop.to_dict(orient="records")
-    features = [
-        {
-            "type": "Feature",
-            "geometry": {
-                "type": "Point",
-                "coordinates": [row["stop_lon"], row["stop_lat"]],
-            },
-            "properties": {
-                "stop_id": row["stop_id"],
-                "stop_name": row["stop_name"],
-                "route_ids": row["route_ids"],
-            },
-        }
-        for row in stop_dics
-    ]
-
-    return features
+    return FeatureTable.from_dataframe(
+        "Point",
+        route_stop[["stop_lon", "stop_lat"]].values.tolist(),
+        route_stop,
+        ["stop_id", "stop_name", "route_ids"],
+    )
 
 
 def read_routes(gtfs: GTFS, ignore_shapes=False) -> list:
@@ -67,11 +74,26 @@ def read_routes(gtfs: GTFS, ignore_shapes=False) -> list:
     Returns:
         [list]: list of GeoJSON-Feature-dict
     """
+    return list(read_routes_table(gtfs, ignore_shapes=ignore_shapes))
 
+
+def iter_routes(gtfs: GTFS, ignore_shapes=False) -> Iterator[dict]:
+    """
+    generator variant of read_routes, features are made one by one.
+    """
+    yield from read_routes_table(gtfs, ignore_shapes=ignore_shapes)
+
+
+@staged("parse.read_routes", rows=len)
+def read_routes_table(gtfs: GTFS, ignore_shapes=False) -> FeatureTable:
+    """
+    columnar variant of read_routes, features are not made until iterated.
+    """
     if gtfs.shapes is None or ignore_shapes:
-        return __read_routes_ignore_shapes(gtfs)
+        multiline_df = __read_routes_ignore_shapes(gtfs)
     else:
-        return __read_route_shapes(gtfs)
+        multiline_df = __read_route_shapes(gtfs)
+    return __route_multiline_df_to_features(multiline_df)
 
 
 def __read_route_shapes(gtfs):
@@ -83,23 +105,22 @@ def __read_route_shapes(gtfs):
         .sort_values(["route_id", "shape_id"])
     )
 
-    # get shape coordinate
-    shapes_df = gtfs.shapes.copy()
-    shapes_df["shape_pt"] = list(
-        zip(shapes_df["shape_pt_lon"], shapes_df["shape_pt_lat"])
+    # get shape coordinate, lines are slices of points sorted by shape_id and sequence
+    offsets, order, shape_ids = ragged_offsets(
+        gtfs.shapes["shape_id"], gtfs.shapes["shape_pt_sequence"]
     )
-    shapes_df = shapes_df.sort_values(["shape_id", "shape_pt_sequence"])
-    shape_lines = (
-        shapes_df.groupby("shape_id")["shape_pt"]
-        .apply(lambda x: x.tolist())
-        .rename("line")
+    shape_pts = gtfs.shapes[["shape_pt_lon", "shape_pt_lat"]].to_numpy()[order]
+    shape_lines = pd.Series(
+        ragged_slices(shape_pts, offsets),
+        index=shape_ids.rename("shape_id"),
+        name="line",
     )
 
     # merge
     route_line_df = pd.merge(shape_ids_on_routes, shape_lines, on="shape_id")
     route_lines = route_line_df.set_index("route_id")["line"]
 
-    features = __route_lines_to_features(route_lines, gtfs.routes)
+    multiline_df = __route_lines_to_multiline_df(route_lines, gtfs)
 
     # load shapes unloaded yet
     unloaded_shape_lines = shape_lines[
@@ -107,63 +128,62 @@ def __read_route_shapes(gtfs):
     ]
     if len(unloaded_shape_lines) > 0:
         # fill id, name with shape_id, line to multiline
-        multiline_df = pd.DataFrame(
+        unloaded_multiline_df = pd.DataFrame(
             {
                 "route_id": None,
-                "route_name": unloaded_shape_lines.index,
+                "route_name": gtfs.decode_ids(
+                    "shape_id", unloaded_shape_lines.index
+                ),
                 "multiline": unloaded_shape_lines.apply(lambda x: [x]),
             }
         )
-
-        unloaded_features = __route_multiline_df_to_features(multiline_df)
-        features.extend(unloaded_features)
-    return features
+        multiline_df = pd.concat(
+            [multiline_df, unloaded_multiline_df], ignore_index=True
+        )
+    return multiline_df
 
 
 def __read_routes_ignore_shapes(gtfs):
-    # generate stop patterns
-    sorted_stop_times = gtfs.stop_times.sort_values(["trip_id", "stop_sequence"])
-    trip_stop_pattern = (
-        sorted_stop_times.groupby("trip_id")["stop_id"]
-        .agg(tuple)
-        .rename("stop_pattern")
+    # unique stop patterns by route_id, stops of a pattern are stored once
+    patterns = gtfs.trip_patterns
+    trip_indices = patterns.trip_ids.get_indexer(gtfs.trips["trip_id"])
+    is_known_trip = trip_indices >= 0
+    route_patterns = (
+        pd.DataFrame(
+            {
+                "route_id": gtfs.trips["route_id"].to_numpy()[is_known_trip],
+                "stop_pattern": patterns.trip_patterns[trip_indices[is_known_trip]],
+            }
+        )
+        .drop_duplicates()
+        .dropna(subset=["route_id"])
+        .sort_values(["route_id", "stop_pattern"])
     )
 
-    # unique stop pattens by route_id
-    route_trip_stop_pattern = pd.merge(
-        trip_stop_pattern, gtfs.trips[["trip_id", "route_id"]], on="trip_id"
+    # append geometry to stops, stops not in stops table are skipped.
+    stops = gtfs.stops.drop_duplicates(subset="stop_id")
+    stop_indices = pd.Index(stops["stop_id"]).get_indexer(patterns.stop_ids)
+    stop_indices = np.where(
+        patterns.pattern_stops >= 0, stop_indices[patterns.pattern_stops], -1
     )
-    route_stop_patterns = route_trip_stop_pattern[
-        ["route_id", "stop_pattern"]
-    ].drop_duplicates()
-
-    # explode stop patterns to stop ids
-    route_stop_patterns["stop_id"] = route_stop_patterns["stop_pattern"]
-    route_stop_ids = route_stop_patterns.explode("stop_id")
-
-    # append geometry to stops
-    stop_geoms = pd.Series(
-        data=zip(gtfs.stops["stop_lon"], gtfs.stops["stop_lat"]),
+    stop_pts = stops[["stop_lon", "stop_lat"]].to_numpy()[stop_indices]
+
+    # Point -> LineString: slice points of each stop pattern
+    is_known = stop_indices >= 0
+    lines = np.empty(len(route_patterns), dtype=object)
+    for i, pattern in enumerate(route_patterns["stop_pattern"]):
+        start, end = patterns.pattern_offsets[pattern], patterns.pattern_offsets[pattern + 1]
+        lines[i] = stop_pts[start:end][is_known[start:end]]
+    route_lines = pd.Series(
+        lines,
+        index=pd.MultiIndex.from_frame(route_patterns),
         name="stop_pt",
-        index=gtfs.stops["stop_id"],
-    )
-
-    # join geomtry to route stops
-    route_stop_ids["order"] = range(len(route_stop_ids))
-    route_stop_geoms = pd.merge(
-        route_stop_ids,
-        stop_geoms,
-        on="stop_id",
-    ).sort_values("order")
-
-    # Point -> LineString: group by route_id and stop_pattern
-    route_lines = route_stop_geoms.groupby(["route_id", "stop_pattern"])["stop_pt"].agg(
-        list
     )
-    return __route_lines_to_features(route_lines, gtfs.routes)
+    route_lines = route_lines[route_lines.map(len) > 0]
+    return __route_lines_to_multiline_df(route_lines, gtfs)
 
 
-def __route_lines_to_features(route_lines, routes):
+def __route_lines_to_multiline_df(route_lines, gtfs):
     # group by route_id into MultiLineString
     multilines = (
         route_lines.groupby(["route_id"])
@@ -173,30 +193,20 @@ def __route_lines_to_features(route_lines, routes):
     # join route_id and route_name
     multiline_df = pd.merge(
         multilines,
-        routes[["route_id", "route_long_name", "route_short_name"]],
+        gtfs.routes[["route_id", "route_long_name", "route_short_name"]],
         on="route_id",
     )
+    multiline_df["route_id"] = gtfs.decode_ids("route_id", multiline_df["route_id"])
     multiline_df["route_name"] = multiline_df["route_long_name"].fillna(
         ""
     ) + multiline_df["route_short_name"].fillna("")
-
-    return __route_multiline_df_to_features(multiline_df)
+    return multiline_df
 
 
 def __route_multiline_df_to_features(multiline_df):
-    dicts = multiline_df.to_dict(orient="records")
-    features = [
-        {
-            "type": "Feature",
-            "geometry": {
-                "type": "MultiLineString",
-                "coordinates": row["multiline"],
-            },
-            "properties": {
-                "route_id": row["route_id"],
-                "route_name": row["route_name"],
-            },
-        }
-        for row in dicts
-    ]
-    return features
+    return FeatureTable.from_dataframe(
+        "MultiLineString",
+        multiline_df["multiline"].tolist(),
+        multiline_df,
+        ["route_id", "route_name"],
+    )
@@ -0,0 +1,199 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# seconds of null or malformed times
+NULL_SECONDS = np.iinfo(np.int32).min
+
+
+def parse_times(times: pd.Series) -> np.ndarray:
+    """
+    decode times in "hh:mm:ss" or "h:mm:ss" format into int32 seconds from 00:00:00
+    of the service day. Hour can be more than 24, null and malformed times are NULL_SECONDS.
+    Each unique time is decoded once, feeds have far fewer unique times than stop_times.
+    """
+    codes, uniques = pd.factorize(times)
+    hms = pd.Series(uniques, dtype=object).str.extract(r"(\d+):(\d+):(\d+)").astype(float)
+    seconds = (hms[0] * 3600 + hms[1] * 60 + hms[2]).to_numpy()
+    seconds = np.where(np.isnan(seconds), NULL_SECONDS, np.nan_to_num(seconds)).astype(np.int32)
+    # code of null is -1, which takes the last
+    return np.append(seconds, np.int32(NULL_SECONDS))[codes]
+
+
+def time_to_seconds(times: pd.Series) -> pd.Series:
+    """
+    convert times in "hh:mm:ss" or "h:mm:ss" format into seconds from 00:00:00.
+    Hour can be more than 24, null is kept as NaN.
+    """
+    return pd.Series(seconds_to_float(parse_times(times)), index=times.index)
+
+
+def seconds_to_float(seconds: np.ndarray) -> np.ndarray:
+    """int32 seconds into float, NULL_SECONDS into NaN"""
+    seconds = np.asarray(seconds)
+    if seconds.dtype.kind == "f":
+        return seconds
+    return np.where(seconds == NULL_SECONDS, np.nan, seconds)
+
+
+def stop_times_seconds(stop_times: pd.DataFrame, column: str = "departure_time") -> np.ndarray:
+    """
+    int32 seconds of a time column of stop_times, like departure_time.
+    Seconds decoded on loading are used, times are decoded if stop_times are built otherwise.
+    """
+    seconds_column = column.replace("_time", "_seconds")
+    if seconds_column in stop_times:
+        return stop_times[seconds_column].to_numpy()
+    return parse_times(stop_times[column])
+
+
+def ragged_offsets(
+    keys: pd.Series, sequences: pd.Series
+) -> Tuple[np.ndarray, np.ndarray, pd.Index]:
+    """
+    Ragged array layout of rows grouped by keys and ordered by sequences.
+    Rows sorted by order are contiguous by key, and rows of i-th key are
+    order[offsets[i]:offsets[i + 1]]. Rows of null keys are excluded.
+
+    Returns:
+        offsets, order and sorted unique keys.
+    """
+    codes, unique_keys = pd.factorize(keys, sort=True)
+    rows = np.flatnonzero(codes >= 0)
+    codes = codes[rows]
+    sequences = np.asarray(sequences)[rows]
+
+    # sort by a key packing code and sequence into int64 if it fits, faster than lexsort
+    if len(rows) > 0 and sequences.dtype.kind in "iu":
+        sequences = sequences.astype(np.int64) - sequences.min()
+        span = int(sequences.max()) + 1
+        if span * len(unique_keys) < 2**62:
+            order = np.argsort(codes.astype(np.int64) * span + sequences, kind="stable")
+        else:
+            order = np.lexsort((sequences, codes))
+    else:
+        order = np.lexsort((sequences, codes))
+    offsets = np.searchsorted(codes[order], np.arange(len(unique_keys) + 1))
+    return offsets, rows[order], pd.Index(unique_keys)
+
+
+def ragged_slices(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """object array of values[offsets[i]:offsets[i + 1]], views of values"""
+    slices = np.empty(len(offsets) - 1, dtype=object)
+    for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        slices[i] = values[start:end]
+    return slices
+
+
+def ragged_gather(offsets: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    positions of rows of indices-th groups in a ragged layout, concatenated,
+    and offsets of the groups in them.
+    """
+    lengths = offsets[indices + 1] - offsets[indices]
+    gathered_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    positions = np.repeat(offsets[indices] - gathered_offsets[:-1], lengths) + np.arange(
+        gathered_offsets[-1]
+    )
+    return positions, gathered_offsets
+
+
+class TripPatterns:
+    """
+    index of unique stop patterns of trips, derived from stop_times which are kept as they are.
+    Trips of same sequence of stops share a pattern, stored once, then counts by stops and paths
+    are made by patterns instead of stop_times. Times are not indexed, they are rarely shared by trips.
+
+    Args:
+        trip_ids (pd.Series): trip_id of stop_times.
+        stop_sequences (pd.Series): stop_sequence of stop_times.
+        stop_ids (pd.Series): stop_id of stop_times.
+        layout (tuple, optional): ragged_offsets of trip_ids and stop_sequences
+            if they are sorted already. Defaults to None.
+
+    Attributes:
+        trip_ids (pd.Index): sorted trip_id of trips.
+        trip_patterns (np.ndarray): pattern of each trip.
+        stop_ids (pd.Index): sorted stop_id, stops of patterns are coded by them.
+        pattern_offsets (np.ndarray): stops of i-th pattern are
+            pattern_stops[pattern_offsets[i]:pattern_offsets[i + 1]].
+        pattern_stops (np.ndarray): codes of stops of patterns, concatenated.
+    """
+
+    def __init__(self, trip_ids, stop_sequences, stop_ids, layout=None):
+        if layout is None:
+            layout = ragged_offsets(trip_ids, stop_sequences)
+        offsets, order, self.trip_ids = layout
+        self.trip_ids = self.trip_ids.rename("trip_id")
+        stop_codes, self.stop_ids = pd.factorize(np.asarray(stop_ids)[order], sort=True)
+        self.stop_ids = pd.Index(self.stop_ids, name="stop_id")
+        stop_codes = stop_codes.astype(np.int32)
+
+        # Bytes of big-endian codes compare as tuples of stop_ids, then patterns are sorted
+        # by their sequences of stops.
+        stop_bytes = stop_codes.astype(">i4")
+        pattern_keys = [
+            stop_bytes[start:end].tobytes() for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        self.trip_patterns, _ = pd.factorize(pd.Series(pattern_keys, dtype=object), sort=True)
+        self.trip_patterns = self.trip_patterns.astype(np.int32)
+
+        # stops of patterns, taken from the first trip of each pattern
+        _, first_trips = np.unique(self.trip_patterns, return_index=True)
+        positions, self.pattern_offsets = ragged_gather(offsets, first_trips)
+        self.pattern_stops = stop_codes[positions]
+
+    def __len__(self):
+        """number of trips"""
+        return len(self.trip_ids)
+
+    @property
+    def num_patterns(self) -> int:
+        return len(self.pattern_offsets) - 1
+
+    def get_pattern_stop_ids(self, pattern: int) -> np.ndarray:
+        """stop_ids of a pattern in order"""
+        start, end = self.pattern_offsets[pattern], self.pattern_offsets[pattern + 1]
+        return self.stop_ids.to_numpy()[self.pattern_stops[start:end]]
+
+    def count_trips(self, trip_mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """number of trips by pattern, trips can be selected by a bool mask"""
+        trip_patterns = self.trip_patterns if trip_mask is None else self.trip_patterns[trip_mask]
+        return np.bincount(trip_patterns, minlength=self.num_patterns)
+
+    def count_stop_pass(self, trip_mask: Optional[np.ndarray] = None) -> pd.Series:
+        """
+        number of stop_times by stop_id, as pattern frequency multiplied by stops of patterns.
+        Stops without stop_times are not included.
+        """
+        stop_weights = np.repeat(self.count_trips(trip_mask), np.diff(self.pattern_offsets))
+        is_valid = self.pattern_stops >= 0
+        counts = np.bincount(
+            self.pattern_stops[is_valid], weights=stop_weights[is_valid], minlength=len(self.stop_ids)
+        ).astype(int)
+        return pd.Series(counts, index=self.stop_ids, name="count")[counts > 0]
+
+    def get_segments(self, is_kept_stop: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        segments between consecutive stops of patterns.
+        Stops are skipped when not kept, then segments pass over them.
+
+        Args:
+            is_kept_stop (np.ndarray): bool by codes of stops.
+        Returns:
+            patterns of segments, codes of prev stops and codes of next stops.
+        """
+        pattern_of_stops = np.repeat(
+            np.arange(self.num_patterns, dtype=np.int32), np.diff(self.pattern_offsets)
+        )
+        positions = np.flatnonzero(
+            (self.pattern_stops >= 0) & is_kept_stop[np.maximum(self.pattern_stops, 0)]
+        )
+        patterns = pattern_of_stops[positions]
+        is_same_pattern = patterns[:-1] == patterns[1:]
+        return (
+            patterns[:-1][is_same_pattern],
+            self.pattern_stops[positions[:-1][is_same_pattern]],
+            self.pattern_stops[positions[1:][is_same_pattern]],
+        )
@@ -0,0 +1,194 @@
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+
+@dataclass
+class StageRecord:
+    """
+    measurement of a named stage, passed to hooks when the stage ends.
+
+    Attributes:
+        name (str): name of the stage, like "aggregate.unify_similar_stops".
+        path (str): names of enclosing stages and the stage joined by "/".
+        depth (int): number of enclosing stages.
+        started (float): time.perf_counter() at the start.
+        seconds (float): wall time of the stage.
+        rows (Optional[int]): number of rows the stage made or read, if reported.
+        peak_bytes (Optional[int]): peak of memory traced by tracemalloc in the stage,
+            None if tracemalloc is not tracing.
+    """
+
+    name: str
+    path: str
+    depth: int
+    started: float = 0.0
+    seconds: float = 0.0
+    rows: Optional[int] = None
+    peak_bytes: Optional[int] = None
+
+
+# callbacks called with StageRecord, stages are not measured while this is empty
+_hooks: List[Callable[[StageRecord], None]] = []
+# stack of running stages by thread
+_local = threading.local()
+
+
+def add_hook(hook: Callable[[StageRecord], None]):
+    """call hook with a StageRecord at the end of each stage, in the thread running the stage"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[StageRecord], None]):
+    _hooks.remove(hook)
+
+
+class _NullStage:
+    """stage without hooks, reported rows are dropped"""
+
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name: str, rows: Optional[int]):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.record = StageRecord(
+            self.name, "/".join([s.name for s in stack] + [self.name]), len(stack)
+        )
+        self.peak_bytes = None
+        if tracemalloc.is_tracing():
+            # peak of enclosing stage so far is kept before peak is reset for this stage
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if stack and stack[-1].peak_bytes is not None:
+                stack[-1].peak_bytes = max(stack[-1].peak_bytes, self.peak_bytes)
+            tracemalloc.reset_peak()
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        stack = _local.stack
+        stack.pop()
+        if self.peak_bytes is not None and tracemalloc.is_tracing():
+            self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+            if stack and stack[-1].peak_bytes is not None:
+                stack[-1].peak_bytes = max(stack[-1].peak_bytes, self.peak_bytes)
+            tracemalloc.reset_peak()
+        self.record.started = self.started
+        self.record.seconds = seconds
+        self.record.rows = self.rows
+        self.record.peak_bytes = self.peak_bytes
+        for hook in list(_hooks):
+            hook(self.record)
+        return False
+
+
+def stage(name: str, rows: Optional[int] = None):
+    """
+    context manager measuring a named stage for hooks, rows can be set to it in the stage.
+    It costs an empty check only while no hooks are added.
+
+        with stage("aggregate.unify_similar_stops") as s:
+            ...
+            s.rows = len(similar_stops)
+    """
+    if not _hooks:
+        return _NULL_STAGE
+    return _Stage(name, rows)
+
+
+def staged(name: str, rows: Optional[Callable] = None):
+    """
+    decorator measuring each call of a function as a stage,
+    rows of the stage are rows(result) if rows is given, like len.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _hooks:
+                return func(*args, **kwargs)
+            with _Stage(name, None) as s:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    s.rows = rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class Profiler:
+    """
+    Collect StageRecords while used as context manager.
+    Peak memory is measured by tracemalloc when memory is True, which slows stages.
+
+        with Profiler() as profiler:
+            aggregator = Aggregator(gtfs)
+        profiler.print_report()
+    """
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.records: List[StageRecord] = []
+        self.__started_tracing = False
+
+    def __call__(self, record: StageRecord):
+        self.records.append(record)
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_hook(self)
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+        return False
+
+    def report(self) -> List[dict]:
+        """records as dicts in order of their ends"""
+        return [asdict(record) for record in self.records]
+
+    def dump(self, path: str):
+        with open(path, mode="w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+    def print_report(self):
+        # stages end after their inner stages, then records are printed in order of their starts
+        for record in sorted(self.records, key=lambda r: r.started):
+            line = "  " * record.depth + f"{record.name}: {record.seconds:.3f}s"
+            if record.rows is not None:
+                line += f", {record.rows} rows"
+            if record.peak_bytes is not None:
+                line += f", peak {record.peak_bytes / 1024**2:.1f}MiB"
+            print(line)
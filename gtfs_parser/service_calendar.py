@@ -0,0 +1,173 @@
+import datetime
+from typing import Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+
+WEEKDAYS = [
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"
+]
+# number of days of a block to build bitmap, multiple of 8
+BLOCK_DAYS = 4096
+# number of set bits by byte value
+POPCOUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def to_datetime64(yyyymmdd: str) -> np.datetime64:
+    date = datetime.date(int(yyyymmdd[0:4]), int(yyyymmdd[4:6]), int(yyyymmdd[6:8]))
+    return np.datetime64(date, "D")
+
+
+def to_datetime64_array(yyyymmdd: pd.Series) -> np.ndarray:
+    return pd.to_datetime(yyyymmdd, format="%Y%m%d").to_numpy().astype("datetime64[D]")
+
+
+def date_range(begin_yyyymmdd: str, end_yyyymmdd: str) -> List[str]:
+    """dates from begin to end, both inclusive, as yyyymmdd"""
+    dates = np.arange(
+        to_datetime64(begin_yyyymmdd), to_datetime64(end_yyyymmdd) + np.timedelta64(1, "D"), dtype="datetime64[D]"
+    )
+    return [date.strftime("%Y%m%d") for date in dates.astype(datetime.date)]
+
+
+class ServiceCalendar:
+    """
+    Activity of services by days over validity period of calendar and calendar_dates,
+    as a bitmap of services x days. Exceptions in calendar_dates are already applied.
+
+    Args:
+        calendar (pd.DataFrame, optional): calendar table.
+        calendar_dates (pd.DataFrame, optional): calendar_dates table.
+    """
+
+    def __init__(self, calendar=None, calendar_dates=None):
+        service_id_arrays = [
+            table["service_id"].to_numpy()
+            for table in (calendar, calendar_dates)
+            if table is not None
+        ]
+        self.service_ids = pd.Index(
+            pd.unique(np.concatenate(service_id_arrays)) if service_id_arrays else [],
+            name="service_id",
+        )
+
+        if calendar is not None:
+            starts = to_datetime64_array(calendar["start_date"])
+            ends = to_datetime64_array(calendar["end_date"])
+        else:
+            starts = ends = np.array([], dtype="datetime64[D]")
+        if calendar_dates is not None:
+            exception_dates = to_datetime64_array(calendar_dates["date"])
+        else:
+            exception_dates = np.array([], dtype="datetime64[D]")
+
+        all_dates = np.concatenate([starts, ends, exception_dates])
+        if len(all_dates) == 0:
+            self.first_date = np.datetime64("1970-01-01", "D")
+            self.num_days = 0
+        else:
+            self.first_date = all_dates.min()
+            self.num_days = int((all_dates.max() - self.first_date).astype(int)) + 1
+
+        self.bits = np.zeros(
+            (len(self.service_ids), (self.num_days + 7) // 8), dtype=np.uint8
+        )
+        if calendar is not None:
+            self.__set_calendar(calendar, starts, ends)
+        if calendar_dates is not None:
+            self.__apply_exceptions(calendar_dates, exception_dates)
+
+    def __set_calendar(self, calendar, starts, ends):
+        rows = self.service_ids.get_indexer(calendar["service_id"])
+        weekday_flags = calendar[WEEKDAYS].to_numpy() == "1"
+        start_days = (starts - self.first_date).astype(int)
+        end_days = (ends - self.first_date).astype(int)
+
+        for block_start in range(0, self.num_days, BLOCK_DAYS):
+            days = np.arange(block_start, min(block_start + BLOCK_DAYS, self.num_days))
+            weekdays = self.__weekdays(days)
+            active = (
+                weekday_flags[:, weekdays]
+                & (start_days[:, None] <= days)
+                & (days <= end_days[:, None])
+            )
+            packed = np.packbits(active, axis=1)
+            # service_id may be duplicated in calendar, then activities are merged.
+            np.bitwise_or.at(
+                self.bits,
+                (rows[:, None], block_start // 8 + np.arange(packed.shape[1])),
+                packed,
+            )
+
+    def __apply_exceptions(self, calendar_dates, exception_dates):
+        rows = self.service_ids.get_indexer(calendar_dates["service_id"])
+        days = (exception_dates - self.first_date).astype(int)
+        bytes_, masks = days >> 3, (1 << (7 - (days & 7))).astype(np.uint8)
+
+        # removed first, then added
+        is_removed = (calendar_dates["exception_type"] == "2").to_numpy()
+        np.bitwise_and.at(
+            self.bits, (rows[is_removed], bytes_[is_removed]), ~masks[is_removed]
+        )
+        is_added = (calendar_dates["exception_type"] == "1").to_numpy()
+        np.bitwise_or.at(self.bits, (rows[is_added], bytes_[is_added]), masks[is_added])
+
+    def __weekdays(self, days: np.ndarray) -> np.ndarray:
+        # 0 is monday, 1970-01-01 was thursday
+        return (days + (self.first_date.astype(int) + 3)) % 7
+
+    def get_dates(self) -> List[str]:
+        """all dates of validity period, as yyyymmdd"""
+        if self.num_days == 0:
+            return []
+        last_date = self.first_date + np.timedelta64(self.num_days - 1, "D")
+        return date_range(
+            self.first_date.astype(datetime.date).strftime("%Y%m%d"),
+            last_date.astype(datetime.date).strftime("%Y%m%d"),
+        )
+
+    def get_day_index(self, yyyymmdd: str) -> int:
+        """index of a date in bitmap, -1 if it is out of validity period"""
+        day = int((to_datetime64(yyyymmdd) - self.first_date).astype(int))
+        return day if 0 <= day < self.num_days else -1
+
+    def __active_by_days(self, days: Iterable[int]) -> np.ndarray:
+        # services x days bool matrix of given days
+        days = np.asarray([day for day in days if day >= 0], dtype=np.int64)
+        shifts = (7 - (days & 7)).astype(np.uint8)
+        return ((self.bits[:, days >> 3] >> shifts) & 1).astype(bool)
+
+    def is_active(self, service_ids, yyyymmdd: Union[str, Iterable[str]]) -> np.ndarray:
+        """
+        whether services are active on a date, or any of dates.
+
+        Args:
+            service_ids: array-like of service_id, like trips["service_id"].
+            yyyymmdd: date like 20210401, or iterable of them.
+        Returns:
+            np.ndarray: bool array of same length as service_ids.
+        """
+        dates = [yyyymmdd] if isinstance(yyyymmdd, str) else yyyymmdd
+        days = [self.get_day_index(date) for date in dates]
+        active = self.__active_by_days(days).any(axis=1)
+        rows = self.service_ids.get_indexer(service_ids)
+        is_active = np.zeros(len(rows), dtype=bool)
+        is_active[rows >= 0] = active[rows[rows >= 0]]
+        return is_active
+
+    def get_service_ids_on(self, yyyymmdd: str) -> pd.Index:
+        """service_ids active on a date"""
+        return self.service_ids[self.is_active(self.service_ids, yyyymmdd)]
+
+    def get_service_days(self, service_id) -> List[str]:
+        """dates when a service is active, as yyyymmdd"""
+        row = self.service_ids.get_loc(service_id)
+        days = np.flatnonzero(np.unpackbits(self.bits[row])[: self.num_days])
+        dates = self.first_date + days.astype("timedelta64[D]")
+        return [date.strftime("%Y%m%d") for date in dates.astype(datetime.date)]
+
+    def count_service_days(self) -> pd.Series:
+        """number of days when each service is active"""
+        # bits after the last day are always 0
+        counts = POPCOUNTS[self.bits].sum(axis=1)
+        return pd.Series(counts, index=self.service_ids, name="service_days")
@@ -0,0 +1,203 @@
+import datetime
+import io
+import os
+import zipfile
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# stop_times rows written at once
+WRITE_CHUNK_ROWS = 1_000_000
+# distance between neighboring stops of the grid, approx. 200m, within max_distance_degree of Aggregator
+STOP_INTERVAL_DEGREE = 0.002
+
+
+def generate_feed(
+    dst: str,
+    num_stops: int = 900,
+    num_routes: int = 10,
+    trips_per_route: int = 20,
+    stops_per_route: int = 20,
+    shape_points_per_route: int = 200,
+    num_services: int = 3,
+    num_exceptions: int = 10,
+    start_date: str = "20210401",
+    num_days: int = 365,
+    seed: int = 0,
+) -> Dict[str, int]:
+    """
+    Write a deterministic synthetic GTFS feed, same arguments make same files.
+    Stops are on a grid, and each pair of neighbors shares stop_name to be unified.
+    A route runs along a row or column of the grid, trips go and return alternately
+    with a shape for each direction.
+    Services run on random days of week, and exceptions are added by calendar_dates.
+
+    Args:
+        dst (str): directory of txt files, or path of zip file if it ends with ".zip".
+        num_stops (int, optional): number of stops. Defaults to 900.
+        num_routes (int, optional): number of routes. Defaults to 10.
+        trips_per_route (int, optional): number of trips of each route. Defaults to 20.
+        stops_per_route (int, optional): number of stops of each trip,
+            limited by a side of the grid of stops. Defaults to 20.
+        shape_points_per_route (int, optional): number of points of each shape. Defaults to 200.
+        num_services (int, optional): number of service_id in calendar. Defaults to 3.
+        num_exceptions (int, optional): number of rows of calendar_dates. Defaults to 10.
+        start_date (str, optional): first date of calendar, like 20210401. Defaults to "20210401".
+        num_days (int, optional): number of days of calendar. Defaults to 365.
+        seed (int, optional): seed of random numbers. Defaults to 0.
+
+    Returns:
+        Dict[str, int]: number of rows by table name.
+    """
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(num_stops)))
+    stops_per_route = min(stops_per_route, side)
+
+    stop_ids = np.array([f"stop_{i:08d}" for i in range(num_stops)], dtype=object)
+    stop_rows, stop_cols = np.divmod(np.arange(num_stops), side)
+    stops = pd.DataFrame({
+        "stop_id": stop_ids,
+        "stop_name": [f"stop {i // 2}" for i in range(num_stops)],
+        "stop_lat": 35.0 + stop_rows * STOP_INTERVAL_DEGREE + rng.normal(0, 0.0001, num_stops),
+        "stop_lon": 139.0 + stop_cols * STOP_INTERVAL_DEGREE + rng.normal(0, 0.0001, num_stops),
+        "location_type": 0,
+        "parent_station": "",
+    })
+
+    # routes run along a row or a column of grid from a random stop
+    route_ids = np.array([f"route_{i:06d}" for i in range(num_routes)], dtype=object)
+    is_vertical = rng.random(num_routes) < 0.5
+    route_lines = rng.integers(0, side, num_routes)
+    route_starts = rng.integers(0, side - stops_per_route + 1, num_routes)
+    steps = route_starts[:, None] + np.arange(stops_per_route)
+    pattern_rows = np.where(is_vertical[:, None], steps, route_lines[:, None])
+    pattern_cols = np.where(is_vertical[:, None], route_lines[:, None], steps)
+    # grid cells beyond num_stops are folded into the grid
+    patterns = (pattern_rows * side + pattern_cols) % num_stops
+    routes = pd.DataFrame({
+        "route_id": route_ids,
+        "agency_id": "agency_0",
+        "route_short_name": [str(i) for i in range(num_routes)],
+        "route_long_name": [f"route {i}" for i in range(num_routes)],
+        "route_type": 3,
+    })
+
+    # shapes follow stops of a route in each direction
+    shape_ids = np.array(
+        [f"shape_{i:06d}_{d}" for i in range(num_routes) for d in range(2)], dtype=object
+    )
+    stop_positions = np.linspace(0, stops_per_route - 1, shape_points_per_route)
+    lower = np.floor(stop_positions).astype(int)
+    upper = np.minimum(lower + 1, stops_per_route - 1)
+    ratio = stop_positions - lower
+    shape_patterns = np.stack([patterns, patterns[:, ::-1]], axis=1).reshape(-1, stops_per_route)
+    shape_lat = stops["stop_lat"].to_numpy()[shape_patterns]
+    shape_lon = stops["stop_lon"].to_numpy()[shape_patterns]
+    shapes = pd.DataFrame({
+        "shape_id": np.repeat(shape_ids, shape_points_per_route),
+        "shape_pt_lat": (shape_lat[:, lower] * (1 - ratio) + shape_lat[:, upper] * ratio).ravel(),
+        "shape_pt_lon": (shape_lon[:, lower] * (1 - ratio) + shape_lon[:, upper] * ratio).ravel(),
+        "shape_pt_sequence": np.tile(np.arange(1, shape_points_per_route + 1), len(shape_ids)),
+    })
+
+    service_ids = np.array([f"service_{i}" for i in range(num_services)], dtype=object)
+    first_date = datetime.datetime.strptime(start_date, "%Y%m%d")
+    end_date = (first_date + datetime.timedelta(days=num_days - 1)).strftime("%Y%m%d")
+    weekdays = rng.random((num_services, 7)) < 0.6
+    calendar = pd.DataFrame(
+        weekdays.astype(int),
+        columns=["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"],
+    )
+    calendar.insert(0, "service_id", service_ids)
+    calendar["start_date"] = start_date
+    calendar["end_date"] = end_date
+    exception_days = rng.integers(0, num_days, num_exceptions)
+    calendar_dates = pd.DataFrame({
+        "service_id": service_ids[rng.integers(0, num_services, num_exceptions)],
+        "date": [
+            (first_date + datetime.timedelta(days=int(day))).strftime("%Y%m%d")
+            for day in exception_days
+        ],
+        "exception_type": rng.integers(1, 3, num_exceptions),
+    }).drop_duplicates(subset=["service_id", "date"])
+
+    num_trips = num_routes * trips_per_route
+    trip_routes = np.repeat(np.arange(num_routes), trips_per_route)
+    directions = np.tile(np.arange(trips_per_route) % 2, num_routes)
+    trips = pd.DataFrame({
+        "route_id": route_ids[trip_routes],
+        "service_id": service_ids[rng.integers(0, num_services, num_trips)],
+        "trip_id": [f"trip_{i:09d}" for i in range(num_trips)],
+        "direction_id": directions,
+        "shape_id": shape_ids[trip_routes * 2 + directions],
+    })
+
+    tables = {
+        "agency": pd.DataFrame({
+            "agency_id": ["agency_0"],
+            "agency_name": ["synthetic agency"],
+            "agency_url": ["https://example.com/"],
+            "agency_timezone": ["Asia/Tokyo"],
+        }),
+        "stops": stops,
+        "routes": routes,
+        "trips": trips,
+        "shapes": shapes,
+        "calendar": calendar,
+        "calendar_dates": calendar_dates,
+    }
+    counts = {name: len(df) for name, df in tables.items()}
+    counts["stop_times"] = num_trips * stops_per_route
+
+    # trips depart from 05:00:00 to 25:00:00, and take 1-3 minutes between stops
+    start_seconds = rng.integers(5 * 3600, 25 * 3600, num_trips)
+    trips_per_chunk = max(WRITE_CHUNK_ROWS // stops_per_route, 1)
+
+    def iter_stop_times():
+        for start in range(0, num_trips, trips_per_chunk):
+            end = min(start + trips_per_chunk, num_trips)
+            trip_patterns = patterns[trip_routes[start:end]]
+            is_return = directions[start:end] == 1
+            trip_patterns[is_return] = trip_patterns[is_return, ::-1]
+            hops = rng.integers(60, 181, (end - start, stops_per_route))
+            hops[:, 0] = 0
+            seconds = start_seconds[start:end, None] + np.cumsum(hops, axis=1)
+            times = __format_times(seconds.ravel())
+            yield pd.DataFrame({
+                "trip_id": np.repeat(trips["trip_id"].to_numpy()[start:end], stops_per_route),
+                "arrival_time": times,
+                "departure_time": times,
+                "stop_id": stop_ids[trip_patterns.ravel()],
+                "stop_sequence": np.tile(np.arange(1, stops_per_route + 1), end - start),
+            })
+
+    if dst.endswith(".zip"):
+        with zipfile.ZipFile(dst, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for name, df in tables.items():
+                zf.writestr(f"{name}.txt", df.to_csv(index=False))
+            with zf.open("stop_times.txt", mode="w") as f:
+                with io.TextIOWrapper(f, encoding="utf-8", newline="") as text:
+                    for i, chunk in enumerate(iter_stop_times()):
+                        chunk.to_csv(text, index=False, header=i == 0)
+    else:
+        os.makedirs(dst, exist_ok=True)
+        for name, df in tables.items():
+            df.to_csv(os.path.join(dst, f"{name}.txt"), index=False)
+        with open(os.path.join(dst, "stop_times.txt"), mode="w", encoding="utf-8", newline="") as f:
+            for i, chunk in enumerate(iter_stop_times()):
+                chunk.to_csv(f, index=False, header=i == 0)
+    return counts
+
+
+def __format_times(seconds: np.ndarray) -> np.ndarray:
+    """seconds from 00:00:00 into "hh:mm:ss", hour can be more than 24"""
+    hours, rest = np.divmod(seconds, 3600)
+    minutes, secs = np.divmod(rest, 60)
+    return (
+        pd.Series(hours).astype(str).str.zfill(2)
+        + ":"
+        + pd.Series(minutes).astype(str).str.zfill(2)
+        + ":"
+        + pd.Series(secs).astype(str).str.zfill(2)
+    ).to_numpy()
@@ -0,0 +1,240 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Tuple
+
+import numpy as np
+
+from .geojson import FeatureTable, write_features
+from .patterns import ragged_slices
+
+# pixels of a side of a tile, simplification tolerance is a pixel of each zoom
+TILE_PIXELS = 256
+# latitude limit of web-mercator, tiles are square within it
+MAX_LATITUDE = 85.0511287798066
+# chunks of tiles of a layer and zoom by worker, to balance tiles of uneven sizes
+TILE_CHUNKS_PER_WORKER = 4
+
+
+def lonlat_to_tile(lon: np.ndarray, lat: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    web-mercator tile coordinates of lon/lat at zoom, in fractions.
+    Integer parts are x and y of tiles containing them, y grows to south.
+    """
+    n = 2**zoom
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon) + 180.0) / 360.0 * n
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * n
+    return x, y
+
+
+def tile_to_lonlat(x: np.ndarray, y: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """lon/lat of web-mercator tile coordinates at zoom, inverse of lonlat_to_tile"""
+    n = 2**zoom
+    lon = np.asarray(x) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(y) / n))))
+    return lon, lat
+
+
+def get_tolerance(zoom: int) -> float:
+    """degree of longitude covered by a pixel at zoom"""
+    return 360.0 / (TILE_PIXELS * 2**zoom)
+
+
+def partition_features(table: FeatureTable, zoom: int) -> Dict[Tuple[int, int], FeatureTable]:
+    """
+    Partition features into web-mercator tiles at zoom.
+    Points go to tiles containing them, lines are clipped by tiles.
+    A LineString clipped into pieces in a tile is a feature by piece,
+    pieces of a MultiLineString in a tile are lines of a feature.
+
+    Returns:
+        Dict[Tuple[int, int], FeatureTable]: features by x and y of tiles.
+    """
+    points, offsets, line_features = table.to_ragged()
+    x, y = lonlat_to_tile(points[:, 0], points[:, 1], zoom)
+    n = 2**zoom
+    if table.geometry_type == "Point":
+        is_valid = np.isfinite(x) & np.isfinite(y)
+        tx = np.clip(np.floor(x[is_valid]), 0, n - 1).astype(np.int64)
+        ty = np.clip(np.floor(y[is_valid]), 0, n - 1).astype(np.int64)
+        features = line_features[is_valid]
+        if len(features) == 0:
+            return {}
+        order = np.lexsort((features, ty, tx))
+        tiles = tx[order] * n + ty[order]
+        bounds = np.flatnonzero(np.diff(tiles)) + 1
+        return {
+            (int(tile // n), int(tile % n)): table.take(features[indices].tolist())
+            for tile, indices in zip(tiles[np.concatenate([[0], bounds])], np.split(order, bounds))
+            if len(indices) > 0
+        }
+    return _partition_lines(table, zoom, points, x, y, offsets, line_features)
+
+
+def _partition_lines(table, zoom, points, x, y, offsets, line_features):
+    n = 2**zoom
+
+    # segments between consecutive points of lines, except empty and invalid ones
+    line_of_points = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    starts = np.flatnonzero(line_of_points[:-1] == line_of_points[1:])
+    ax, ay, bx, by = x[starts], y[starts], x[starts + 1], y[starts + 1]
+    is_valid = np.isfinite(ax) & np.isfinite(ay) & np.isfinite(bx) & np.isfinite(by)
+    is_valid &= (ax != bx) | (ay != by)
+    starts, ax, ay, bx, by = (v[is_valid] for v in (starts, ax, ay, bx, by))
+    segment_lines = line_of_points[starts]
+
+    # candidate tiles of each segment are tiles of its bbox
+    x0 = np.clip(np.floor(np.minimum(ax, bx)), 0, n - 1).astype(np.int64)
+    x1 = np.clip(np.floor(np.maximum(ax, bx)), 0, n - 1).astype(np.int64)
+    y0 = np.clip(np.floor(np.minimum(ay, by)), 0, n - 1).astype(np.int64)
+    y1 = np.clip(np.floor(np.maximum(ay, by)), 0, n - 1).astype(np.int64)
+    nx, ny = x1 - x0 + 1, y1 - y0 + 1
+    counts = nx * ny
+    pair_offsets = np.concatenate([[0], np.cumsum(counts)])
+    segments = np.repeat(np.arange(len(starts)), counts)
+    k = np.arange(pair_offsets[-1]) - pair_offsets[segments]
+    tx = x0[segments] + k // ny[segments]
+    ty = y0[segments] + k % ny[segments]
+
+    # clip segments by tiles, by Liang-Barsky
+    ax, ay, bx, by = ax[segments], ay[segments], bx[segments], by[segments]
+    dx, dy = bx - ax, by - ay
+    t0 = np.zeros(len(segments))
+    t1 = np.ones(len(segments))
+    is_inside = np.ones(len(segments), dtype=bool)
+    for p, q in ((-dx, ax - tx), (dx, tx + 1 - ax), (-dy, ay - ty), (dy, ty + 1 - ay)):
+        is_parallel = p == 0
+        is_inside &= ~is_parallel | (q >= 0)
+        t = q / np.where(is_parallel, 1, p)
+        t0 = np.where(~is_parallel & (p < 0), np.maximum(t0, t), t0)
+        t1 = np.where(~is_parallel & (p > 0), np.minimum(t1, t), t1)
+    is_clipped = is_inside & (t0 < t1)
+    segments, tx, ty, t0, t1 = (v[is_clipped] for v in (segments, tx, ty, t0, t1))
+    ax, ay, dx, dy = (v[is_clipped] for v in (ax, ay, dx, dy))
+
+    # pieces are runs of connected segments of a line in a tile
+    order = np.lexsort((starts[segments], ty, tx))
+    segments, tx, ty, t0, t1 = (v[order] for v in (segments, tx, ty, t0, t1))
+    ax, ay, dx, dy = (v[order] for v in (ax, ay, dx, dy))
+    tiles = tx * n + ty
+    is_piece_start = np.ones(len(segments), dtype=bool)
+    is_piece_start[1:] = (
+        (tiles[1:] != tiles[:-1])
+        | (segment_lines[segments[1:]] != segment_lines[segments[:-1]])
+        | (starts[segments[1:]] != starts[segments[:-1]] + 1)
+        | (t1[:-1] < 1)
+        | (t0[1:] > 0)
+    )
+
+    # points of pieces: start of first segment, then ends of segments
+    end_positions = np.arange(len(segments)) + np.cumsum(is_piece_start)
+    start_positions = end_positions[is_piece_start] - 1
+    piece_x = np.empty(len(segments) + len(start_positions))
+    piece_y = np.empty(len(piece_x))
+    piece_x[end_positions] = ax + dx * t1
+    piece_y[end_positions] = ay + dy * t1
+    piece_x[start_positions] = (ax + dx * t0)[is_piece_start]
+    piece_y[start_positions] = (ay + dy * t0)[is_piece_start]
+    piece_points = np.column_stack(tile_to_lonlat(piece_x, piece_y, zoom))
+    # points not clipped keep their coordinates, without error of projection
+    point_indices = starts[segments]
+    is_end_kept = t1 == 1
+    piece_points[end_positions[is_end_kept]] = points[point_indices[is_end_kept] + 1]
+    is_start_kept = is_piece_start & (t0 == 0)
+    piece_points[end_positions[is_start_kept] - 1] = points[point_indices[is_start_kept]]
+    pieces = ragged_slices(piece_points, np.append(start_positions, len(piece_points)))
+    piece_tiles = tiles[is_piece_start]
+    piece_features = line_features[segment_lines[segments[is_piece_start]]]
+
+    tile_tables = {}
+    if len(pieces) == 0:
+        return tile_tables
+    bounds = np.flatnonzero(np.diff(piece_tiles)) + 1
+    for tile, indices in zip(
+        piece_tiles[np.concatenate([[0], bounds])],
+        np.split(np.arange(len(pieces)), bounds),
+    ):
+        if len(indices) == 0:
+            continue
+        features = piece_features[indices]
+        if table.geometry_type == "MultiLineString":
+            # pieces of a feature are contiguous, lines of features are in order
+            feature_bounds = np.flatnonzero(np.diff(features)) + 1
+            coordinates = [list(pieces[i]) for i in np.split(indices, feature_bounds)]
+            features = features[np.concatenate([[0], feature_bounds])]
+        else:
+            coordinates = list(pieces[indices])
+        tile_tables[(int(tile // n), int(tile % n))] = table.take(features.tolist(), coordinates)
+    return tile_tables
+
+
+def write_tiles(
+    tables: Dict[str, FeatureTable],
+    dst: str,
+    min_zoom: int,
+    max_zoom: int,
+    max_workers: int = 1,
+    use_processes: bool = True,
+    simplify: bool = True,
+) -> int:
+    """
+    write features into web-mercator tiles, as dst/{layer}/{z}/{x}/{y}.geojson by layer.
+    Each layer and zoom is simplified and partitioned once, then its tiles are written
+    concurrently by max_workers in chunks of tiles.
+
+    Args:
+        tables (Dict[str, FeatureTable]): features by layer name, like {"routes": read_routes_table(gtfs)}.
+        dst (str): directory of output.
+        min_zoom (int): min zoom of tiles.
+        max_zoom (int): max zoom of tiles.
+        max_workers (int, optional): number of chunks of tiles written concurrently. Defaults to 1.
+        use_processes (bool, optional): write them by processes, or by threads if False.
+            Defaults to True.
+        simplify (bool, optional): simplify lines under max_zoom by a pixel of each zoom.
+            Defaults to True.
+
+    Returns:
+        int: number of written tiles.
+    """
+    if min_zoom < 0 or max_zoom < min_zoom:
+        raise ValueError(f"zoom range must be 0 <= min_zoom <= max_zoom, got {min_zoom}-{max_zoom}.")
+
+    if max_workers <= 1:
+        return sum(
+            _write_tile_chunk(dst, layer, zoom, list(tile_tables.items()))
+            for layer, zoom, tile_tables in _iter_zoom_tiles(tables, dst, min_zoom, max_zoom, simplify)
+        )
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    count = 0
+    with executor_class(max_workers=max_workers) as executor:
+        futures = []
+        for layer, zoom, tile_tables in _iter_zoom_tiles(tables, dst, min_zoom, max_zoom, simplify):
+            # tiles of the previous layer and zoom are written while this one is partitioned
+            count += sum(future.result() for future in futures)
+            items = list(tile_tables.items())
+            chunk_size = max(1, -(-len(items) // (max_workers * TILE_CHUNKS_PER_WORKER)))
+            futures = [
+                executor.submit(_write_tile_chunk, dst, layer, zoom, items[i : i + chunk_size])
+                for i in range(0, len(items), chunk_size)
+            ]
+        count += sum(future.result() for future in futures)
+    return count
+
+
+def _iter_zoom_tiles(tables, dst, min_zoom, max_zoom, simplify):
+    # features partitioned into tiles by layer and zoom, finest zooms first, with their directories
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        for layer, table in tables.items():
+            if simplify and zoom < max_zoom:
+                table = table.simplify(get_tolerance(zoom))
+            tile_tables = partition_features(table, zoom)
+            for x in sorted({x for x, _ in tile_tables}):
+                os.makedirs(os.path.join(dst, layer, str(zoom), str(x)), exist_ok=True)
+            yield layer, zoom, tile_tables
+
+
+def _write_tile_chunk(dst, layer, zoom, items):
+    # write tiles of (x, y) and features, returns number of them
+    for (x, y), tile_table in items:
+        write_features(tile_table, os.path.join(dst, layer, str(zoom), str(x), f"{y}.geojson"))
+    return len(items)
@@ -1,4 +1,13 @@
-from gtfs_parser.aggregate import Aggregator
+import dataclasses
+import os
+
+import pandas as pd
+
+from gtfs_parser.aggregate import Aggregator, clear_unified_stops_cache
+from gtfs_parser.gtfs import GTFS, GTFSFactory
+from gtfs_parser.profiling import Profiler
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
 
 
 def is_coordinate_close(ref_coord, tgt_coord):
@@ -210,3 +219,149 @@ def test_unify_delimiter_night(gtfs):
         }
     }, route_features)
 
+
+def test_encode_ids(gtfs):
+    encoded = GTFSFactory(FIXTURE_DIR, encode_ids=True)
+    aggregator = Aggregator(gtfs, yyyymmdd="20210721", delimiter="_")
+    encoded_aggregator = Aggregator(encoded, yyyymmdd="20210721", delimiter="_")
+
+    # output is same as str ids
+    assert aggregator.read_stop_relations() == encoded_aggregator.read_stop_relations()
+    assert aggregator.read_interpolated_stops() == encoded_aggregator.read_interpolated_stops()
+    assert aggregator.read_route_frequency() == encoded_aggregator.read_route_frequency()
+
+
+def test_chunk_size(gtfs):
+    lazy = GTFSFactory(FIXTURE_DIR, lazy=True)
+    aggregator = Aggregator(gtfs, yyyymmdd="20210721", begin_time="070000", end_time="100000")
+    chunked_aggregator = Aggregator(lazy, yyyymmdd="20210721", begin_time="070000", end_time="100000",
+                                    chunk_size=1000)
+
+    # output is same as aggregating whole stop_times
+    assert aggregator.read_interpolated_stops() == chunked_aggregator.read_interpolated_stops()
+    assert aggregator.read_route_frequency() == chunked_aggregator.read_route_frequency()
+
+    # stop_times are streamed, not loaded
+    assert "stop_times" not in lazy.load_timings
+
+
+def test_by_dates(gtfs):
+    aggregator = Aggregator(gtfs)
+    dates = ["20210721", "20210722", "20200101"]
+    route_frequency_by_dates = aggregator.read_route_frequency_by_dates(dates)
+    interpolated_stops_by_dates = aggregator.read_interpolated_stops_by_dates(dates)
+
+    # same as aggregating each date by its own Aggregator
+    for yyyymmdd in dates:
+        aggregator_on_date = Aggregator(gtfs, yyyymmdd=yyyymmdd)
+        assert route_frequency_by_dates[yyyymmdd] == aggregator_on_date.read_route_frequency()
+        assert interpolated_stops_by_dates[yyyymmdd] == aggregator_on_date.read_interpolated_stops()
+    # no service out of validity period
+    assert route_frequency_by_dates["20200101"] == []
+
+
+def test_by_bins(gtfs):
+    aggregator = Aggregator(gtfs, yyyymmdd="20210721")
+    route_frequency = aggregator.read_route_frequency()
+    binned_route_frequency = aggregator.read_route_frequency_by_bins(bin_minutes=30)
+
+    # bins cover a day at least, frequency is split into bins
+    assert len(binned_route_frequency) == len(route_frequency)
+    assert all(len(path["properties"]["frequency"]) >= 48 for path in binned_route_frequency)
+    assert [path["properties"]["frequency"] for path in route_frequency] == [
+        sum(path["properties"]["frequency"]) for path in binned_route_frequency
+    ]
+
+    binned_stops = aggregator.read_interpolated_stops_by_bins(bin_minutes=30)
+    assert [stop["properties"]["count"] for stop in aggregator.read_interpolated_stops()] == [
+        sum(stop["properties"]["count"]) for stop in binned_stops
+    ]
+
+
+def test_chunk_size_ungrouped_trips(gtfs):
+    shuffled = dataclasses.replace(gtfs, stop_times=gtfs.stop_times.sample(frac=1, random_state=0))
+    aggregator = Aggregator(gtfs, yyyymmdd="20210721")
+    chunked_aggregator = Aggregator(shuffled, yyyymmdd="20210721", chunk_size=1000)
+
+    # trips in separated chunks are collected by buckets of trips, output is same
+    assert aggregator.read_interpolated_stops() == chunked_aggregator.read_interpolated_stops()
+    assert aggregator.read_route_frequency() == chunked_aggregator.read_route_frequency()
+    assert aggregator.read_route_frequency_by_bins(30) == chunked_aggregator.read_route_frequency_by_bins(30)
+    dates = ["20210721", "20210722"]
+    assert aggregator.read_route_frequency_by_dates(dates) == Aggregator(
+        shuffled, chunk_size=1000
+    ).read_route_frequency_by_dates(dates)
+
+
+def test_unify_long_chain():
+    # same name stops lined up every 0.002 degree, each is near to next ones.
+    stops = pd.DataFrame({
+        "stop_id": [f"chain_{i:02d}" for i in range(40)],
+        "stop_name": "chain",
+        "stop_lat": 43.0,
+        "stop_lon": [143.0 + 0.002 * i for i in range(40)],
+        "parent_station": None,
+    })
+    gtfs = GTFS(
+        agency=pd.DataFrame({"agency_id": ["a"], "agency_name": ["agency"]}),
+        routes=pd.DataFrame(columns=["route_id", "agency_id"]),
+        stop_times=pd.DataFrame(columns=["trip_id", "departure_time", "stop_id", "stop_sequence"]),
+        stops=stops,
+        trips=pd.DataFrame(columns=["route_id", "service_id", "trip_id"]),
+    )
+    aggregator = Aggregator(gtfs)
+
+    # long chain is resolved to the smallest stop, beyond 5 rounds of joining
+    relations = aggregator.read_stop_relations()
+    assert {relation["similar_stop_id"] for relation in relations} == {"chain_00"}
+
+
+def test_unify_chain_of_near_pairs():
+    # near pairs A-C, C-B and B-D, where B is not nearest to A but joins the group through C
+    stops = pd.DataFrame({
+        "stop_id": ["A", "C", "B", "D"],
+        "stop_name": "chain",
+        "stop_lat": 43.0,
+        "stop_lon": [143.0, 143.002, 143.004, 143.006],
+        "parent_station": None,
+    })
+    gtfs = GTFS(
+        agency=pd.DataFrame({"agency_id": ["a"], "agency_name": ["agency"]}),
+        routes=pd.DataFrame(columns=["route_id", "agency_id"]),
+        stop_times=pd.DataFrame(columns=["trip_id", "departure_time", "stop_id", "stop_sequence"]),
+        stops=stops,
+        trips=pd.DataFrame(columns=["route_id", "service_id", "trip_id"]),
+    )
+    relations = Aggregator(gtfs).read_stop_relations()
+    assert {relation["stop_id"]: relation["similar_stop_id"] for relation in relations} == {
+        "A": "A", "B": "A", "C": "A", "D": "A"
+    }
+
+
+def test_unified_stops_cache(gtfs, tmp_path):
+    def unify_count():
+        with Profiler(memory=False) as profiler:
+            aggregator = Aggregator(gtfs, yyyymmdd="20210721", delimiter="_", cache_dir=str(tmp_path))
+        count = sum(record.name == "aggregate.unify_similar_stops" for record in profiler.records)
+        return count, aggregator
+
+    clear_unified_stops_cache()
+    count, aggregator = unify_count()
+    assert count == 1
+    # unified once across instances, in memory then on disk
+    memoized_count, memoized = unify_count()
+    clear_unified_stops_cache()
+    cached_count, cached = unify_count()
+    assert memoized_count == cached_count == 0
+
+    for other in (memoized, cached):
+        assert aggregator.read_stop_relations() == other.read_stop_relations()
+        assert aggregator.read_interpolated_stops() == other.read_interpolated_stops()
+        assert aggregator.read_route_frequency() == other.read_route_frequency()
+
+    # other parameters are unified again, coding ids doesn't modify cached stops
+    encoded = GTFSFactory(FIXTURE_DIR, encode_ids=True)
+    assert Aggregator(encoded, yyyymmdd="20210721", delimiter="_").read_stop_relations() \
+        == aggregator.read_stop_relations()
+    assert unify_count()[1].read_stop_relations() == aggregator.read_stop_relations()
+    assert Aggregator(gtfs, yyyymmdd="20210721").read_stop_relations() != aggregator.read_stop_relations()
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+import pandas as pd
+
+from gtfs_parser.gtfs import GTFSFactory
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
+
+def test_cache(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    gtfs = GTFSFactory(FIXTURE_DIR)
+
+    # first load writes an entry, second load reads it
+    GTFSFactory(FIXTURE_DIR, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    cached = GTFSFactory(FIXTURE_DIR, cache_dir=cache_dir)
+
+    pd.testing.assert_frame_equal(gtfs.stop_times, cached.stop_times)
+    pd.testing.assert_frame_equal(gtfs.shapes, cached.shapes)
+    pd.testing.assert_frame_equal(gtfs.trips, cached.trips)
+
+    # options are part of key
+    encoded = GTFSFactory(FIXTURE_DIR, cache_dir=cache_dir, encode_ids=True)
+    cached = GTFSFactory(FIXTURE_DIR, cache_dir=cache_dir, encode_ids=True)
+    assert len(os.listdir(cache_dir)) == 2
+    assert cached.ids["stop_id"].equals(encoded.ids["stop_id"])
+    pd.testing.assert_frame_equal(encoded.stop_times, cached.stop_times)
+
+
+def test_cache_invalidation(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    gtfs_dir = str(tmp_path / "gtfs")
+    shutil.copytree(FIXTURE_DIR, gtfs_dir)
+
+    GTFSFactory(gtfs_dir, cache_dir=cache_dir)
+    [old_key] = os.listdir(cache_dir)
+
+    # modified source replaces stale entry
+    with open(os.path.join(gtfs_dir, "agency.txt"), mode="a", encoding="utf-8") as f:
+        f.write("\n")
+    GTFSFactory(gtfs_dir, cache_dir=cache_dir)
+    [new_key] = os.listdir(cache_dir)
+    assert old_key != new_key
+
+
+def test_cache_eviction(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+
+    # entries over max_cache_bytes are evicted, except the latest one
+    GTFSFactory(FIXTURE_DIR, cache_dir=cache_dir, max_cache_bytes=1)
+    GTFSFactory(FIXTURE_DIR, cache_dir=cache_dir, max_cache_bytes=1, encode_ids=True)
+    assert len(os.listdir(cache_dir)) == 1
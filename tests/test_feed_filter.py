@@ -0,0 +1,89 @@
+import os
+import shutil
+
+import pytest
+
+from gtfs_parser.aggregate import Aggregator
+from gtfs_parser.feed_filter import FeedFilter
+from gtfs_parser.gtfs import GTFSFactory
+from gtfs_parser.parse import read_routes
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+BBOX = (143.15, 42.9, 143.25, 43.0)
+
+
+def test_feed_filter_bbox():
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    filtered = GTFSFactory(FIXTURE_DIR, feed_filter=FeedFilter(bbox=BBOX))
+
+    # trips stopping within bbox, with all of their stop_times
+    stops = gtfs.stops
+    in_bbox = stops["stop_lon"].between(BBOX[0], BBOX[2]) & stops["stop_lat"].between(BBOX[1], BBOX[3])
+    stop_times = gtfs.stop_times
+    trip_ids = set(stop_times["trip_id"][stop_times["stop_id"].isin(stops["stop_id"][in_bbox])])
+    assert 0 < len(trip_ids) < len(gtfs.trips)
+    assert set(filtered.trips["trip_id"]) == trip_ids
+    assert len(filtered.stop_times) == stop_times["trip_id"].isin(trip_ids).sum()
+
+    # tables keep referential integrity
+    assert set(filtered.stop_times["stop_id"]) <= set(filtered.stops["stop_id"])
+    assert set(stops["stop_id"][in_bbox]) <= set(filtered.stops["stop_id"])
+    assert set(filtered.trips["route_id"]) == set(filtered.routes["route_id"])
+    assert set(filtered.shapes["shape_id"]) == set(filtered.trips["shape_id"].dropna())
+    assert set(filtered.calendar["service_id"]) <= set(filtered.trips["service_id"])
+    assert len(filtered.agency) == 1
+    assert "filter" in filtered.load_timings
+
+
+def test_feed_filter_routes_and_dates():
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    route_ids = gtfs.routes["route_id"].iloc[:3].tolist()
+    filtered = GTFSFactory(FIXTURE_DIR, feed_filter=FeedFilter(route_ids=route_ids))
+
+    # same features of the routes
+    route_features = [f for f in read_routes(gtfs) if f["properties"]["route_id"] in route_ids]
+    assert read_routes(filtered) == route_features
+    assert GTFSFactory(FIXTURE_DIR, feed_filter=FeedFilter(agency_ids=["unknown"])).trips.empty
+
+    # trips on dates are aggregated same as the whole feed
+    dated = GTFSFactory(
+        FIXTURE_DIR, encode_ids=True, feed_filter=FeedFilter(start_date="20210721", end_date="20210722")
+    )
+    assert len(dated.trips) < len(gtfs.trips)
+    for yyyymmdd in ("20210721", "20210722"):
+        assert Aggregator(dated, yyyymmdd=yyyymmdd, no_unify_stops=True).read_route_frequency() \
+            == Aggregator(gtfs, yyyymmdd=yyyymmdd, no_unify_stops=True).read_route_frequency()
+
+
+def test_feed_filter_empty(tmp_path):
+    # no stops within bbox
+    filtered = GTFSFactory(FIXTURE_DIR, feed_filter=FeedFilter(bbox=(0, 0, 1, 1)))
+    assert filtered.trips.empty and filtered.stop_times.empty and filtered.stops.empty
+    assert {"trip_id", "stop_id", "stop_sequence", "departure_seconds"} <= set(filtered.stop_times.columns)
+
+    # no stop_times.txt to stream
+    gtfs_dir = str(tmp_path / "gtfs")
+    shutil.copytree(FIXTURE_DIR, gtfs_dir)
+    os.remove(os.path.join(gtfs_dir, "stop_times.txt"))
+    filtered = GTFSFactory(gtfs_dir, feed_filter=FeedFilter(bbox=BBOX))
+    assert filtered.trips.empty and filtered.stop_times.empty
+    assert not filtered.stops.empty
+    assert {"trip_id", "stop_id", "stop_sequence", "departure_seconds"} <= set(filtered.stop_times.columns)
+
+
+def test_feed_filter_cache(tmp_path):
+    feed_filter = FeedFilter(bbox=BBOX)
+    filtered = GTFSFactory(FIXTURE_DIR, cache_dir=str(tmp_path), feed_filter=feed_filter)
+    cached = GTFSFactory(FIXTURE_DIR, cache_dir=str(tmp_path), feed_filter=feed_filter)
+    assert set(cached.load_timings) == {"cache"}
+    assert len(cached.stop_times) == len(filtered.stop_times)
+
+    # another filter is another entry
+    other = GTFSFactory(FIXTURE_DIR, cache_dir=str(tmp_path), feed_filter=FeedFilter(bbox=(0, 0, 1, 1)))
+    assert "cache" not in other.load_timings
+    assert other.stop_times.empty
+
+    with pytest.raises(ValueError):
+        FeedFilter(bbox=(1, 0, 0, 1))
+    with pytest.raises(ValueError):
+        GTFSFactory(FIXTURE_DIR, lazy=True, feed_filter=feed_filter)
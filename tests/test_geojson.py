@@ -0,0 +1,135 @@
+import json
+import os
+
+import numpy as np
+
+from gtfs_parser.geojson import FeatureTable, write_features
+from gtfs_parser.gtfs import GTFSFactory
+from gtfs_parser.parse import iter_stops, read_routes_table, read_stops, read_stops_table
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
+
+def test_write_features(tmp_path):
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    stops = read_stops(gtfs)
+    assert list(iter_stops(gtfs)) == stops
+
+    # same as dumping whole FeatureCollection
+    path = str(tmp_path / "stops.geojson")
+    assert write_features(read_stops_table(gtfs), path) == len(stops)
+    with open(path, encoding="utf-8") as f:
+        written = f.read()
+    assert written == json.dumps({"type": "FeatureCollection", "features": stops}, ensure_ascii=False)
+
+    # a feature by line
+    seq_path = str(tmp_path / "stops.geojsonl")
+    write_features(iter_stops(gtfs), seq_path, seq=True)
+    with open(seq_path, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == stops
+
+    empty_path = str(tmp_path / "empty.geojson")
+    assert write_features([], empty_path) == 0
+    with open(empty_path, encoding="utf-8") as f:
+        assert json.load(f) == {"type": "FeatureCollection", "features": []}
+
+
+def test_feature_table():
+    table = FeatureTable(
+        "Point",
+        [[139.0, 35.0], [float("nan"), 35.5], [140, 36.0]],
+        {
+            "name": ["a", "東京\"駅\"", None],
+            "count": [1, 2, 3],
+            "ratio": [0.5, float("nan"), 1.0],
+            "flag": [True, False, True],
+            "ids": [["x"], [], ["y", "z"]],
+        },
+    )
+    features = list(table)
+    assert len(table) == 3
+    assert features[1]["properties"]["name"] == "東京\"駅\""
+    assert features[2]["geometry"] == {"type": "Point", "coordinates": [140, 36.0]}
+
+    # JSON texts are same as dumping dicts
+    assert list(table.iter_json()) == [
+        json.dumps(feature, ensure_ascii=False) for feature in features
+    ]
+    assert table.to_dataframe().columns.tolist() == ["name", "count", "ratio", "flag", "ids", "coordinates"]
+
+
+def test_feature_table_ragged_coordinates():
+    points = np.array([[139.0, 35.0], [139.1, 35.1], [139.2, 35.2]])
+    # lines as views of sorted points
+    table = FeatureTable("MultiLineString", [[points[0:2], points[1:3]]], {"route_id": ["r"]})
+
+    feature = next(iter(table))
+    assert feature["geometry"]["coordinates"] == [
+        [[139.0, 35.0], [139.1, 35.1]],
+        [[139.1, 35.1], [139.2, 35.2]],
+    ]
+    assert list(table.iter_json()) == [json.dumps(feature, ensure_ascii=False)]
+
+
+def test_feature_table_reduce_geometry():
+    table = FeatureTable(
+        "MultiLineString",
+        [
+            [
+                np.array([[0.0, 0.0], [1.0, 0.01], [2.0, 0.0], [3.0, 1.0], [4.0, 0.0]]),
+                [[0.0, 0.0], [0.0, 1.0]],
+            ],
+            [[[5.0, 5.0]]],
+        ],
+        {"route_id": ["r1", "r2"]},
+    )
+    simplified = list(table.simplify(0.1))
+    # points near simplified lines are dropped, ends of lines are kept
+    assert simplified[0]["geometry"]["coordinates"] == [
+        [[0.0, 0.0], [2.0, 0.0], [3.0, 1.0], [4.0, 0.0]],
+        [[0.0, 0.0], [0.0, 1.0]],
+    ]
+    assert simplified[1]["geometry"]["coordinates"] == [[[5.0, 5.0]]]
+    assert simplified[0]["properties"] == {"route_id": "r1"}
+    # all points are kept with zero tolerance
+    assert list(table.simplify(0)) == list(table)
+
+    rounded = list(table.round_coordinates(0))
+    # points made same by rounding are dropped
+    assert rounded[0]["geometry"]["coordinates"][0] == [
+        [0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [3.0, 1.0], [4.0, 0.0]
+    ]
+
+    paths = FeatureTable(
+        "LineString",
+        [([139.1234567, 35.1234567], [139.1234561, 35.1234561])],
+        {"frequency": [1]},
+    )
+    # ends of lines are kept, even if they are same by rounding
+    assert next(iter(paths.round_coordinates(5)))["geometry"]["coordinates"] == [
+        [139.12346, 35.12346], [139.12346, 35.12346]
+    ]
+    points = FeatureTable("Point", [[139.1234567, 35.1234567]], {"name": ["a"]})
+    assert points.simplify(0.1) is points
+    rounded_points = points.round_coordinates(3)
+    assert list(rounded_points.iter_json()) == [
+        json.dumps(feature, ensure_ascii=False) for feature in rounded_points
+    ]
+    assert next(iter(rounded_points))["geometry"]["coordinates"] == [139.123, 35.123]
+
+
+def test_reduce_routes_geometry():
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    routes = read_routes_table(gtfs)
+    reduced = routes.simplify(0.0001).round_coordinates(5)
+    assert len(reduced) == len(routes)
+    for feature, reduced_feature in zip(routes, reduced):
+        assert feature["properties"] == reduced_feature["properties"]
+        lines = feature["geometry"]["coordinates"]
+        reduced_lines = reduced_feature["geometry"]["coordinates"]
+        assert len(lines) == len(reduced_lines)
+        for line, reduced_line in zip(lines, reduced_lines):
+            assert len(reduced_line) <= len(line)
+            assert reduced_line[0] == [round(c, 5) for c in line[0]]
+            assert reduced_line[-1] == [round(c, 5) for c in line[-1]]
+    assert sum(map(len, reduced.iter_json())) < sum(map(len, routes.iter_json()))
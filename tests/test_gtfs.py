@@ -1,5 +1,6 @@
 import os
 
+import numpy as np
 import pandas as pd
 
 
@@ -22,3 +23,104 @@ def test_gtfs():
     assert isinstance(gtfs.shapes, pd.DataFrame)
     assert isinstance(gtfs.calendar, pd.DataFrame)
     assert isinstance(gtfs.calendar_dates, pd.DataFrame)
+
+
+def test_gtfs_columns():
+    FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+    gtfs = GTFSFactory(FIXTURE_DIR)
+
+    # only columns in schema are read, decoded into their dtypes
+    assert "route_color" not in gtfs.routes.columns
+    assert "stop_code" not in gtfs.stops.columns
+    assert gtfs.stops["stop_lon"].dtype == float
+    assert gtfs.stops["location_type"].dtype == int
+    assert gtfs.shapes["shape_pt_sequence"].dtype == int
+    assert gtfs.stop_times["stop_sequence"].dtype == int
+    # times are decoded into seconds
+    assert gtfs.stop_times["departure_seconds"].dtype == np.int32
+    assert "arrival_seconds" not in gtfs.stop_times.columns
+
+    # extra columns can be read on demand
+    gtfs = GTFSFactory(
+        FIXTURE_DIR, extra_columns={"routes": ["route_color"], "stop_times": ["arrival_time"]}
+    )
+    assert "route_color" in gtfs.routes.columns
+    assert gtfs.stop_times["arrival_seconds"].dtype == np.int32
+
+
+def test_gtfs_encode_ids():
+    FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    encoded = GTFSFactory(FIXTURE_DIR, encode_ids=True)
+
+    assert gtfs.ids is None
+    assert encoded.stop_times["stop_id"].dtype == "int32"
+    assert encoded.trips["trip_id"].dtype == "int32"
+    # codes share dictionary over tables
+    assert encoded.stop_times["stop_id"].isin(encoded.stops["stop_id"]).all()
+    # codes are decoded into original ids
+    assert (
+        encoded.decode_ids("stop_id", encoded.stops["stop_id"]).tolist()
+        == gtfs.stops["stop_id"].tolist()
+    )
+    assert (
+        encoded.decode_ids("trip_id", encoded.trips["trip_id"]).tolist()
+        == gtfs.trips["trip_id"].tolist()
+    )
+
+
+def test_gtfs_parallel():
+    FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    parallel = GTFSFactory(FIXTURE_DIR, max_workers=4)
+
+    pd.testing.assert_frame_equal(gtfs.stop_times, parallel.stop_times)
+    pd.testing.assert_frame_equal(gtfs.shapes, parallel.shapes)
+
+    # seconds taken by each table
+    assert set(parallel.load_timings) == {
+        "agency", "calendar", "calendar_dates", "feed_info",
+        "routes", "shapes", "stop_times", "stops", "trips",
+    }
+
+
+def test_gtfs_lazy():
+    FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    lazy = GTFSFactory(FIXTURE_DIR, lazy=True)
+
+    # tables are read on first access
+    assert lazy.load_timings == {}
+    pd.testing.assert_frame_equal(gtfs.stops, lazy.stops)
+    assert set(lazy.load_timings) == {"stops"}
+
+    # agency_id of single agency is set to routes
+    pd.testing.assert_frame_equal(gtfs.routes, lazy.routes)
+    assert set(lazy.load_timings) == {"stops", "routes", "agency"}
+
+    pd.testing.assert_frame_equal(gtfs.shapes, lazy.shapes)
+
+
+def test_gtfs_derived_tables():
+    FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+    gtfs = GTFSFactory(FIXTURE_DIR)
+
+    # stop_times sorted once, shared by trip_patterns
+    offsets, order, trip_ids = gtfs.stop_times_layout
+    pd.testing.assert_frame_equal(
+        gtfs.stop_times.take(order).reset_index(drop=True),
+        gtfs.stop_times.sort_values(["trip_id", "stop_sequence"]).reset_index(drop=True),
+    )
+    assert gtfs.trip_patterns.trip_ids.equals(trip_ids.rename("trip_id"))
+    assert gtfs.stop_times_layout is gtfs.stop_times_layout
+
+    # joins made once on first access
+    trip_routes = gtfs.trip_routes
+    assert trip_routes is gtfs.trip_routes
+    assert list(trip_routes.columns) == ["trip_id", "route_id", "service_id", "agency_id"]
+    assert len(trip_routes) == len(gtfs.trips)
+
+    stop_routes = gtfs.stop_routes
+    assert not stop_routes.duplicated().any()
+    visited = gtfs.stop_times.merge(gtfs.trips, on="trip_id")[["stop_id", "route_id"]]
+    assert set(map(tuple, stop_routes.to_numpy())) == set(map(tuple, visited.to_numpy()))
@@ -0,0 +1,101 @@
+import filecmp
+import os
+import shutil
+import sys
+
+import pandas as pd
+
+from gtfs_parser.__main__ import main
+from gtfs_parser.gtfs import GTFSFactory, load_previous_version
+from gtfs_parser.incremental import diff_feeds
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
+
+def __modify_feed(gtfs_dir):
+    """retime a trip, drop a trip, rename a route, and returns their ids"""
+    stop_times = pd.read_csv(os.path.join(gtfs_dir, "stop_times.txt"), dtype=str)
+    trip_ids = stop_times["trip_id"].unique()
+    retimed_trip_id, dropped_trip_id = trip_ids[0], trip_ids[10]
+    is_retimed = stop_times["trip_id"] == retimed_trip_id
+    stop_times.loc[is_retimed, "departure_time"] = "23:59:00"
+    stop_times = stop_times[stop_times["trip_id"] != dropped_trip_id]
+    stop_times.to_csv(os.path.join(gtfs_dir, "stop_times.txt"), index=False)
+
+    routes = pd.read_csv(os.path.join(gtfs_dir, "routes.txt"), dtype=str)
+    routes.loc[0, "route_long_name"] = "renamed"
+    routes.to_csv(os.path.join(gtfs_dir, "routes.txt"), index=False)
+    return retimed_trip_id, dropped_trip_id, routes.loc[0, "route_id"]
+
+
+def test_diff_feeds(tmp_path):
+    gtfs_dir = str(tmp_path / "gtfs")
+    shutil.copytree(FIXTURE_DIR, gtfs_dir)
+    cache_dir = str(tmp_path / "cache")
+    GTFSFactory(gtfs_dir, cache_dir=cache_dir, encode_ids=True)
+    # not modified
+    assert load_previous_version(gtfs_dir, cache_dir, encode_ids=True) is None
+
+    retimed_trip_id, dropped_trip_id, route_id = __modify_feed(gtfs_dir)
+    old = load_previous_version(gtfs_dir, cache_dir, encode_ids=True)
+    new = GTFSFactory(gtfs_dir, cache_dir=cache_dir, encode_ids=True)
+    diff = diff_feeds(old, new)
+    assert diff.trip_ids == {retimed_trip_id, dropped_trip_id}
+    assert diff.route_ids == {route_id}
+    assert diff.changed_tables == {"stop_times", "routes"}
+    assert diff.stop_ids == set() and diff.shape_ids == set()
+    # previous version is removed from cache
+    assert load_previous_version(gtfs_dir, cache_dir, encode_ids=True) is None
+
+    # ids are compared as str, regardless of encoding
+    assert diff_feeds(GTFSFactory(gtfs_dir), new).is_empty()
+
+
+def test_incremental_cli(tmp_path, monkeypatch, capsys):
+    gtfs_dir = str(tmp_path / "gtfs")
+    shutil.copytree(FIXTURE_DIR, gtfs_dir)
+    runs = {
+        "parse": ["parse"],
+        "aggregate": ["aggregate", "--aggregate_yyyymmdd", "20210401"],
+    }
+
+    def run(name, dst, *options):
+        mode, *mode_options = runs[name]
+        monkeypatch.setattr(
+            sys, "argv", ["gtfs-parser", mode, gtfs_dir, str(dst), *mode_options, *options]
+        )
+        main()
+
+    for name in runs:
+        run(name, tmp_path / f"{name}_incremental", "--cache_dir", str(tmp_path / name), "--incremental")
+    __modify_feed(gtfs_dir)
+    for name in runs:
+        capsys.readouterr()
+        run(name, tmp_path / f"{name}_incremental", "--cache_dir", str(tmp_path / name), "--incremental")
+        assert "incremental: changed" in capsys.readouterr().out
+        run(name, tmp_path / f"{name}_full")
+
+        # patched outputs are same as outputs made from scratch
+        comparison = filecmp.dircmp(tmp_path / f"{name}_incremental", tmp_path / f"{name}_full")
+        assert comparison.left_only == ["incremental.json"]
+        assert comparison.right_only == []
+        assert comparison.diff_files == []
+
+
+def test_incremental_cli_not_changed(tmp_path, monkeypatch, capsys):
+    dst = tmp_path / "output"
+    argv = ["gtfs-parser", "parse", FIXTURE_DIR, str(dst), "--cache_dir", str(tmp_path / "cache"), "--incremental"]
+    monkeypatch.setattr(sys, "argv", argv)
+    main()
+    mtimes = {path.name: path.stat().st_mtime_ns for path in dst.iterdir()}
+
+    # outputs of same src and options are not written again
+    capsys.readouterr()
+    main()
+    assert "incremental: not changed" in capsys.readouterr().out
+    assert {path.name: path.stat().st_mtime_ns for path in dst.iterdir()} == mtimes
+
+    # other options are made again
+    monkeypatch.setattr(sys, "argv", argv + ["--parse_ignoreshapes"])
+    main()
+    assert "incremental: not changed" not in capsys.readouterr().out
@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+
+import pytest
+
+from gtfs_parser.__main__ import list_feeds, load_args, run_batch, validate_args
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
+
+def test_batch(tmp_path, monkeypatch):
+    manifest = tmp_path / "feeds.txt"
+    manifest.write_text(f"# feeds\n{FIXTURE_DIR}\nmissing.zip\n", encoding="utf-8")
+    assert list_feeds(str(manifest)) == {
+        "fixture": FIXTURE_DIR,
+        "missing": str(tmp_path / "missing.zip"),
+    }
+
+    dst = tmp_path / "output"
+    monkeypatch.setattr(
+        sys, "argv", ["gtfs-parser", "parse", str(manifest), str(dst), "--batch", "--batch_workers", "2"]
+    )
+    args = load_args()
+    validate_args(args)
+    # a failed feed does not stop others, but fails the batch
+    with pytest.raises(RuntimeError):
+        run_batch(args)
+
+    assert sorted(os.listdir(dst / "fixture")) == ["routes.geojson", "stops.geojson"]
+    with open(dst / "batch_summary.json", encoding="utf-8") as f:
+        summary = json.load(f)
+    assert (summary["succeeded"], summary["failed"]) == (1, 1)
+    assert summary["feeds"]["fixture"]["status"] == "succeeded"
+    assert "stop_times" in summary["feeds"]["fixture"]["load_timings"]
+    assert summary["feeds"]["missing"]["status"] == "failed"
+    assert "error" in summary["feeds"]["missing"]
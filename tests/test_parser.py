@@ -1,5 +1,10 @@
+import os
+
+from gtfs_parser.gtfs import GTFSFactory
 from gtfs_parser.parse import read_routes, read_stops
 
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
 
 def __find_feature_by(properties, features):
     for feature in features:
@@ -56,3 +61,11 @@ def test_read_routes_ignore_shapes(gtfs):
     # num of features in routes.geojson depends on not shapes.txt but routes.txt
     routes_features_noshapes = read_routes(gtfs, ignore_shapes=True)
     assert 32 == len(routes_features_noshapes)
+
+
+def test_read_encode_ids(gtfs):
+    encoded = GTFSFactory(FIXTURE_DIR, encode_ids=True)
+    # output is same as str ids
+    assert read_stops(gtfs) == read_stops(encoded)
+    assert read_routes(gtfs) == read_routes(encoded)
+    assert read_routes(gtfs, ignore_shapes=True) == read_routes(encoded, ignore_shapes=True)
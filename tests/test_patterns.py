@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from gtfs_parser.gtfs import GTFSFactory
+from gtfs_parser.patterns import NULL_SECONDS, TripPatterns, parse_times, time_to_seconds
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
+
+def test_trip_patterns():
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    patterns = gtfs.trip_patterns
+    # built once per feed
+    assert gtfs.trip_patterns is patterns
+
+    stop_times = gtfs.stop_times.sort_values(["trip_id", "stop_sequence"])
+    assert len(patterns) == stop_times["trip_id"].nunique()
+    assert patterns.num_patterns < len(patterns)
+    assert patterns.count_trips().sum() == len(patterns)
+
+    # stops of trips are restored from patterns
+    for trip_id, trip_stop_times in list(stop_times.groupby("trip_id"))[:20]:
+        trip = patterns.trip_ids.get_loc(trip_id)
+        assert list(patterns.get_pattern_stop_ids(patterns.trip_patterns[trip])) == list(
+            trip_stop_times["stop_id"]
+        )
+
+    # stop passes are pattern frequency multiplied by stops of patterns
+    stop_pass_count = patterns.count_stop_pass()
+    expected = stop_times.groupby("stop_id").size()
+    assert stop_pass_count.sort_index().tolist() == expected.sort_index().tolist()
+
+
+def test_trip_patterns_segments():
+    patterns = TripPatterns(
+        pd.Series(["t1", "t1", "t1", "t2", "t2", "t2", "t3", "t3"]),
+        pd.Series([1, 2, 3, 1, 2, 3, 1, 2]),
+        pd.Series(["a", "b", "c", "a", "b", "c", "c", "a"]),
+    )
+    assert patterns.num_patterns == 2
+    assert patterns.count_trips().tolist() == [2, 1]
+    assert patterns.count_trips(np.array([True, False, True])).tolist() == [1, 1]
+    assert patterns.count_stop_pass().to_dict() == {"a": 3, "b": 2, "c": 3}
+
+    # segments skip stops not kept
+    is_kept_stop = patterns.stop_ids.isin(["a", "c"])
+    segment_patterns, prev_codes, next_codes = patterns.get_segments(is_kept_stop)
+    assert segment_patterns.tolist() == [0, 1]
+    assert list(patterns.stop_ids[prev_codes]) == ["a", "c"]
+    assert list(patterns.stop_ids[next_codes]) == ["c", "a"]
+
+
+def test_parse_times():
+    times = pd.Series(["07:30:00", "7:30:01", "25:00:00", "24:00:00", None, "7:30:01", ""])
+    seconds = parse_times(times)
+    assert seconds.dtype == np.int32
+    assert seconds.tolist() == [27000, 27001, 90000, 86400, NULL_SECONDS, 27001, NULL_SECONDS]
+    # times across an hour compare in order, regardless of zero padding
+    assert parse_times(pd.Series(["9:59:59"]))[0] < parse_times(pd.Series(["10:00:00"]))[0]
+    assert len(parse_times(pd.Series([], dtype=object))) == 0
+
+
+def test_time_to_seconds():
+    times = pd.Series(["07:30:00", "7:30:01", "25:00:00", None])
+    seconds = time_to_seconds(times)
+    assert seconds.iloc[:3].tolist() == [27000, 27001, 90000]
+    assert pd.isna(seconds.iloc[3])
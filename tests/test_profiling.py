@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+
+from gtfs_parser import profiling
+from gtfs_parser.__main__ import main
+from gtfs_parser.aggregate import Aggregator, clear_unified_stops_cache
+from gtfs_parser.gtfs import GTFSFactory
+from gtfs_parser.parse import read_routes
+from gtfs_parser.profiling import Profiler, add_hook, remove_hook, stage, staged
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
+
+@staged("test.make_list", rows=len)
+def make_list(size):
+    return list(range(size))
+
+
+def test_stage_without_hooks():
+    assert profiling._hooks == []
+    # a shared stage without measurement, rows are dropped
+    with stage("test.outer") as s:
+        s.rows = 10
+    assert s is stage("test.other")
+    assert s.rows is None
+    assert make_list(3) == [0, 1, 2]
+
+
+def test_hooks():
+    records = []
+    add_hook(records.append)
+    try:
+        with stage("test.outer") as s:
+            make_list(5)
+            s.rows = 2
+    finally:
+        remove_hook(records.append)
+
+    assert [r.path for r in records] == ["test.outer/test.make_list", "test.outer"]
+    inner, outer = records
+    assert (inner.depth, inner.rows) == (1, 5)
+    assert (outer.depth, outer.rows) == (0, 2)
+    assert outer.started <= inner.started
+    assert outer.seconds >= inner.seconds
+    # tracemalloc is not tracing
+    assert outer.peak_bytes is None
+
+    make_list(1)
+    assert len(records) == 2
+
+
+def test_profiler_memory():
+    with Profiler() as profiler:
+        with stage("test.outer"):
+            with stage("test.inner"):
+                data = bytearray(10_000_000)
+            del data
+    inner, outer = profiler.records
+    assert inner.peak_bytes >= 10_000_000
+    # peak of outer includes peaks of inner stages
+    assert outer.peak_bytes >= inner.peak_bytes
+    assert profiling._hooks == []
+
+
+def test_profiler_stages():
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    # stops may be unified by other tests
+    clear_unified_stops_cache()
+    with Profiler(memory=False) as profiler:
+        read_routes(gtfs)
+        aggregator = Aggregator(gtfs)
+        aggregator.read_route_frequency()
+
+    names = {r.name for r in profiler.records}
+    assert {
+        "gtfs.trip_patterns",
+        "parse.read_routes",
+        "aggregate.init",
+        "aggregate.unify_similar_stops",
+        "aggregate.read_route_frequency",
+    } <= names
+    routes = next(r for r in profiler.records if r.name == "parse.read_routes")
+    assert routes.rows == len(read_routes(gtfs))
+    unify = next(r for r in profiler.records if r.name == "aggregate.unify_similar_stops")
+    assert unify.path.startswith("aggregate.init/")
+    assert all(r.peak_bytes is None for r in profiler.records)
+
+
+def test_cli_profile(tmp_path, monkeypatch):
+    profile_path = tmp_path / "profile.json"
+    monkeypatch.setattr(
+        sys, "argv", ["gtfs-parser", "parse", FIXTURE_DIR, str(tmp_path / "output"), "--profile", str(profile_path)]
+    )
+    main()
+    with open(profile_path, encoding="utf-8") as f:
+        records = json.load(f)
+    names = [r["name"] for r in records]
+    assert "main.load_gtfs" in names
+    assert "main.write.routes" in names
+    assert all(r["peak_bytes"] is not None for r in records)
@@ -0,0 +1,39 @@
+import os
+
+from gtfs_parser.gtfs import GTFSFactory
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
+
+def test_service_calendar():
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    service_calendar = gtfs.service_calendar
+    # built once per feed
+    assert gtfs.service_calendar is service_calendar
+
+    # 20210721 is wednesday, 20210724 is saturday
+    on_weekday = service_calendar.get_service_ids_on("20210721")
+    assert "平日" in on_weekday and "土曜" not in on_weekday
+    on_saturday = service_calendar.get_service_ids_on("20210724")
+    assert "土曜" in on_saturday and "平日" not in on_saturday
+    # exceptions by calendar_dates
+    on_holiday = service_calendar.get_service_ids_on("20210722")
+    assert "日祝" in on_holiday and "平日" not in on_holiday
+    # out of validity period
+    assert list(service_calendar.get_service_ids_on("20200101")) == []
+
+    assert service_calendar.is_active(
+        ["平日", "土曜", "unknown"], ["20210721", "20210724"]
+    ).tolist() == [True, True, False]
+
+    saturdays = service_calendar.get_service_days("土曜")
+    assert saturdays[0] == "20210724"
+    assert len(saturdays) == service_calendar.count_service_days()["土曜"]
+
+
+def test_service_calendar_encode_ids():
+    gtfs = GTFSFactory(FIXTURE_DIR, encode_ids=True)
+    service_ids = gtfs.decode_ids(
+        "service_id", gtfs.service_calendar.get_service_ids_on("20210722")
+    )
+    assert "日祝" in list(service_ids) and "平日" not in list(service_ids)
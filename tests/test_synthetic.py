@@ -0,0 +1,33 @@
+import os
+
+from gtfs_parser.aggregate import Aggregator
+from gtfs_parser.gtfs import GTFSFactory
+from gtfs_parser.parse import read_routes, read_stops
+from gtfs_parser.synthetic import generate_feed
+
+
+def test_generate_feed(tmp_path):
+    counts = generate_feed(str(tmp_path / "feed"), num_routes=5, trips_per_route=8, seed=1)
+    assert counts["stop_times"] == 5 * 8 * 20
+    # same arguments make same files
+    generate_feed(str(tmp_path / "same"), num_routes=5, trips_per_route=8, seed=1)
+    for name in os.listdir(tmp_path / "feed"):
+        with open(tmp_path / "feed" / name, "rb") as f, open(tmp_path / "same" / name, "rb") as g:
+            assert f.read() == g.read()
+
+    gtfs = GTFSFactory(str(tmp_path / "feed"))
+    assert len(gtfs.stop_times) == counts["stop_times"]
+    assert len(gtfs.trips) == counts["trips"]
+    assert len(read_stops(gtfs)) == counts["stops"]
+    assert len(read_routes(gtfs)) == 5
+    assert len(read_routes(gtfs, ignore_shapes=True)) == 5
+
+    # pairs of stops share names, then they are unified
+    aggregator = Aggregator(gtfs)
+    assert len(aggregator.read_interpolated_stops()) < counts["stops"]
+    assert len(aggregator.read_route_frequency()) > 0
+
+    # zip is same as directory
+    generate_feed(str(tmp_path / "feed.zip"), num_routes=5, trips_per_route=8, seed=1)
+    zipped = GTFSFactory(str(tmp_path / "feed.zip"))
+    assert zipped.stop_times.equals(gtfs.stop_times)
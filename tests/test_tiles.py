@@ -0,0 +1,103 @@
+import json
+import os
+
+import numpy as np
+
+from gtfs_parser.geojson import FeatureTable
+from gtfs_parser.gtfs import GTFSFactory
+from gtfs_parser.parse import read_routes_table, read_stops_table
+from gtfs_parser.tiles import lonlat_to_tile, partition_features, tile_to_lonlat, write_tiles
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixture")
+
+
+def __length(table, zoom):
+    """length of lines in tile coordinates"""
+    points, offsets, _ = table.to_ragged()
+    x, y = lonlat_to_tile(points[:, 0], points[:, 1], zoom)
+    line_of_points = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    starts = np.flatnonzero(line_of_points[:-1] == line_of_points[1:])
+    return np.hypot(x[starts + 1] - x[starts], y[starts + 1] - y[starts]).sum()
+
+
+def __count_points(directory):
+    """number of points of lines in tiles under directory"""
+    count = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            with open(os.path.join(root, name), encoding="utf-8") as f:
+                for feature in json.load(f)["features"]:
+                    count += sum(map(len, feature["geometry"]["coordinates"]))
+    return count
+
+
+def test_tile_coordinates():
+    x, y = lonlat_to_tile(np.array([0.0, 139.7]), np.array([0.0, 35.7]), 10)
+    assert x[0] == 512 and y[0] == 512
+    assert (int(x[1]), int(y[1])) == (909, 403)
+    lon, lat = tile_to_lonlat(x, y, 10)
+    np.testing.assert_allclose(lon, [0.0, 139.7])
+    np.testing.assert_allclose(lat, [0.0, 35.7])
+
+
+def test_partition_lines():
+    table = FeatureTable(
+        "MultiLineString",
+        [[[[139.5, 35.5], [140.5, 35.5], [140.5, 36.5]], [[139.2, 35.2], [139.3, 35.3]]]],
+        {"route_id": ["r"]},
+    )
+    tiles = partition_features(table, 8)
+    assert sorted(tiles) == [(226, 101), (227, 100), (227, 101)]
+    # lines in a tile are not clipped
+    feature = next(iter(tiles[(227, 100)]))
+    assert feature["geometry"]["coordinates"] == [[[139.5, 35.5], [140.5, 35.5], [140.5, 36.5]]]
+    assert feature["properties"] == {"route_id": "r"}
+    # lines across tiles are clipped by the boundary of tiles
+    left = next(iter(tiles[(226, 101)]))["geometry"]["coordinates"]
+    right = next(iter(tiles[(227, 101)]))["geometry"]["coordinates"]
+    assert left[0][0] == [139.2, 35.2] and right[0][-1] == [139.3, 35.3]
+    assert left[0][-1] == right[0][0]
+    assert left[0][-1][0] == 139.21875
+
+
+def test_partition_features():
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    routes = read_routes_table(gtfs)
+    for zoom in (8, 12, 15):
+        tiles = partition_features(routes, zoom)
+        # clipped lines are inside of their tiles, and cover whole lines
+        for (x, y), table in tiles.items():
+            points, _, _ = table.to_ragged()
+            tx, ty = lonlat_to_tile(points[:, 0], points[:, 1], zoom)
+            assert np.all((tx >= x - 1e-9) & (tx <= x + 1 + 1e-9))
+            assert np.all((ty >= y - 1e-9) & (ty <= y + 1 + 1e-9))
+        clipped_length = sum(__length(table, zoom) for table in tiles.values())
+        assert np.isclose(clipped_length, __length(routes, zoom))
+
+    stops = read_stops_table(gtfs)
+    tiles = partition_features(stops, 12)
+    assert sum(map(len, tiles.values())) == len(stops)
+
+
+def test_write_tiles(tmp_path):
+    gtfs = GTFSFactory(FIXTURE_DIR)
+    routes = read_routes_table(gtfs)
+    dst = str(tmp_path / "tiles")
+    count = write_tiles({"routes": routes}, dst, 10, 12, max_workers=2)
+    paths = [
+        os.path.join(root, name) for root, _, names in os.walk(dst) for name in names
+    ]
+    assert count == len(paths)
+    assert sorted(os.listdir(os.path.join(dst, "routes"))) == ["10", "11", "12"]
+    with open(paths[0], encoding="utf-8") as f:
+        assert json.load(f)["type"] == "FeatureCollection"
+
+    # tiles of coarse zooms are simplified, tiles of max zoom are not
+    full_dst = str(tmp_path / "full_tiles")
+    write_tiles({"routes": routes}, full_dst, 10, 12, simplify=False)
+    assert __count_points(os.path.join(dst, "routes", "10")) < __count_points(
+        os.path.join(full_dst, "routes", "10")
+    )
+    assert __count_points(os.path.join(dst, "routes", "12")) == __count_points(
+        os.path.join(full_dst, "routes", "12")
+    )